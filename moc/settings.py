@@ -110,7 +110,10 @@ ADDON_DATABASES = [
         'USER': '',  # edit
         'PASSWORD': '',  # edit
         'INDICES_PREFIX': 'mocbackend',
-        'DOC_TYPE_NAME': 'default'
+        'DOC_TYPE_NAME': 'default',
+        'TIMEOUT': 30,
+        'MAX_CONNECTIONS': 25,
+        'MAX_RETRIES': 3,
     },
     {
         'BACKEND': 'mocbackend.databases.Neo4jDB',
@@ -118,9 +121,17 @@ ADDON_DATABASES = [
         'PORT': '7687',
         'USER': '',  # edit
         'PASSWORD': '',  # edit
+        'GRAPH_MODEL': 'node',  # 'node' or 'native'
     }
 ]
 
+GRAPH_ENGINE = {
+    'ENABLED': False,
+    'SYNC_INTERVAL': 60,
+    'REBUILD_INTERVAL': 3600,
+    'SNAPSHOT_DIR': None,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -316,5 +327,14 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': '',  # edit
         'KEY_PREFIX': 'mocbackend'
+    },
+    'graph_totals': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '',  # edit, must differ from cron_update_dbs LOCATION
+        'KEY_PREFIX': 'mocbackend',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000
+        }
     }
 }
@@ -0,0 +1,461 @@
+import hashlib
+import json
+import logging
+import threading
+
+from django.core.cache import InvalidCacheBackendError, caches
+from neo4j.exceptions import ClientError, TransientError
+
+from mocbackend import const, graph
+from mocbackend.databases import Neo4jDB
+
+logger = logging.getLogger(__name__)
+
+const.GRAPH_TOTAL_THRESHOLD = 1000
+const.GRAPH_TOTALS_CACHE_NAME = 'graph_totals'
+const.GRAPH_TOTALS_CACHE_TIMEOUT = 60
+const.GRAPH_PATHS_MAX_DEPTH = 6
+const.GRAPH_PATHS_MAX_DEPTH_K_PATHS = 4
+const.GRAPH_PATHS_MAX_PATHS = 10
+const.GRAPH_PATHS_TIMEOUT = 10
+const.GRAPH_EGO_MAX_DEPTH = 3
+const.GRAPH_EGO_FAN_OUT = 25
+const.GRAPH_EGO_MAX_FAN_OUT = 100
+const.GRAPH_EGO_MAX_NODES = 200
+const.GRAPH_EGO_MAX_NODES_LIMIT = 1000
+const.GRAPH_EGO_MAX_EDGES = 500
+const.GRAPH_EGO_MAX_EDGES_LIMIT = 3000
+const.GRAPH_EGO_PRIORITIES = ['category', 'pep', 'recency']
+const.GRAPH_NODE_FIELDS = ['public_id', 'name', 'entity_type_string_id', 'is_pep']
+const.GRAPH_EDGE_FIELDS = ['id', 'entity_a_public_id', 'entity_b_public_id', 'connection_type_string_id',
+                           'connection_type_name', 'connection_type_category_string_id', 'valid_from', 'valid_to',
+                           'transaction_amount', 'transaction_currency_code']
+
+_statements = {}
+_statements_lock = threading.Lock()
+
+
+def run(session, statement, **parameters):
+    key = hashlib.sha1(statement.encode('utf-8')).hexdigest()[:12]
+    with _statements_lock:
+        count = _statements.get(key, 0) + 1
+        _statements[key] = count
+        distinct = len(_statements)
+    if count == 1:
+        logger.info('New Cypher statement ' + key + ' (' + str(distinct) + ' distinct in process): ' + statement)
+    return session.run(statement, **parameters)
+
+
+def get_totals_cache():
+    try:
+        return caches[const.GRAPH_TOTALS_CACHE_NAME]
+    except InvalidCacheBackendError:
+        return None
+
+
+class ConnectionFilters:
+    ORDER_BY = ['valid_from', 'valid_to', 'transaction_amount']
+
+    def __init__(self, data):
+        self.entity_public_id = None
+        self.connection_type_categories = None
+        self.connection_types = None
+        self.transaction_date_from = None
+        self.transaction_date_to = None
+        self.transaction_amount_from = None
+        self.transaction_amount_to = None
+        self.entity_types = None
+        self.legal_entity_types = None
+        self.is_pep = None
+        self.valid_from = None
+        self.valid_to = None
+        self.order_by = None
+        self.order_direction = 'ASC'
+
+        for key, value in data.items():
+            if key == 'entity':
+                self.entity_public_id = value
+            elif key == 'connection_type_category':
+                self.connection_type_categories = data.getlist('connection_type_category')
+            elif key == 'connection_type':
+                self.connection_types = data.getlist('connection_type')
+            elif key == 'transaction_date_from':
+                self.transaction_date_from = value
+            elif key == 'transaction_date_to':
+                self.transaction_date_to = value
+            elif key == 'transaction_amount_from':
+                self.transaction_amount_from = float(value)
+            elif key == 'transaction_amount_to':
+                self.transaction_amount_to = float(value)
+            elif key == 'entity_type':
+                self.entity_types = data.getlist('entity_type')
+            elif key == 'legal_entity_type':
+                self.legal_entity_types = data.getlist('legal_entity_type')
+            elif key == 'is_pep' and (value == 'true' or value == 'false'):
+                self.is_pep = value == 'true'
+            elif key == 'valid_from':
+                self.valid_from = value
+            elif key == 'valid_to':
+                self.valid_to = value
+            elif key == 'order_by':
+                if value in ConnectionFilters.ORDER_BY:
+                    self.order_by = value
+            elif key == 'order_direction':
+                if value == 'asc' or value == 'desc':
+                    self.order_direction = value.upper()
+
+    def get_parameters(self):
+        return {
+            'entity_public_id': self.entity_public_id,
+            'connection_type_categories': self.connection_type_categories,
+            'connection_types': self.connection_types,
+            'transaction_date_from': self.transaction_date_from,
+            'transaction_date_to': self.transaction_date_to,
+            'transaction_amount_from': self.transaction_amount_from,
+            'transaction_amount_to': self.transaction_amount_to,
+            'entity_types': self.entity_types,
+            'legal_entity_types': self.legal_entity_types,
+            'is_pep': self.is_pep,
+            'valid_from': self.valid_from,
+            'valid_to': self.valid_to,
+        }
+
+    @staticmethod
+    def get_connection_condition(r='r'):
+        return '($transaction_date_from IS NULL OR ' + r + '.transaction_date >= $transaction_date_from)' + \
+               ' AND ($transaction_date_to IS NULL OR ' + r + '.transaction_date <= $transaction_date_to)' + \
+               ' AND ($transaction_amount_from IS NULL OR ' + r + '.transaction_amount >= $transaction_amount_from)' + \
+               ' AND ($transaction_amount_to IS NULL OR ' + r + '.transaction_amount <= $transaction_amount_to)' + \
+               ' AND ($valid_from IS NULL OR ' + r + '.valid_from >= $valid_from)' + \
+               ' AND ($valid_to IS NULL OR ' + r + '.valid_to <= $valid_to)' + \
+               ' AND (($connection_type_categories IS NULL AND $connection_types IS NULL)' + \
+               ' OR ' + r + '.connection_type_category_string_id IN $connection_type_categories' + \
+               ' OR ' + r + '.connection_type_string_id IN $connection_types)'
+
+    @staticmethod
+    def get_end_condition(other, entity, r='r'):
+        return '(($entity_public_id IS NULL OR ' + entity + ' = $entity_public_id)' + \
+               ' AND ($entity_types IS NULL OR ' + r + '.entity_' + other + '_entity_type_string_id IN $entity_types)' + \
+               ' AND ($legal_entity_types IS NULL OR ANY(legal_entity_type IN ' + r + '.entity_' + other + \
+               '_legal_entity_type_id WHERE legal_entity_type IN $legal_entity_types))' + \
+               ' AND ($is_pep IS NULL OR ' + r + '.entity_' + other + '_is_pep = $is_pep))'
+
+    def get_entity_anchor(self, entity_a='entity_a', entity_b='entity_b'):
+        if self.entity_public_id is None:
+            return ''
+        return ' AND (' + entity_a + '.public_id = $entity_public_id OR ' + entity_b + \
+               '.public_id = $entity_public_id)'
+
+    def get_order(self, r='r'):
+        if self.order_by is None:
+            return ''
+        return ' ORDER BY ' + r + '.' + self.order_by + ' ' + self.order_direction
+
+
+def _get_neighbours_match(filters):
+    match = 'MATCH ' + Neo4jDB.get_neo4j_connection_pattern(directed=False) + ' WHERE ID(entity_a) < ID(entity_b)'
+    match += filters.get_entity_anchor()
+    match += ' AND (' + ConnectionFilters.get_end_condition(other='b', entity='r.entity_a_public_id') + \
+             ' OR ' + ConnectionFilters.get_end_condition(other='a', entity='r.entity_b_public_id') + ')'
+    match += ' AND ' + ConnectionFilters.get_connection_condition()
+    match += ' WITH DISTINCT entity_a, entity_b'
+    return match
+
+
+def _get_neighbours_final(count, carry=''):
+    query = ' WITH ' + carry + 'COLLECT(DISTINCT entity_a) + COLLECT(DISTINCT entity_b) as union'
+    query += ' UNWIND union as nodes'
+    query += ' WITH ' + carry + 'COLLECT(DISTINCT nodes) as distinct_union'
+    query += ' MATCH ' + Neo4jDB.get_neo4j_connection_pattern(entity_a='entity_a_final', r='r_final',
+                                                              entity_b='entity_b_final', directed=False)
+    query += ' WHERE ID(entity_a_final) < ID(entity_b_final) AND (entity_a_final IN distinct_union AND entity_b_final IN distinct_union)'
+    query += ' RETURN DISTINCT entity_a_final, entity_b_final, COLLECT(DISTINCT r_final.connection_type_category_string_id)'
+    if count:
+        query += ', COUNT(DISTINCT r_final)'
+    return query
+
+
+def get_neighbours_statements(filters, count=False):
+    match = _get_neighbours_match(filters)
+
+    query = match + ' SKIP $offset LIMIT $limit' + _get_neighbours_final(count=count)
+
+    query_total = match + ' WITH COLLECT(DISTINCT entity_a) + COLLECT(DISTINCT entity_b) as distinct_union'
+    query_total += ' UNWIND distinct_union as nodes'
+    query_total += ' RETURN COUNT(DISTINCT nodes) as total'
+
+    query_total_bounded = match + ' UNWIND [entity_a, entity_b] as nodes'
+    query_total_bounded += ' WITH DISTINCT nodes LIMIT $total_limit'
+    query_total_bounded += ' RETURN COUNT(nodes) as total'
+
+    query_with_total = match + ' WITH COLLECT([entity_a, entity_b]) as pairs'
+    query_with_total += ' UNWIND pairs as pair UNWIND pair as nodes'
+    query_with_total += ' WITH pairs, COUNT(DISTINCT nodes) as total'
+    query_with_total += ' UNWIND pairs[$offset..($offset + $limit)] as pair'
+    query_with_total += ' WITH total, pair[0] as entity_a, pair[1] as entity_b'
+    query_with_total += _get_neighbours_final(count=count, carry='total, ') + ', total'
+
+    return {
+        'query': query,
+        'query_total': query_total,
+        'query_total_bounded': query_total_bounded,
+        'query_with_total': query_with_total,
+    }
+
+
+def run_neighbours(session, filters, offset, limit, count=False, total='exact'):
+    statements = get_neighbours_statements(filters=filters, count=count)
+    parameters = filters.get_parameters()
+    ret = {
+        'total': None,
+        'total_relation': 'eq',
+        'results': [],
+    }
+
+    cache = None
+    cache_key = None
+    if total == 'cached':
+        cache = get_totals_cache()
+        if cache is not None:
+            cache_key = 'neighbours:' + hashlib.sha1(
+                (statements['query_total'] + json.dumps(parameters, sort_keys=True)).encode('utf-8')).hexdigest()
+            ret['total'] = cache.get(cache_key)
+            if ret['total'] is not None:
+                ret['results'] = list(run(session, statements['query'], offset=offset, limit=limit, **parameters))
+                return ret
+        total = 'exact'
+
+    if total == 'exact':
+        records = list(run(session, statements['query_with_total'], offset=offset, limit=limit, **parameters))
+        if records:
+            ret['total'] = records[0].value('total')
+            ret['results'] = [record.values()[:-1] for record in records]
+        else:
+            ret['total'] = run(session, statements['query_total'], **parameters).single().value()
+        if cache is not None:
+            cache.set(cache_key, ret['total'], const.GRAPH_TOTALS_CACHE_TIMEOUT)
+        return ret
+
+    ret['results'] = list(run(session, statements['query'], offset=offset, limit=limit, **parameters))
+    if total == 'bounded':
+        ret['total'] = run(session, statements['query_total_bounded'], total_limit=const.GRAPH_TOTAL_THRESHOLD + 1,
+                           **parameters).single().value()
+        if ret['total'] > const.GRAPH_TOTAL_THRESHOLD:
+            ret['total'] = const.GRAPH_TOTAL_THRESHOLD
+            ret['total_relation'] = 'gte'
+    return ret
+
+
+def get_nodes(session, public_ids):
+    return {record[0]: record[1] for record in run(
+        session, 'MATCH (n:node) WHERE n.public_id IN $public_ids RETURN n.public_id, n', public_ids=public_ids)}
+
+
+def run_graph_neighbours(session, compact_graph, filters, offset, limit, count=False):
+    neighbours = graph.get_neighbours(compact_graph, filters=filters, offset=offset, limit=limit, count=count)
+    ret = {
+        'total': neighbours['total'],
+        'total_relation': 'eq',
+        'results': [],
+    }
+    if neighbours['pairs']:
+        nodes = get_nodes(session, public_ids=list(
+            set(pair[0] for pair in neighbours['pairs']) | set(pair[1] for pair in neighbours['pairs'])))
+        for pair in neighbours['pairs']:
+            if pair[0] in nodes and pair[1] in nodes:
+                ret['results'].append([nodes[pair[0]], nodes[pair[1]]] + pair[2:])
+    return ret
+
+
+def get_connections_statements(filters):
+    match = 'MATCH ' + Neo4jDB.get_neo4j_connection_pattern() + ' WHERE true'
+    match += filters.get_entity_anchor()
+    match += ' AND (' + ConnectionFilters.get_end_condition(other='b', entity='entity_a.public_id') + \
+             ' OR ' + ConnectionFilters.get_end_condition(other='a', entity='entity_b.public_id') + ')'
+    match += ' AND ' + ConnectionFilters.get_connection_condition()
+
+    query = match + ' RETURN DISTINCT entity_a, entity_b, r' + filters.get_order() + ' SKIP $offset LIMIT $limit'
+    query_total_min_max = match + ' RETURN COUNT(DISTINCT r) AS TOTAL, MIN(r.valid_from), MIN(r.valid_to), MAX(r.valid_from), MAX(r.valid_to)'
+
+    return query, query_total_min_max
+
+
+def get_connections_by_ends_statements(filters):
+    match = 'MATCH ' + Neo4jDB.get_neo4j_connection_pattern()
+    match += ' WHERE ((entity_a.public_id = $pk1 AND entity_b.public_id = $pk2) OR (entity_a.public_id = $pk2 AND entity_b.public_id = $pk1))'
+    match += ' AND ' + ConnectionFilters.get_connection_condition()
+
+    query = match + ' RETURN DISTINCT entity_a, entity_b, r' + filters.get_order() + ' SKIP $offset LIMIT $limit'
+    query_total = match + ' RETURN COUNT(DISTINCT r) AS TOTAL'
+
+    return query, query_total
+
+
+def get_paths_statement(filters, max_depth, paths=1):
+    native = Neo4jDB.is_neo4j_native_graph_model()
+    hops = max_depth if native else max_depth * 2
+    relationship = ':connection' if native else ':relationship'
+
+    query = 'MATCH (entity_a:node { public_id: $pk1 }), (entity_b:node { public_id: $pk2 })'
+    if paths == 1:
+        query += ' MATCH p = shortestPath((entity_a)-[' + relationship + '*..' + str(hops) + ']-(entity_b))'
+    else:
+        query += ' MATCH p = (entity_a)-[' + relationship + '*..' + str(hops) + ']-(entity_b)'
+
+    if native:
+        query += ' WHERE ALL(x IN nodes(p) WHERE x.published = true AND x.deleted = false)'
+        query += ' AND ALL(x IN relationships(p) WHERE x.published = true AND x.deleted = false AND ' + \
+                 ConnectionFilters.get_connection_condition(r='x') + ')'
+    else:
+        query += ' WHERE ALL(x IN nodes(p) WHERE x.published = true AND x.deleted = false AND (x:node OR (' + \
+                 ConnectionFilters.get_connection_condition(r='x') + ')))'
+    if paths != 1:
+        query += ' AND ALL(i IN range(0, size(nodes(p)) - 2) WHERE NOT nodes(p)[i] IN nodes(p)[i + 1..])'
+
+    node_projection = ' | x { .public_id, .name, .entity_type_string_id, .is_pep }]'
+    edge_projection = ' | x { .id, .entity_a_public_id, .entity_b_public_id, .connection_type_string_id, .connection_type_name, .connection_type_category_string_id, .valid_from, .valid_to, .transaction_amount, .transaction_currency_code }]'
+    if native:
+        query += ' RETURN [x IN nodes(p)' + node_projection + ', [x IN relationships(p)' + edge_projection
+    else:
+        query += ' RETURN [x IN nodes(p) WHERE x:node' + node_projection + \
+                 ', [x IN nodes(p) WHERE x:relationship' + edge_projection
+    if paths != 1:
+        query += ' ORDER BY length(p) LIMIT $paths'
+    return query
+
+
+def run_paths(session, filters, pk1, pk2, max_depth, paths=1):
+    ret = {
+        'timed_out': False,
+        'paths': [],
+        'nodes': [],
+        'edges': [],
+    }
+    nodes = {}
+    edges = {}
+    try:
+        with session.begin_transaction(timeout=const.GRAPH_PATHS_TIMEOUT) as tx:
+            records = list(run(tx, get_paths_statement(filters=filters, max_depth=max_depth, paths=paths), pk1=pk1,
+                               pk2=pk2, paths=paths, **filters.get_parameters()))
+    except (ClientError, TransientError) as e:
+        if 'TimedOut' not in (e.code or '') and 'Terminated' not in (e.code or ''):
+            raise
+        ret['timed_out'] = True
+        return ret
+
+    for record in records:
+        path_nodes, path_edges = record.values()
+        for node in path_nodes:
+            nodes.setdefault(node['public_id'], node)
+        for edge in path_edges:
+            edges.setdefault(edge['id'], edge)
+        ret['paths'].append({
+            'length': len(path_edges),
+            'nodes': [node['public_id'] for node in path_nodes],
+            'edges': [edge['id'] for edge in path_edges],
+        })
+    ret['nodes'] = list(nodes.values())
+    ret['edges'] = list(edges.values())
+    return ret
+
+
+def _get_ego_priority(i, r='r', other='entity_b'):
+    return '(CASE $priority[' + str(i) + ']' + \
+           " WHEN 'category' THEN coalesce(head([i IN range(0, size($category_order) - 1) WHERE $category_order[i] = " + \
+           r + '.connection_type_category_string_id]), size($category_order))' + \
+           " WHEN 'pep' THEN CASE WHEN " + other + '.is_pep = true THEN 0 ELSE 1 END' + \
+           " WHEN 'recency' THEN -coalesce(toInteger(replace(" + r + ".valid_from, '-', '')), 0)" + \
+           ' ELSE 0 END)'
+
+
+def _get_ego_match():
+    return 'MATCH ' + Neo4jDB.get_neo4j_connection_pattern(directed=False) + \
+           ' WHERE entity_b.published = true AND entity_b.deleted = false' + \
+           ' AND r.published = true AND r.deleted = false AND ' + ConnectionFilters.get_connection_condition()
+
+
+def _get_ego_order():
+    return ' ORDER BY ' + ', '.join(_get_ego_priority(i) for i in range(len(const.GRAPH_EGO_PRIORITIES)))
+
+
+def get_ego_statements():
+    expand = 'UNWIND $frontier AS pid ' + _get_ego_match()
+    expand += ' AND entity_a.public_id = pid AND NOT entity_b.public_id IN $visited'
+    expand += ' WITH pid, entity_b, r' + _get_ego_order() + ', r.id'
+    expand += ' WITH pid, COLLECT([entity_b, r]) AS candidates, COUNT(DISTINCT entity_b) AS total'
+    expand += ' RETURN pid, total, REDUCE(selected = [], c IN candidates | CASE WHEN size(selected) >= $fan_out' \
+              ' OR ANY(x IN selected WHERE x[0] = c[0]) THEN selected ELSE selected + [c] END)'
+
+    extra_edges = _get_ego_match()
+    extra_edges += ' AND entity_a.public_id IN $nodes AND entity_b.public_id IN $nodes' \
+                   ' AND entity_a.public_id < entity_b.public_id AND NOT r.id IN $edges'
+    extra_edges += ' WITH entity_b, r' + _get_ego_order() + ', r.id LIMIT $limit'
+    extra_edges += ' RETURN r'
+
+    return {
+        'root': 'MATCH (n:node { public_id: $pk }) WHERE n.published = true AND n.deleted = false RETURN n',
+        'expand': expand,
+        'extra_edges': extra_edges,
+    }
+
+
+def get_node_payload(node):
+    return {key: node.get(key) for key in const.GRAPH_NODE_FIELDS}
+
+
+def get_edge_payload(edge):
+    return {key: edge.get(key) for key in const.GRAPH_EDGE_FIELDS}
+
+
+def run_ego_network(session, filters, pk, depth, fan_out, max_nodes, max_edges, priority, category_order):
+    statements = get_ego_statements()
+    parameters = filters.get_parameters()
+    parameters['priority'] = priority
+    parameters['category_order'] = category_order
+    parameters['fan_out'] = fan_out
+    ret = {
+        'timed_out': False,
+        'truncated': False,
+        'nodes': [],
+        'edges': [],
+    }
+    try:
+        with session.begin_transaction(timeout=const.GRAPH_PATHS_TIMEOUT) as tx:
+            root = run(tx, statements['root'], pk=pk).single()
+            if root is None:
+                return None
+
+            def expand(frontier, visited):
+                for record in run(tx, statements['expand'], frontier=frontier, visited=visited, **parameters):
+                    pid, total, selected = record.values()
+                    yield pid, total, [
+                        (node['public_id'], get_node_payload(node), edge['id'], get_edge_payload(edge)) for
+                        node, edge in selected]
+
+            def get_extra_edges(nodes, edges, limit):
+                return [(record[0]['id'], get_edge_payload(record[0])) for record in
+                        run(tx, statements['extra_edges'], nodes=nodes, edges=edges, limit=limit, **parameters)]
+
+            ret.update(graph.get_ego_network(root=pk, root_payload=get_node_payload(root[0]), depth=depth,
+                                             max_nodes=max_nodes, max_edges=max_edges, expand=expand,
+                                             get_extra_edges=get_extra_edges))
+    except (ClientError, TransientError) as e:
+        if 'TimedOut' not in (e.code or '') and 'Terminated' not in (e.code or ''):
+            raise
+        ret['timed_out'] = True
+    return ret
+
+
+def run_graph_ego_network(session, compact_graph, filters, pk, depth, fan_out, max_nodes, max_edges, priority,
+                          category_order):
+    ego_network = graph.get_graph_ego_network(compact_graph, public_id=pk, filters=filters, depth=depth,
+                                              fan_out=fan_out, max_nodes=max_nodes, max_edges=max_edges,
+                                              priority=priority, category_order=category_order)
+    if ego_network is None:
+        return None
+    nodes = get_nodes(session, public_ids=[node['public_id'] for node in ego_network['nodes']])
+    for node in ego_network['nodes']:
+        if node['public_id'] in nodes:
+            node.update(get_node_payload(nodes[node['public_id']]))
+    ego_network['timed_out'] = False
+    return ego_network
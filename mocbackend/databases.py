@@ -1,10 +1,18 @@
 import logging
+import os
+import re
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from itertools import chain
 
 from django.conf import settings
+from django.db import connection
 from django.db.models import Q
-from elasticsearch import Elasticsearch, NotFoundError
+from django.utils import timezone
+from elasticsearch import Elasticsearch, NotFoundError, helpers as elasticsearch_helpers
 from neo4j import GraphDatabase
+from rq import get_current_job
 
 from mocbackend import helpers, models, const, middleware
 import django_rq
@@ -64,234 +72,114 @@ class BaseDatabase:
     def _is_pep(entity):
         is_pep = None
         if entity.entity_type.string_id == 'person':
-            is_pep = False
-            if entity.force_pep:
-                is_pep = True
-
-            entity_type_legal_entity = models.StaticEntityType.objects.get(string_id='legal_entity')
-
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                connection_type__potentially_pep=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__linked_potentially_pep=True,
-                                                                entity_b__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        connection_type__potentially_pep=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__linked_potentially_pep=True,
-                                                        entity_a__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__force_pep=True).distinct().exists():
-                is_pep = True
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__force_pep=True).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__reverse_connections__deleted=False,
-                                                                entity_b__reverse_connections__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__source__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__source__published=True,
-                                                                entity_b__reverse_connections__connection_type__potentially_pep=True,
-                                                                entity_b__reverse_connections__entity_b__deleted=False,
-                                                                entity_b__reverse_connections__entity_b__published=True,
-                                                                entity_b__reverse_connections__entity_b__linked_potentially_pep=True,
-                                                                entity_b__reverse_connections__entity_b__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__connections__deleted=False,
-                                                                entity_b__connections__published=True,
-                                                                entity_b__connections__entity_entity_collections__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__published=True,
-                                                                entity_b__connections__entity_entity_collections__collection__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__collection__published=True,
-                                                                entity_b__connections__entity_entity_collections__collection__source__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__collection__source__published=True,
-                                                                entity_b__connections__connection_type__potentially_pep=True,
-                                                                entity_b__connections__entity_a__deleted=False,
-                                                                entity_b__connections__entity_a__published=True,
-                                                                entity_b__connections__entity_a__linked_potentially_pep=True,
-                                                                entity_b__connections__entity_a__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__reverse_connections__deleted=False,
-                                                        entity_a__reverse_connections__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__source__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__source__published=True,
-                                                        entity_a__reverse_connections__connection_type__potentially_pep=True,
-                                                        entity_a__reverse_connections__entity_b__deleted=False,
-                                                        entity_a__reverse_connections__entity_b__published=True,
-                                                        entity_a__reverse_connections__entity_b__linked_potentially_pep=True,
-                                                        entity_a__reverse_connections__entity_b__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__connections__deleted=False,
-                                                        entity_a__connections__published=True,
-                                                        entity_a__connections__entity_entity_collections__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__published=True,
-                                                        entity_a__connections__entity_entity_collections__collection__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__collection__published=True,
-                                                        entity_a__connections__entity_entity_collections__collection__source__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__collection__source__published=True,
-                                                        entity_a__connections__connection_type__potentially_pep=True,
-                                                        entity_a__connections__entity_a__deleted=False,
-                                                        entity_a__connections__entity_a__published=True,
-                                                        entity_a__connections__entity_a__linked_potentially_pep=True,
-                                                        entity_a__connections__entity_a__entity_type=entity_type_legal_entity).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__reverse_connections__deleted=False,
-                                                                entity_b__reverse_connections__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__published=True,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__source__deleted=False,
-                                                                entity_b__reverse_connections__entity_entity_collections__collection__source__published=True,
-                                                                entity_b__reverse_connections__entity_b__deleted=False,
-                                                                entity_b__reverse_connections__entity_b__published=True,
-                                                                entity_b__reverse_connections__entity_b__force_pep=True).distinct().exists():
-                is_pep = True
-            if not is_pep and entity.reverse_connections.filter(deleted=False, published=True,
-                                                                entity_entity_collections__deleted=False,
-                                                                entity_entity_collections__published=True,
-                                                                entity_entity_collections__collection__deleted=False,
-                                                                entity_entity_collections__collection__published=True,
-                                                                entity_entity_collections__collection__source__deleted=False,
-                                                                entity_entity_collections__collection__source__published=True,
-                                                                entity_b__deleted=False, entity_b__published=True,
-                                                                entity_b__connections__deleted=False,
-                                                                entity_b__connections__published=True,
-                                                                entity_b__connections__entity_entity_collections__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__published=True,
-                                                                entity_b__connections__entity_entity_collections__collection__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__collection__published=True,
-                                                                entity_b__connections__entity_entity_collections__collection__source__deleted=False,
-                                                                entity_b__connections__entity_entity_collections__collection__source__published=True,
-                                                                entity_b__connections__entity_a__deleted=False,
-                                                                entity_b__connections__entity_a__published=True,
-                                                                entity_b__connections__entity_a__force_pep=True).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__reverse_connections__deleted=False,
-                                                        entity_a__reverse_connections__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__published=True,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__source__deleted=False,
-                                                        entity_a__reverse_connections__entity_entity_collections__collection__source__published=True,
-                                                        entity_a__reverse_connections__entity_b__deleted=False,
-                                                        entity_a__reverse_connections__entity_b__published=True,
-                                                        entity_a__reverse_connections__entity_b__force_pep=True).distinct().exists():
-                is_pep = True
-
-            if not is_pep and entity.connections.filter(deleted=False, published=True,
-                                                        entity_entity_collections__deleted=False,
-                                                        entity_entity_collections__published=True,
-                                                        entity_entity_collections__collection__deleted=False,
-                                                        entity_entity_collections__collection__published=True,
-                                                        entity_entity_collections__collection__source__deleted=False,
-                                                        entity_entity_collections__collection__source__published=True,
-                                                        entity_a__deleted=False, entity_a__published=True,
-                                                        entity_a__connections__deleted=False,
-                                                        entity_a__connections__published=True,
-                                                        entity_a__connections__entity_entity_collections__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__published=True,
-                                                        entity_a__connections__entity_entity_collections__collection__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__collection__published=True,
-                                                        entity_a__connections__entity_entity_collections__collection__source__deleted=False,
-                                                        entity_a__connections__entity_entity_collections__collection__source__published=True,
-                                                        entity_a__connections__entity_a__deleted=False,
-                                                        entity_a__connections__entity_a__published=True,
-                                                        entity_a__connections__entity_a__force_pep=True).distinct().exists():
-                is_pep = True
-
+            is_pep = entity.is_pep
         return is_pep
 
 
+class AttributeValuesPrefetch:
+    _attributes_cache = {}
+
+    def __init__(self, entity_ids=None, entity_entity_ids=None, attribute_ids=None, attributes=None):
+        if attributes is None:
+            attributes = AttributeValuesPrefetch.get_attributes()
+        self._attributes, self._inner_attributes = attributes
+
+        q = Q(pk__in=[])
+        if entity_ids:
+            q = q | Q(entity_id__in=entity_ids)
+        if entity_entity_ids:
+            q = q | Q(entity_entity_id__in=entity_entity_ids)
+        if attribute_ids is not None:
+            q = q & Q(attribute_id__in=attribute_ids)
+
+        self._attribute_values = {}
+        self._attribute_values_by_attribute = {}
+        for attribute_value in models.StageAttributeValue.objects.filter(q & (
+                Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
+                                                value_codebook_item__published=True))).select_related(
+            'value_codebook_item__codebook', 'currency').order_by('id'):
+            attribute_value.attribute = self._attributes[attribute_value.attribute_id]
+            key = (attribute_value.entity_id, attribute_value.entity_entity_id)
+            self._attribute_values.setdefault(key, []).append(attribute_value)
+            self._attribute_values_by_attribute.setdefault(key + (attribute_value.attribute_id,), []).append(
+                attribute_value)
+
+        q = Q(pk__in=[])
+        if entity_ids:
+            q = q | Q(attribute_value__entity_id__in=entity_ids)
+        if entity_entity_ids:
+            q = q | Q(attribute_value__entity_entity_id__in=entity_entity_ids)
+        if attribute_ids is not None:
+            q = q & Q(attribute_value__attribute_id__in=attribute_ids)
+
+        self._attribute_value_collections = {}
+        for attribute_value_collection in models.StageAttributeValueCollection.objects.filter(
+                q, deleted=False, published=True, collection__deleted=False, collection__published=True,
+                collection__source__deleted=False, collection__source__published=True).select_related(
+            'collection__source').order_by('id'):
+            self._attribute_value_collections.setdefault(attribute_value_collection.attribute_value_id, []).append(
+                attribute_value_collection)
+
+    @staticmethod
+    def get_attributes():
+        job = get_current_job()
+        job_id = job.id if job is not None else None
+        if job_id is not None and AttributeValuesPrefetch._attributes_cache.get('job_id') == job_id:
+            return AttributeValuesPrefetch._attributes_cache['attributes']
+
+        attributes = models.StageAttribute.objects.select_related('attribute_type__data_type').in_bulk()
+        inner_attributes = {}
+        for attribute_id in sorted(attributes):
+            attribute = attributes[attribute_id]
+            if attribute.attribute_id is not None:
+                attribute.attribute = attributes[attribute.attribute_id]
+                if not attribute.finally_deleted and attribute.finally_published:
+                    inner_attributes.setdefault(attribute.attribute_id, []).append(attribute)
+        ret = (attributes, inner_attributes)
+
+        if job_id is not None:
+            AttributeValuesPrefetch._attributes_cache = {
+                'job_id': job_id,
+                'attributes': ret,
+            }
+        return ret
+
+    @staticmethod
+    def _get_key(entity, entity_entity):
+        return (entity.id if entity is not None else None, entity_entity.id if entity_entity is not None else None)
+
+    def get_attribute_values(self, entity, entity_entity, attribute):
+        return self._attribute_values_by_attribute.get(
+            AttributeValuesPrefetch._get_key(entity, entity_entity) + (attribute.id,), [])
+
+    def get_attribute_value_collections(self, attribute_value):
+        return self._attribute_value_collections.get(attribute_value.id, [])
+
+    def get_inner_attributes(self, attribute):
+        return self._inner_attributes.get(attribute.id, [])
+
+    def get_root_attributes(self, entity, entity_entity):
+        ret = []
+        for attribute_value in self._attribute_values.get(AttributeValuesPrefetch._get_key(entity, entity_entity), []):
+            attribute = attribute_value.attribute
+            codebook_item = attribute_value.value_codebook_item
+            if not attribute.finally_deleted and attribute.finally_published and (codebook_item is None or (
+                    not codebook_item.codebook.deleted and codebook_item.codebook.published)):
+                while attribute.attribute_id is not None:
+                    attribute = self._attributes[attribute.attribute_id]
+                if attribute not in ret:
+                    ret.append(attribute)
+        return ret
+
+    def get_search_attribute_values(self, entity):
+        ret = []
+        for attribute_value in self._attribute_values.get(AttributeValuesPrefetch._get_key(entity, None), []):
+            attribute = attribute_value.attribute
+            if not attribute.finally_deleted and attribute.finally_published and attribute.string_id in const.SEARCH_ATTRIBUTES and attribute_value.id in self._attribute_value_collections:
+                ret.append(attribute_value)
+        return ret
+
+
 class ElasticsearchDB(BaseDatabase):
     const.ELASTICSEARCH_DEFAULTS = {
         'HOST': '127.0.0.1',
@@ -299,7 +187,14 @@ class ElasticsearchDB(BaseDatabase):
         'USE_SSL': False,
 
         'INDICES_PREFIX': 'mocbackend',
-        'DOC_TYPE_NAME': 'default'
+        'DOC_TYPE_NAME': 'default',
+
+        'TIMEOUT': 30,
+        'MAX_CONNECTIONS': 25,
+        'MAX_RETRIES': 3,
+        'RETRY_ON_TIMEOUT': True,
+        'RETRY_ON_STATUS': (502, 503, 504),
+        'HTTP_COMPRESS': False,
     }
 
     const.DATA_TYPE_MAPPING_TO_ELASTIC = {
@@ -342,6 +237,11 @@ class ElasticsearchDB(BaseDatabase):
 
     const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME = 'codebook'
 
+    const.ELASTICSEARCH_INDEX_VERSION_SEPARATOR = '-v'
+    const.ELASTICSEARCH_INDEX_VERSION_FORMAT = '%Y%m%d%H%M%S'
+    const.ELASTICSEARCH_REBUILD_ALIAS_SUFFIX = '-rebuild'
+    const.ELASTICSEARCH_REBUILD_ALIASES_CACHE_TIMEOUT = 5
+
     const.ELASTICSEARCH_EXACT_STRING_FIELD_SUFIX = '_exact'
     const.ELASTICSEARCH_CODEBOOK_ITEM_ID_FIELD_SUFIX = '_id'
     const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX = 'count_'
@@ -350,9 +250,54 @@ class ElasticsearchDB(BaseDatabase):
 
     const.ELASTICSEARCH_VALUE_FIELD_NAME = 'value'
 
+    const.ELASTICSEARCH_ENTITY_SLICE_COUNTS = 'counts'
+    const.ELASTICSEARCH_ENTITY_SLICE_IS_PEP = 'is_pep'
+    const.ELASTICSEARCH_ENTITY_SLICE_STATE = 'state'
+    const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE = 'attribute'
+    const.ELASTICSEARCH_ENTITY_SLICE_GRAPH_METRICS = 'graph_metrics'
+
+    const.ELASTICSEARCH_ENTITY_GRAPH_METRICS_FIELDS = [
+        ('graph_degree', 'degree', const.DATA_TYPE_INT),
+        ('graph_weighted_degree', 'weighted_degree', const.DATA_TYPE_FLOATING_POINT),
+        ('graph_component_id', 'component_id', const.DATA_TYPE_INT),
+        ('graph_component_size', 'component_size', const.DATA_TYPE_INT),
+        ('graph_centrality', 'centrality', const.DATA_TYPE_FLOATING_POINT),
+    ]
+
+    const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNTS_SQL = '''
+        WITH entity_connection AS (
+            SELECT ee.entity_a_id AS entity_id, ee.entity_b_id AS other_id, ee.*
+            FROM mocbackend_stage_entity_entity ee
+            WHERE ee.entity_a_id = ANY(%(entity_ids)s)
+            UNION ALL
+            SELECT ee.entity_b_id AS entity_id, ee.entity_a_id AS other_id, ee.*
+            FROM mocbackend_stage_entity_entity ee
+            WHERE ee.entity_b_id = ANY(%(entity_ids)s)
+        )
+        SELECT ec.entity_id, ctc.string_id, COUNT(*), SUM(CASE WHEN
+            ec.deleted = FALSE AND ec.published = TRUE AND a.deleted = FALSE AND a.published = TRUE
+            AND b.deleted = FALSE AND b.published = TRUE AND EXISTS (
+                SELECT 1
+                FROM mocbackend_stage_entity_entity_collection eec
+                JOIN mocbackend_stage_collection c ON c.id = eec.collection_id
+                JOIN mocbackend_stage_source s ON s.id = c.source_id
+                WHERE eec.entity_entity_id = ec.id AND eec.deleted = FALSE AND eec.published = TRUE
+                    AND c.deleted = FALSE AND c.published = TRUE AND s.deleted = FALSE AND s.published = TRUE
+            ) THEN 1 ELSE 0 END)
+        FROM entity_connection ec
+        JOIN mocbackend_static_connection_type ct ON ct.id = ec.connection_type_id
+        JOIN mocbackend_static_connection_type_category ctc ON ctc.id = ct.category_id
+        JOIN mocbackend_stage_entity a ON a.id = ec.entity_a_id
+        JOIN mocbackend_stage_entity b ON b.id = ec.entity_b_id
+        WHERE (%(entity_not_to_count)s IS NULL OR ec.other_id <> %(entity_not_to_count)s)
+            AND (%(entity_entity_not_to_count)s IS NULL OR ec.id <> %(entity_entity_not_to_count)s)
+        GROUP BY ec.entity_id, ctc.string_id
+    '''
+
     const.ELASTICSEARCH_NESTED_FIELDS_LIMIT = 10000
     const.ELASTICSEARCH_TOTAL_FIELDS_LIMIT = 100000
     const.ELASTICSEARCH_MAX_RESULT_WINDOWS = 100000
+    const.ELASTICSEARCH_UPDATE_RETRY_ON_CONFLICT = 3
 
     const.SEARCH_ATTRIBUTES = [
         'person_first_name',
@@ -363,7 +308,14 @@ class ElasticsearchDB(BaseDatabase):
         # 'legal_entity_entity_type'
     ]
 
-    elasticsearch = None
+    index_name_overrides = {}
+
+    _rebuild_indices = None
+    _rebuild_indices_loaded_at = None
+
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
 
     @staticmethod
     def get_db():
@@ -382,9 +334,46 @@ class ElasticsearchDB(BaseDatabase):
 
     @staticmethod
     def get_elasticsearch_index_name(name):
+        if name in ElasticsearchDB.index_name_overrides:
+            return ElasticsearchDB.index_name_overrides[name]
+        return ElasticsearchDB.get_elasticsearch_alias_name(name)
+
+    @staticmethod
+    def get_elasticsearch_alias_name(name):
         indices_prefix = ElasticsearchDB._get_elasticsearch_setting('INDICES_PREFIX')
         return indices_prefix + '-' + name
 
+    @staticmethod
+    def get_elasticsearch_rebuild_alias_name(name):
+        return ElasticsearchDB.get_elasticsearch_alias_name(name) + const.ELASTICSEARCH_REBUILD_ALIAS_SUFFIX
+
+    def _get_rebuild_indices(self):
+        now = time.time()
+        if ElasticsearchDB._rebuild_indices is None or \
+                now - ElasticsearchDB._rebuild_indices_loaded_at > const.ELASTICSEARCH_REBUILD_ALIASES_CACHE_TIMEOUT:
+            rebuild_indices = {}
+            response = self.get_elasticsearch().indices.get_alias(
+                name=ElasticsearchDB.get_elasticsearch_rebuild_alias_name('*'), ignore=[404])
+            for index, value in response.items():
+                if isinstance(value, dict):
+                    for alias in value.get('aliases', {}):
+                        rebuild_indices[alias] = index
+            ElasticsearchDB._rebuild_indices = rebuild_indices
+            ElasticsearchDB._rebuild_indices_loaded_at = now
+        return ElasticsearchDB._rebuild_indices
+
+    def get_elasticsearch_write_index_names(self, name):
+        ret = [ElasticsearchDB.get_elasticsearch_index_name(name)]
+        if name not in ElasticsearchDB.index_name_overrides:
+            rebuild_index = self._get_rebuild_indices().get(ElasticsearchDB.get_elasticsearch_rebuild_alias_name(name))
+            if rebuild_index is not None:
+                ret.append(rebuild_index)
+        return ret
+
+    @staticmethod
+    def get_elasticsearch_versioned_index_name(name, version):
+        return ElasticsearchDB.get_elasticsearch_alias_name(name) + const.ELASTICSEARCH_INDEX_VERSION_SEPARATOR + version
+
     @staticmethod
     def get_elasticsearch_doc_type():
         ret = ElasticsearchDB._get_elasticsearch_setting('DOC_TYPE_NAME')
@@ -575,9 +564,14 @@ class ElasticsearchDB(BaseDatabase):
         return field_name, ret
 
     @staticmethod
-    def _get_elasticsearch_attribute_value_to_index(entity, entity_entity, attribute):
+    def _get_elasticsearch_attribute_value_to_index(entity, entity_entity, attribute, attribute_values_prefetch=None):
         ret = {}
 
+        if attribute_values_prefetch is None:
+            attribute_values_prefetch = AttributeValuesPrefetch(
+                entity_ids=[entity.id] if entity is not None else None,
+                entity_entity_ids=[entity_entity.id] if entity_entity is not None else None)
+
         inner_field_name = const.ELASTICSEARCH_VALUE_FIELD_NAME
         field_name = attribute.string_id
 
@@ -588,21 +582,16 @@ class ElasticsearchDB(BaseDatabase):
             data_type] != const.DATA_TYPE_COMPLEX:
             attribute_values = []
             if entity is not None:
-                attribute_values = attribute.attribute_values.filter(Q(entity=entity) & (
-                        Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
-                                                        value_codebook_item__published=True)))
+                attribute_values = attribute_values_prefetch.get_attribute_values(entity=entity, entity_entity=None,
+                                                                                  attribute=attribute)
             elif entity_entity is not None:
-                attribute_values = attribute.attribute_values.filter(Q(entity_entity=entity_entity) & (
-                        Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
-                                                        value_codebook_item__published=True)))
+                attribute_values = attribute_values_prefetch.get_attribute_values(entity=None,
+                                                                                  entity_entity=entity_entity,
+                                                                                  attribute=attribute)
             for attribute_value in attribute_values:
-                attribute_value_collections = attribute_value.attribute_value_collections.filter(deleted=False,
-                                                                                                 published=True,
-                                                                                                 collection__deleted=False,
-                                                                                                 collection__published=True,
-                                                                                                 collection__source__deleted=False,
-                                                                                                 collection__source__published=True)
-                if attribute_value_collections.exists():
+                attribute_value_collections = attribute_values_prefetch.get_attribute_value_collections(
+                    attribute_value)
+                if attribute_value_collections:
                     value = None
                     if data_type in const.DATA_TYPE_MAPPING_SIMPLE:
                         if const.DATA_TYPE_MAPPING_SIMPLE[data_type] == const.DATA_TYPE_STRING:
@@ -715,16 +704,18 @@ class ElasticsearchDB(BaseDatabase):
                         })
         elif const.DATA_TYPE_MAPPING_COMPLEX[data_type] == const.DATA_TYPE_COMPLEX:
             value = {}
-            for inner_attribute in attribute.attributes.filter(finally_deleted=False, finally_published=True):
+            for inner_attribute in attribute_values_prefetch.get_inner_attributes(attribute):
                 if entity is not None:
                     value.update(
                         ElasticsearchDB._get_elasticsearch_attribute_value_to_index(entity=entity, entity_entity=None,
-                                                                                    attribute=inner_attribute))
+                                                                                    attribute=inner_attribute,
+                                                                                    attribute_values_prefetch=attribute_values_prefetch))
                 elif entity_entity is not None:
                     value.update(
                         ElasticsearchDB._get_elasticsearch_attribute_value_to_index(entity=None,
                                                                                     entity_entity=entity_entity,
-                                                                                    attribute=inner_attribute))
+                                                                                    attribute=inner_attribute,
+                                                                                    attribute_values_prefetch=attribute_values_prefetch))
 
             if value != {}:
                 if field_name in ret and ret[field_name] is not None:
@@ -739,21 +730,11 @@ class ElasticsearchDB(BaseDatabase):
         return ret
 
     @staticmethod
-    def _get_search_field_to_index(entity):
+    def _get_search_field_to_index(entity, attribute_values_prefetch=None):
         ret = {}
-        for attribute_value in entity.attribute_values.filter(Q(attribute_value_collections__deleted=False,
-                                                                attribute_value_collections__published=True,
-                                                                attribute_value_collections__collection__deleted=False,
-                                                                attribute_value_collections__collection__published=True,
-                                                                attribute_value_collections__collection__source__deleted=False,
-                                                                attribute_value_collections__collection__source__published=True,
-                                                                attribute__finally_deleted=False,
-                                                                attribute__finally_published=True,
-                                                                attribute__string_id__in=const.SEARCH_ATTRIBUTES
-                                                                ) & (
-                                                                      Q(value_codebook_item=None) | Q(
-                                                                  value_codebook_item__deleted=False,
-                                                                  value_codebook_item__published=True))).distinct():
+        if attribute_values_prefetch is None:
+            attribute_values_prefetch = AttributeValuesPrefetch(entity_ids=[entity.id])
+        for attribute_value in attribute_values_prefetch.get_search_attribute_values(entity):
             search_attribute_value = attribute_value.get_raw_value()
             if search_attribute_value is not None:
                 if attribute_value.attribute.attribute_type.data_type.string_id == 'codebook':
@@ -777,7 +758,24 @@ class ElasticsearchDB(BaseDatabase):
         return django_rq.get_queue('elasticsearch', default_timeout='300m')
 
     @staticmethod
-    def _get_elasticsearch_entity_to_index(entity):
+    def _get_elasticsearch_entities_to_index(entities, attributes=None):
+        ret = {}
+        entity_types = models.StaticEntityType.objects.in_bulk()
+        attribute_values_prefetch = AttributeValuesPrefetch(entity_ids=[entity.id for entity in entities],
+                                                            attributes=attributes)
+        for entity in entities:
+            entity.entity_type = entity_types[entity.entity_type_id]
+            ret[entity.id] = ElasticsearchDB._get_elasticsearch_entity_to_index(
+                entity=entity, attribute_values_prefetch=attribute_values_prefetch)
+        graph_metrics = ElasticsearchDB._get_elasticsearch_entities_graph_metrics_to_index(entities)
+        for entity in entities:
+            ret[entity.id].update(graph_metrics[entity.id])
+        return ret
+
+    @staticmethod
+    def _get_elasticsearch_entity_to_index(entity, attribute_values_prefetch=None):
+        if attribute_values_prefetch is None:
+            attribute_values_prefetch = AttributeValuesPrefetch(entity_ids=[entity.id])
         ret = {
             'entity_type': {
                 'string_id': entity.entity_type.string_id,
@@ -792,22 +790,14 @@ class ElasticsearchDB(BaseDatabase):
                 'is_pep': is_pep
             })
 
-        processed_attributes = set()
-        for attribute in models.StageAttribute.objects.filter(
-                Q(attribute_values__entity=entity, finally_deleted=False, finally_published=True) & (
-                        Q(attribute_values__value_codebook_item=None) | Q(
-                    attribute_values__value_codebook_item__deleted=False,
-                    attribute_values__value_codebook_item__published=True,
-                    attribute_values__value_codebook_item__codebook__deleted=False,
-                    attribute_values__value_codebook_item__codebook__published=True))).distinct():
-            root_attribute = helpers.get_root_attribute(attribute)
-            if root_attribute not in processed_attributes:
-                processed_attributes.add(root_attribute)
-                ret.update(
-                    ElasticsearchDB._get_elasticsearch_attribute_value_to_index(entity=entity, entity_entity=None,
-                                                                                attribute=root_attribute))
+        for root_attribute in attribute_values_prefetch.get_root_attributes(entity=entity, entity_entity=None):
+            ret.update(
+                ElasticsearchDB._get_elasticsearch_attribute_value_to_index(entity=entity, entity_entity=None,
+                                                                            attribute=root_attribute,
+                                                                            attribute_values_prefetch=attribute_values_prefetch))
 
-        ret.update(ElasticsearchDB._get_search_field_to_index(entity))
+        ret.update(ElasticsearchDB._get_search_field_to_index(entity=entity,
+                                                              attribute_values_prefetch=attribute_values_prefetch))
         return ret
 
     @staticmethod
@@ -1299,115 +1289,189 @@ class ElasticsearchDB(BaseDatabase):
         return ret
 
     @staticmethod
-    def _get_elasticsearch_entity_connection_type_category_count_to_index(entity, count_deleted,
-                                                                          entity_not_to_count=None,
-                                                                          entity_entity_not_to_count=None):
-        ret = {}
+    def _get_elasticsearch_entities_connection_type_category_counts_to_index(entities, entity_not_to_count=None,
+                                                                             entity_entity_not_to_count=None):
+        counts = {}
+        all_counts = {}
+        empty = {}
         for connection_type_category in models.StaticConnectionTypeCategory.objects.all():
-            queryset = entity.reverse_connections.filter(
-                connection_type__category=connection_type_category)
-            if not count_deleted:
-                queryset = queryset.filter(deleted=False, published=True, entity_a__deleted=False,
-                                           entity_a__published=True, entity_b__deleted=False, entity_b__published=True,
-                                           entity_entity_collections__deleted=False,
-                                           entity_entity_collections__published=True,
-                                           entity_entity_collections__collection__deleted=False,
-                                           entity_entity_collections__collection__published=True,
-                                           entity_entity_collections__collection__source__deleted=False,
-                                           entity_entity_collections__collection__source__published=True)
-
-            if entity_not_to_count is not None:
-                queryset = queryset.filter(~Q(entity_b=entity_not_to_count))
-
-            if entity_entity_not_to_count is not None:
-                queryset = queryset.filter(~Q(pk=entity_entity_not_to_count.pk))
-
-            queryset = queryset.distinct()
-
-            count_1 = queryset.count()
-
-            queryset = entity.connections.filter(
-                connection_type__category=connection_type_category)
-            if not count_deleted:
-                queryset = queryset.filter(deleted=False, published=True, entity_a__deleted=False,
-                                           entity_a__published=True, entity_b__deleted=False, entity_b__published=True,
-                                           entity_entity_collections__deleted=False,
-                                           entity_entity_collections__published=True,
-                                           entity_entity_collections__collection__deleted=False,
-                                           entity_entity_collections__collection__published=True,
-                                           entity_entity_collections__collection__source__deleted=False,
-                                           entity_entity_collections__collection__source__published=True)
-
-            if entity_not_to_count is not None:
-                queryset = queryset.filter(~Q(entity_a=entity_not_to_count))
-
-            if entity_entity_not_to_count is not None:
-                queryset = queryset.filter(~Q(pk=entity_entity_not_to_count.pk))
-
-            queryset = queryset.distinct()
-
-            count_2 = queryset.count()
+            empty[const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category.string_id] = 0
+        for entity in entities:
+            counts[entity.id] = dict(empty)
+            all_counts[entity.id] = dict(empty)
+
+        if entities:
+            with connection.cursor() as cursor:
+                cursor.execute(const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNTS_SQL, {
+                    'entity_ids': list(counts.keys()),
+                    'entity_not_to_count': entity_not_to_count.id if entity_not_to_count is not None else None,
+                    'entity_entity_not_to_count': entity_entity_not_to_count.id if entity_entity_not_to_count is not None else None,
+                })
+                for entity_id, connection_type_category_string_id, count_all, count_visible in cursor.fetchall():
+                    field_name = const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category_string_id
+                    counts[entity_id][field_name] = count_visible
+                    all_counts[entity_id][field_name] = count_all
 
-            ret.update({
-                const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category.string_id: count_1 + count_2
-            })
+        return counts, all_counts
 
+    @staticmethod
+    def _get_elasticsearch_entities_stored_connection_type_category_counts_to_index(entities):
+        counts = {}
+        all_counts = {}
+        empty = {}
+        for connection_type_category in models.StaticConnectionTypeCategory.objects.all():
+            empty[const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category.string_id] = 0
+        for entity in entities:
+            counts[entity.id] = dict(empty)
+            all_counts[entity.id] = dict(empty)
+
+        for entity_id, connection_type_category_string_id, count, count_all in models.StageEntityConnectionCount.objects.filter(
+                entity_id__in=counts.keys()).values_list('entity_id', 'connection_type_category__string_id', 'count',
+                                                         'count_all'):
+            field_name = const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category_string_id
+            counts[entity_id][field_name] = count
+            all_counts[entity_id][field_name] = count_all
+
+        return counts, all_counts
+
+    @staticmethod
+    def _get_elasticsearch_entities_graph_metrics_to_index(entities):
+        ret = {}
+        for entity in entities:
+            ret[entity.id] = {field_name: 0 for field_name, metric, data_type in
+                              const.ELASTICSEARCH_ENTITY_GRAPH_METRICS_FIELDS}
+            ret[entity.id]['graph_component_id'] = None
+        for graph_metrics in models.StageEntityGraphMetrics.objects.filter(entity_id__in=ret.keys()):
+            for field_name, metric, data_type in const.ELASTICSEARCH_ENTITY_GRAPH_METRICS_FIELDS:
+                ret[graph_metrics.entity_id][field_name] = getattr(graph_metrics, metric)
         return ret
 
     @staticmethod
-    def _get_elasticsearch_connection_to_index(entity_entity):
-        entity_a_first_name = ''
-        entity_a_second_name = ''
-        entity_a_name = ''
-        entity_a_legal_entity_entity_type = None
-        for attribute_value in entity_entity.entity_a.attribute_values.filter(
-                Q(attribute__finally_deleted=False, attribute__finally_published=True,
-                  attribute_value_collections__deleted=False,
-                  attribute_value_collections__published=True,
-                  attribute_value_collections__collection__deleted=False,
-                  attribute_value_collections__collection__published=True,
-                  attribute_value_collections__collection__source__deleted=False,
-                  attribute_value_collections__collection__source__published=True
-                  ) & (
-                        Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
-                                                        value_codebook_item__published=True,
-                                                        value_codebook_item__codebook__deleted=False,
-                                                        value_codebook_item__codebook__published=True)) & (
-                        Q(attribute__string_id='person_first_name') | Q(attribute__string_id='person_last_name') | Q(
-                    attribute__string_id='legal_entity_name') | Q(attribute__string_id='legal_entity_entity_type') | Q(
-                    attribute__string_id='real_estate_name') | Q(attribute__string_id='movable_name') | Q(
-                    attribute__string_id='savings_name'))).distinct():
-            if attribute_value.attribute.string_id == 'person_first_name':
-                entity_a_first_name = entity_a_first_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'person_last_name':
-                entity_a_second_name = entity_a_second_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'legal_entity_name':
-                entity_a_name = entity_a_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'legal_entity_entity_type':
-                value = {
-                    const.ELASTICSEARCH_VALUE_FIELD_NAME: attribute_value.get_raw_first_value().value,
-                    const.ELASTICSEARCH_VALUE_FIELD_NAME + const.ELASTICSEARCH_CODEBOOK_ITEM_ID_FIELD_SUFIX: attribute_value.get_raw_first_value().id
+    def _get_elasticsearch_entities_partial_to_index(entities, slices, attribute=None):
+        docs = {}
+        all_docs = {}
+        for entity in entities:
+            docs[entity.id] = {}
+            all_docs[entity.id] = {}
+
+        if const.ELASTICSEARCH_ENTITY_SLICE_COUNTS in slices:
+            counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_stored_connection_type_category_counts_to_index(
+                entities)
+            for entity in entities:
+                docs[entity.id].update(counts[entity.id])
+                all_docs[entity.id].update(all_counts[entity.id])
+
+        if const.ELASTICSEARCH_ENTITY_SLICE_GRAPH_METRICS in slices:
+            graph_metrics = ElasticsearchDB._get_elasticsearch_entities_graph_metrics_to_index(entities)
+            for entity in entities:
+                docs[entity.id].update(graph_metrics[entity.id])
+                all_docs[entity.id].update(graph_metrics[entity.id])
+
+        if const.ELASTICSEARCH_ENTITY_SLICE_IS_PEP in slices:
+            for entity in entities:
+                if entity.entity_type.string_id == 'person':
+                    docs[entity.id]['is_pep'] = BaseDatabase._is_pep(entity)
+                    all_docs[entity.id]['is_pep'] = docs[entity.id]['is_pep']
+
+        if const.ELASTICSEARCH_ENTITY_SLICE_STATE in slices:
+            for entity in entities:
+                docs[entity.id].update({
+                    'published': entity.published,
+                    'deleted': entity.deleted,
+                })
+                all_docs[entity.id].update(docs[entity.id])
+
+        if const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE in slices and attribute is not None:
+            parents = {}
+            string_ids = {}
+            for attribute_id, parent_id, string_id in models.StageAttribute.objects.values_list('id', 'attribute_id',
+                                                                                                'string_id'):
+                parents[attribute_id] = parent_id
+                string_ids[attribute_id] = string_id
+            root_attribute_id = attribute.id
+            while parents[root_attribute_id] is not None:
+                root_attribute_id = parents[root_attribute_id]
+            attribute_ids = set()
+            for attribute_id in parents:
+                current_id = attribute_id
+                while parents[current_id] is not None:
+                    current_id = parents[current_id]
+                if current_id == root_attribute_id:
+                    attribute_ids.add(attribute_id)
+            update_search = any(string_ids[attribute_id] in const.SEARCH_ATTRIBUTES for attribute_id in attribute_ids)
+            if update_search:
+                attribute_ids.update(
+                    [attribute_id for attribute_id, string_id in string_ids.items() if string_id in const.SEARCH_ATTRIBUTES])
+
+            attribute_values_prefetch = AttributeValuesPrefetch(entity_ids=[entity.id for entity in entities],
+                                                                attribute_ids=attribute_ids)
+            for entity in entities:
+                doc = {
+                    string_ids[root_attribute_id]: None
                 }
-                if entity_a_legal_entity_entity_type is not None:
-                    entity_a_legal_entity_entity_type = entity_a_legal_entity_entity_type + [value]
-                else:
-                    entity_a_legal_entity_entity_type = [value]
-            elif attribute_value.attribute.string_id == 'real_estate_name':
-                entity_a_name = entity_a_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'movable_name':
-                entity_a_name = entity_a_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'savings_name':
-                entity_a_name = entity_a_name + ' ' + attribute_value.get_raw_first_value()
-        if entity_a_name == '':
-            entity_a_name = entity_a_first_name.strip() + ' ' + entity_a_second_name.strip()
-        entity_a_name = entity_a_name.strip()
-
-        entity_b_first_name = ''
-        entity_b_second_name = ''
-        entity_b_name = ''
-        entity_b_legal_entity_entity_type = None
-        for attribute_value in entity_entity.entity_b.attribute_values.filter(
-                Q(attribute__finally_deleted=False, attribute__finally_published=True,
+                for root_attribute in attribute_values_prefetch.get_root_attributes(entity=entity, entity_entity=None):
+                    if root_attribute.id == root_attribute_id:
+                        doc.update(ElasticsearchDB._get_elasticsearch_attribute_value_to_index(
+                            entity=entity, entity_entity=None, attribute=root_attribute,
+                            attribute_values_prefetch=attribute_values_prefetch))
+                if update_search:
+                    doc[const.ELASTICSEARCH_SEARCH_FIELD_NAME] = None
+                    doc.update(ElasticsearchDB._get_search_field_to_index(
+                        entity=entity, attribute_values_prefetch=attribute_values_prefetch))
+                docs[entity.id].update(doc)
+                all_docs[entity.id].update(doc)
+
+        return docs, all_docs
+
+    @staticmethod
+    def _get_elasticsearch_entity_connection_type_category_count_to_index(entity, count_deleted,
+                                                                          entity_not_to_count=None,
+                                                                          entity_entity_not_to_count=None):
+        counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_connection_type_category_counts_to_index(
+            entities=[entity], entity_not_to_count=entity_not_to_count,
+            entity_entity_not_to_count=entity_entity_not_to_count)
+        return all_counts[entity.id] if count_deleted else counts[entity.id]
+
+    @staticmethod
+    def _load_connections_related(entity_entities):
+        entities = models.StageEntity.objects.filter(
+            pk__in=set([entity_entity.entity_a_id for entity_entity in entity_entities] + [entity_entity.entity_b_id for
+                                                                                           entity_entity in
+                                                                                           entity_entities])).select_related(
+            'entity_type').in_bulk()
+        connection_types = models.StaticConnectionType.objects.select_related('category').in_bulk()
+        currencies = models.StaticCurrency.objects.in_bulk()
+        for entity_entity in entity_entities:
+            entity_entity.entity_a = entities[entity_entity.entity_a_id]
+            entity_entity.entity_b = entities[entity_entity.entity_b_id]
+            entity_entity.connection_type = connection_types[entity_entity.connection_type_id]
+            if entity_entity.transaction_currency_id is not None:
+                entity_entity.transaction_currency = currencies[entity_entity.transaction_currency_id]
+
+    @staticmethod
+    def _get_entity_entity_collections_states(entity_entity_ids):
+        visible = set()
+        published = set()
+        not_deleted = set()
+        for entity_entity_collection in models.StageEntityEntityCollection.objects.filter(
+                entity_entity_id__in=entity_entity_ids).select_related('collection__source'):
+            collection = entity_entity_collection.collection
+            entity_entity_collection_published = entity_entity_collection.published and collection.published and collection.source.published
+            entity_entity_collection_not_deleted = not entity_entity_collection.deleted and not collection.deleted and not collection.source.deleted
+            if entity_entity_collection_published:
+                published.add(entity_entity_collection.entity_entity_id)
+            if entity_entity_collection_not_deleted:
+                not_deleted.add(entity_entity_collection.entity_entity_id)
+            if entity_entity_collection_published and entity_entity_collection_not_deleted:
+                visible.add(entity_entity_collection.entity_entity_id)
+        return visible, published, not_deleted
+
+    @staticmethod
+    def _get_elasticsearch_entities_summaries(entities):
+        ret = {}
+        names = {}
+        for attribute_value in models.StageAttributeValue.objects.filter(
+                Q(entity__in=entities, attribute__finally_deleted=False, attribute__finally_published=True,
                   attribute_value_collections__deleted=False,
                   attribute_value_collections__published=True,
                   attribute_value_collections__collection__deleted=False,
@@ -1422,102 +1486,121 @@ class ElasticsearchDB(BaseDatabase):
                         Q(attribute__string_id='person_first_name') | Q(attribute__string_id='person_last_name') | Q(
                     attribute__string_id='legal_entity_name') | Q(attribute__string_id='legal_entity_entity_type') | Q(
                     attribute__string_id='real_estate_name') | Q(attribute__string_id='movable_name') | Q(
-                    attribute__string_id='savings_name'))).distinct():
+                    attribute__string_id='savings_name'))).select_related('attribute__attribute_type__data_type',
+                                                                          'value_codebook_item').distinct().order_by(
+            'id'):
+            first_name, second_name, name, legal_entity_entity_type = names.get(attribute_value.entity_id,
+                                                                                ('', '', '', None))
             if attribute_value.attribute.string_id == 'person_first_name':
-                entity_b_first_name = entity_b_first_name + ' ' + attribute_value.get_raw_first_value()
+                first_name = first_name + ' ' + attribute_value.get_raw_first_value()
             elif attribute_value.attribute.string_id == 'person_last_name':
-                entity_b_second_name = entity_b_second_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'legal_entity_name':
-                entity_b_name = entity_b_name + ' ' + attribute_value.get_raw_first_value()
+                second_name = second_name + ' ' + attribute_value.get_raw_first_value()
             elif attribute_value.attribute.string_id == 'legal_entity_entity_type':
                 value = {
                     const.ELASTICSEARCH_VALUE_FIELD_NAME: attribute_value.get_raw_first_value().value,
                     const.ELASTICSEARCH_VALUE_FIELD_NAME + const.ELASTICSEARCH_CODEBOOK_ITEM_ID_FIELD_SUFIX: attribute_value.get_raw_first_value().id
                 }
-                if entity_b_legal_entity_entity_type is not None:
-                    entity_b_legal_entity_entity_type = entity_b_legal_entity_entity_type + [value]
+                if legal_entity_entity_type is not None:
+                    legal_entity_entity_type = legal_entity_entity_type + [value]
                 else:
-                    entity_b_legal_entity_entity_type = [value]
-            elif attribute_value.attribute.string_id == 'real_estate_name':
-                entity_b_name = entity_b_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'movable_name':
-                entity_b_name = entity_b_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'savings_name':
-                entity_b_name = entity_b_name + ' ' + attribute_value.get_raw_first_value()
-        if entity_b_name == '':
-            entity_b_name = entity_b_first_name.strip() + ' ' + entity_b_second_name.strip()
-        entity_b_name = entity_b_name.strip()
-
-        ret = {
-            'entity_a': {
-                'public_id': entity_entity.entity_a.public_id,
-                'is_pep': BaseDatabase._is_pep(entity_entity.entity_a),
-                'name': entity_a_name,
+                    legal_entity_entity_type = [value]
+            else:
+                name = name + ' ' + attribute_value.get_raw_first_value()
+            names[attribute_value.entity_id] = (first_name, second_name, name, legal_entity_entity_type)
+
+        for entity in entities:
+            first_name, second_name, name, legal_entity_entity_type = names.get(entity.id, ('', '', '', None))
+            if name == '':
+                name = first_name.strip() + ' ' + second_name.strip()
+            ret[entity.id] = {
+                'public_id': entity.public_id,
+                'is_pep': BaseDatabase._is_pep(entity),
+                'name': name.strip(),
                 'entity_type': {
-                    'string_id': entity_entity.entity_a.entity_type.string_id,
-                    'name': entity_entity.entity_a.entity_type.name,
+                    'string_id': entity.entity_type.string_id,
+                    'name': entity.entity_type.name,
                 },
-                'legal_entity_type': entity_a_legal_entity_entity_type
-            },
-            'entity_b': {
-                'public_id': entity_entity.entity_b.public_id,
-                'is_pep': BaseDatabase._is_pep(entity_entity.entity_b),
-                'name': entity_b_name,
-                'entity_type': {
-                    'string_id': entity_entity.entity_b.entity_type.string_id,
-                    'name': entity_entity.entity_b.entity_type.name,
+                'legal_entity_type': legal_entity_entity_type
+            }
+        return ret
+
+    @staticmethod
+    def _get_elasticsearch_connections_to_index(entity_entities, attributes=None):
+        ret = {}
+        ElasticsearchDB._load_connections_related(entity_entities)
+        entity_entity_ids = [entity_entity.id for entity_entity in entity_entities]
+        visible, published, not_deleted = ElasticsearchDB._get_entity_entity_collections_states(entity_entity_ids)
+        entities_summaries = ElasticsearchDB._get_elasticsearch_entities_summaries(list(
+            {entity.id: entity for entity_entity in entity_entities for entity in
+             (entity_entity.entity_a, entity_entity.entity_b)}.values()))
+        attribute_values_prefetch = AttributeValuesPrefetch(entity_entity_ids=entity_entity_ids, attributes=attributes)
+
+        for entity_entity in entity_entities:
+            body = {
+                'entity_a': entities_summaries[entity_entity.entity_a_id],
+                'entity_b': entities_summaries[entity_entity.entity_b_id],
+                'connection_type_category': {
+                    'string_id': entity_entity.connection_type.category.string_id,
+                    'name': entity_entity.connection_type.category.name
                 },
-                'legal_entity_type': entity_b_legal_entity_entity_type
-            },
-            'connection_type_category': {
-                'string_id': entity_entity.connection_type.category.string_id,
-                'name': entity_entity.connection_type.category.name
-            },
-            'connection_type': {
-                'string_id': entity_entity.connection_type.string_id,
-                'name': entity_entity.connection_type.name,
-                'reverse_name': entity_entity.connection_type.reverse_name
-            },
-            'valid_from': entity_entity.valid_from,
-            'valid_to': entity_entity.valid_to,
-            'transaction_amount': entity_entity.transaction_amount,
-            'transaction_date': entity_entity.transaction_date,
-            'published': entity_entity.published and entity_entity.entity_a.published and entity_entity.entity_b.published and entity_entity.entity_entity_collections.filter(
-                published=True, collection__published=True, collection__source__published=True).exists(),
-            'deleted': entity_entity.deleted or entity_entity.entity_a.deleted or entity_entity.entity_b.deleted or not entity_entity.entity_entity_collections.filter(
-                deleted=False, collection__deleted=False, collection__source__deleted=False).exists(),
-        }
-        if entity_entity.transaction_currency is not None:
-            ret.update({
-                'transaction_currency': {
-                    'code': entity_entity.transaction_currency.code,
-                    'sign': entity_entity.transaction_currency.sign,
-                    'sign_before_value': entity_entity.transaction_currency.sign_before_value
-                }
-            })
+                'connection_type': {
+                    'string_id': entity_entity.connection_type.string_id,
+                    'name': entity_entity.connection_type.name,
+                    'reverse_name': entity_entity.connection_type.reverse_name
+                },
+                'valid_from': entity_entity.valid_from,
+                'valid_to': entity_entity.valid_to,
+                'transaction_amount': entity_entity.transaction_amount,
+                'transaction_date': entity_entity.transaction_date,
+                'published': entity_entity.published and entity_entity.entity_a.published and entity_entity.entity_b.published and entity_entity.id in published,
+                'deleted': entity_entity.deleted or entity_entity.entity_a.deleted or entity_entity.entity_b.deleted or entity_entity.id not in not_deleted,
+            }
+            if entity_entity.transaction_currency is not None:
+                body.update({
+                    'transaction_currency': {
+                        'code': entity_entity.transaction_currency.code,
+                        'sign': entity_entity.transaction_currency.sign,
+                        'sign_before_value': entity_entity.transaction_currency.sign_before_value
+                    }
+                })
 
-        processed_attributes = set()
-        for attribute in models.StageAttribute.objects.filter(
-                Q(attribute_values__entity_entity=entity_entity, finally_deleted=False, finally_published=True) & (
-                        Q(attribute_values__value_codebook_item=None) | Q(
-                    attribute_values__value_codebook_item__deleted=False,
-                    attribute_values__value_codebook_item__published=True,
-                    attribute_values__value_codebook_item__codebook__deleted=False,
-                    attribute_values__value_codebook_item__codebook__published=True))).distinct():
-            root_attribute = helpers.get_root_attribute(attribute)
-            if root_attribute not in processed_attributes:
-                processed_attributes.add(root_attribute)
-                ret.update(
+            for root_attribute in attribute_values_prefetch.get_root_attributes(entity=None,
+                                                                                entity_entity=entity_entity):
+                body.update(
                     ElasticsearchDB._get_elasticsearch_attribute_value_to_index(entity=None,
                                                                                 entity_entity=entity_entity,
-                                                                                attribute=root_attribute))
+                                                                                attribute=root_attribute,
+                                                                                attribute_values_prefetch=attribute_values_prefetch))
 
+            ret[entity_entity.id] = body
         return ret
 
+    @staticmethod
+    def _get_elasticsearch_connection_to_index(entity_entity):
+        return ElasticsearchDB._get_elasticsearch_connections_to_index([entity_entity])[entity_entity.id]
+
+    @staticmethod
+    def get_elasticsearch_client():
+        pid = os.getpid()
+        if ElasticsearchDB._client_pid != pid:
+            ElasticsearchDB._client = None
+            ElasticsearchDB._client_pid = pid
+            ElasticsearchDB._client_lock = threading.Lock()
+        if ElasticsearchDB._client is None:
+            with ElasticsearchDB._client_lock:
+                if ElasticsearchDB._client is None:
+                    ElasticsearchDB._client = Elasticsearch(
+                        ElasticsearchDB._get_elasticsearch_connection_strings(),
+                        timeout=ElasticsearchDB._get_elasticsearch_setting('TIMEOUT'),
+                        maxsize=ElasticsearchDB._get_elasticsearch_setting('MAX_CONNECTIONS'),
+                        max_retries=ElasticsearchDB._get_elasticsearch_setting('MAX_RETRIES'),
+                        retry_on_timeout=ElasticsearchDB._get_elasticsearch_setting('RETRY_ON_TIMEOUT'),
+                        retry_on_status=ElasticsearchDB._get_elasticsearch_setting('RETRY_ON_STATUS'),
+                        http_compress=ElasticsearchDB._get_elasticsearch_setting('HTTP_COMPRESS'))
+        return ElasticsearchDB._client
+
     def get_elasticsearch(self):
-        if self.elasticsearch is None:
-            self.elasticsearch = Elasticsearch(ElasticsearchDB._get_elasticsearch_connection_strings(), timeout=30)
-        return self.elasticsearch
+        return ElasticsearchDB.get_elasticsearch_client()
 
     def q_init(self, command=None):
         es_db = ElasticsearchDB.get_db()
@@ -1532,12 +1615,8 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-            ignore=[404])
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_ENTITIES_INDEX_NAME)
+        self.delete_index(name=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -1668,6 +1747,7 @@ class ElasticsearchDB(BaseDatabase):
                 },
             }
         }
+        entity_mappings['properties'].update(ElasticsearchDB.get_entity_graph_metrics_mapping())
 
         es.indices.put_mapping(
             index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
@@ -1703,12 +1783,8 @@ class ElasticsearchDB(BaseDatabase):
                 if command is not None:
                     command.stdout.write(command.style.WARNING(field_name + '\ttype not mapped'))
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
-            ignore=[404])
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME)
+        self.delete_index(name=const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -1909,9 +1985,7 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -2049,9 +2123,7 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -2173,9 +2245,7 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -2597,9 +2667,7 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -2741,9 +2809,7 @@ class ElasticsearchDB(BaseDatabase):
 
         es = self.get_elasticsearch()
 
-        es.indices.delete(
-            index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME),
-            ignore=[404])
+        self.delete_index(name=const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME)
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS(
@@ -2851,6 +2917,104 @@ class ElasticsearchDB(BaseDatabase):
         if command is not None:
             command.stdout.write(command.style.SUCCESS('Fields mapped'))
 
+    def delete_index(self, name):
+        es = self.get_elasticsearch()
+        index = ElasticsearchDB.get_elasticsearch_index_name(name)
+        if es.indices.exists_alias(name=index):
+            index = ','.join(es.indices.get_alias(name=index))
+        es.indices.delete(index=index, ignore=[404])
+
+    def get_index_versions(self, name):
+        ret = {}
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
+            es = self.get_elasticsearch()
+            alias = ElasticsearchDB.get_elasticsearch_alias_name(name)
+            prefix = alias + const.ELASTICSEARCH_INDEX_VERSION_SEPARATOR
+            for index, value in es.indices.get_alias(index=prefix + '*').items():
+                if re.match('^' + re.escape(prefix) + r'\d+$', index):
+                    ret[index] = alias in value.get('aliases', {})
+        return ret
+
+    def start_rebuild(self, names, init, resume=False, command=None):
+        if not ElasticsearchDB.is_elasticsearch_settings_exists():
+            if command is not None:
+                command.stdout.write(command.style.ERROR('Elasticsearch not configured'))
+            return None
+
+        es = self.get_elasticsearch()
+
+        version = None
+        if resume:
+            pending = sorted(index for index, live in self.get_index_versions(names[0]).items() if not live)
+            if pending:
+                version = pending[-1].rsplit(const.ELASTICSEARCH_INDEX_VERSION_SEPARATOR, 1)[1]
+
+        create = version is None
+        if create:
+            version = timezone.now().strftime(const.ELASTICSEARCH_INDEX_VERSION_FORMAT)
+        for name in names:
+            ElasticsearchDB.index_name_overrides[name] = ElasticsearchDB.get_elasticsearch_versioned_index_name(
+                name=name, version=version)
+
+        if create:
+            init(command=command)
+        elif command is not None:
+            command.stdout.write(command.style.SUCCESS('Resuming rebuild of version ' + version))
+
+        es.indices.put_settings(
+            index=','.join(ElasticsearchDB.index_name_overrides[name] for name in names),
+            body={'index': {'number_of_replicas': 0, 'refresh_interval': '-1'}})
+
+        es.indices.update_aliases(body={'actions': [{'add': {
+            'index': ElasticsearchDB.index_name_overrides[name],
+            'alias': ElasticsearchDB.get_elasticsearch_rebuild_alias_name(name)}} for name in names]})
+        time.sleep(const.ELASTICSEARCH_REBUILD_ALIASES_CACHE_TIMEOUT)
+        return version
+
+    def finish_rebuild(self, names, command=None):
+        if not ElasticsearchDB.is_elasticsearch_settings_exists():
+            return
+
+        es = self.get_elasticsearch()
+
+        actions = []
+        to_delete = []
+        for name in names:
+            alias = ElasticsearchDB.get_elasticsearch_alias_name(name)
+            index = ElasticsearchDB.index_name_overrides.pop(name)
+
+            number_of_replicas = None
+            if es.indices.exists_alias(name=alias):
+                for live_index in es.indices.get_alias(name=alias):
+                    number_of_replicas = es.indices.get_settings(index=live_index)[live_index]['settings'][
+                        'index'].get('number_of_replicas')
+                    actions.append({'remove': {'index': live_index, 'alias': alias}})
+            elif es.indices.exists(index=alias):
+                number_of_replicas = es.indices.get_settings(index=alias)[alias]['settings']['index'].get(
+                    'number_of_replicas')
+                actions.append({'remove_index': {'index': alias}})
+
+            es.indices.put_settings(index=index, body={
+                'index': {'number_of_replicas': number_of_replicas, 'refresh_interval': None}})
+            es.indices.refresh(index=index)
+            actions.append({'add': {'index': index, 'alias': alias}})
+            actions.append({'remove': {'index': index,
+                                       'alias': ElasticsearchDB.get_elasticsearch_rebuild_alias_name(name)}})
+
+            to_delete.extend(old_index for old_index in self.get_index_versions(name) if old_index != index)
+
+        es.indices.update_aliases(body={'actions': actions})
+
+        for old_index in to_delete:
+            es.indices.delete(index=old_index, ignore=[404])
+
+        if command is not None:
+            for name in names:
+                command.stdout.write(command.style.SUCCESS(
+                    'Alias ' + ElasticsearchDB.get_elasticsearch_alias_name(name) + ' switched'))
+            for old_index in to_delete:
+                command.stdout.write(command.style.SUCCESS('Index ' + old_index + ' deleted'))
+
     def q_put_attribute_mapping(self, attribute):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
@@ -2891,11 +3055,10 @@ class ElasticsearchDB(BaseDatabase):
             field_name, mapping_properties = ElasticsearchDB._get_elasticsearch_field_mapping_properties(
                 attribute=attribute)
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
+                index=','.join(self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_ENTITIES_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(
-                    const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
+                index=','.join(self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
         return field_name, mapping_properties
 
@@ -2919,11 +3082,11 @@ class ElasticsearchDB(BaseDatabase):
             field_name, mapping_properties = ElasticsearchDB._get_elasticsearch_field_mapping_properties(
                 attribute=attribute)
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
+                index=','.join(self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(
-                    const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME),
+                index=','.join(
+                    self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
         return field_name, mapping_properties
 
@@ -2933,6 +3096,20 @@ class ElasticsearchDB(BaseDatabase):
     def delete_connection_attribute_mapping(self, attribute):
         pass
 
+    @staticmethod
+    def get_entity_graph_metrics_mapping():
+        return {field_name: {'type': const.DATA_TYPE_MAPPING_TO_ELASTIC[data_type]} for field_name, metric, data_type in
+                const.ELASTICSEARCH_ENTITY_GRAPH_METRICS_FIELDS}
+
+    def put_entity_graph_metrics_mapping(self):
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
+            es = self.get_elasticsearch()
+            for index_name in [const.ELASTICSEARCH_ENTITIES_INDEX_NAME, const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME]:
+                es.indices.put_mapping(
+                    index=ElasticsearchDB.get_elasticsearch_index_name(index_name),
+                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(),
+                    body={'properties': ElasticsearchDB.get_entity_graph_metrics_mapping()})
+
     def q_put_entity_connection_type_category_count_mapping(self, connection_type_category):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
@@ -2949,142 +3126,201 @@ class ElasticsearchDB(BaseDatabase):
                 }
             }
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
+                index=','.join(self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_ENTITIES_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
             es.indices.put_mapping(
-                index=ElasticsearchDB.get_elasticsearch_index_name(
-                    const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
+                index=','.join(self.get_elasticsearch_write_index_names(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME)),
                 doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'properties': mapping_properties})
         return const.ELASTICSEARCH_CONNECTION_TYPE_CATEGORY_COUNT_FIELD_PREFIX + connection_type_category.string_id, mapping_properties
 
-    def q_add_entity(self, entity, overwrite=False, add_connections=True):
+    def q_add_entity(self, entity, overwrite=False, add_connections=True, depends_on=None):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
-        queue.enqueue(es_db.add_entity, entity=entity, overwrite=overwrite, add_connections=add_connections, ttl=-1)
+        queue.enqueue(es_db.add_entity, entity=entity, overwrite=overwrite, add_connections=add_connections,
+                      depends_on=depends_on, ttl=-1)
 
     def add_entity(self, entity, overwrite=False, add_connections=True):
-        if entity is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            body = None
-            if entity.deleted or not entity.published:
-                self.delete_entity(entity=entity, delete_all=False)
-            else:
-                if overwrite or not es.exists(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id):
-                    body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                    body.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                          count_deleted=False))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                        body=body)
-
-            if overwrite or not es.exists(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id):
-                if body is None:
-                    body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                body.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                      count_deleted=True))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                    body=body)
-
-            if add_connections:
-                for entity_entity in entity.reverse_connections.all():
-                    self.add_connection(entity_entity=entity_entity, calculate_count=False, overwrite=overwrite)
+        if entity is not None:
+            self.add_entities(entities=[entity], overwrite=overwrite, add_connections=add_connections)
 
-                for entity_entity in entity.connections.all():
-                    self.add_connection(entity_entity=entity_entity, calculate_count=False, overwrite=overwrite)
+    def q_add_entities(self, entities, overwrite=False, add_connections=True):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.add_entities, entities=entities, overwrite=overwrite, add_connections=add_connections,
+                      ttl=-1)
+
+    def add_entities(self, entities, overwrite=False, add_connections=True, attributes=None):
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
+            entities = [entity for entity in entities if entity is not None]
+            if attributes is None:
+                attributes = AttributeValuesPrefetch.get_attributes()
+
+            visible_entities = []
+            for entity in entities:
+                if entity.deleted or not entity.published:
+                    self.delete_entity(entity=entity, delete_all=False, calculate_count=False)
+                else:
+                    visible_entities.append(entity)
+
+            entities_to_index = visible_entities
+            all_entities_to_index = entities
+            if not overwrite:
+                indexed = self._get_indexed_ids(index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME,
+                                                ids=[entity.public_id for entity in entities_to_index])
+                entities_to_index = [entity for entity in entities_to_index if entity.public_id not in indexed]
+                indexed = self._get_indexed_ids(index=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME,
+                                                ids=[entity.public_id for entity in all_entities_to_index])
+                all_entities_to_index = [entity for entity in all_entities_to_index if
+                                         entity.public_id not in indexed]
+
+            entities_to_build = list({entity.id: entity for entity in entities_to_index + all_entities_to_index}.values())
+            bodies = ElasticsearchDB._get_elasticsearch_entities_to_index(entities_to_build, attributes=attributes)
+            counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_stored_connection_type_category_counts_to_index(
+                entities_to_build)
+
+            for entity in entities_to_index:
+                body = bodies[entity.id]
+                body.update(counts[entity.id])
+                self._index_document(index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME, id=entity.public_id, body=body)
+
+            for entity in all_entities_to_index:
+                body = bodies[entity.id]
+                body.update(all_counts[entity.id])
+                self._index_document(index=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME, id=entity.public_id, body=body)
+
+            if add_connections and entities:
+                entity_entities = list(models.StageEntityEntity.objects.filter(
+                    Q(entity_a__in=entities) | Q(entity_b__in=entities)).order_by('id'))
+                for i in range(0, len(entity_entities), 1000):
+                    self.add_connections(entity_entities=entity_entities[i:i + 1000], calculate_count=False,
+                                         overwrite=overwrite, attributes=attributes)
+
+    def _get_indexed_ids(self, index, ids):
+        ret = set()
+        if ids:
+            es = self.get_elasticsearch()
+            response = es.mget(index=ElasticsearchDB.get_elasticsearch_index_name(index),
+                               doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body={'ids': ids}, _source=False)
+            ret = set(doc['_id'] for doc in response['docs'] if doc.get('found', False))
+        return ret
 
-    def q_update_entity(self, entity, update_connections=True):
+    def q_update_entity(self, entity, update_connections=True, depends_on=None):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
-        queue.enqueue(es_db.update_entity, entity=entity, update_connections=update_connections, ttl=-1)
+        queue.enqueue(es_db.update_entity, entity=entity, update_connections=update_connections,
+                      depends_on=depends_on, ttl=-1)
 
     def update_entity(self, entity, update_connections=True):
         self.add_entity(entity=entity, overwrite=True, add_connections=update_connections)
 
-    def q_delete_entity(self, entity, delete_all=True):
+    def q_update_entities(self, entities, update_connections=True):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
-        queue.enqueue(es_db.delete_entity, entity=entity, delete_all=delete_all, ttl=-1)
+        queue.enqueue(es_db.update_entities, entities=entities, update_connections=update_connections, ttl=-1)
 
-    def delete_entity(self, entity, delete_all=True):
-        if entity is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
+    def update_entities(self, entities, update_connections=True):
+        self.add_entities(entities=entities, overwrite=True, add_connections=update_connections)
+
+    def _index_document(self, index, id, body):
+        es = self.get_elasticsearch()
+        for index_name in self.get_elasticsearch_write_index_names(index):
+            es.index(index=index_name, doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=id, body=body)
+
+    def _update_document(self, index, id, doc):
+        ret = True
+        if doc:
             es = self.get_elasticsearch()
+            for i, index_name in enumerate(self.get_elasticsearch_write_index_names(index)):
+                try:
+                    es.update(index=index_name, doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=id,
+                              body={'doc': doc}, retry_on_conflict=const.ELASTICSEARCH_UPDATE_RETRY_ON_CONFLICT)
+                except NotFoundError:
+                    if i == 0:
+                        ret = False
+        return ret
+
+    def _delete_document(self, index, id):
+        es = self.get_elasticsearch()
+        for index_name in self.get_elasticsearch_write_index_names(index):
             try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id)
+                es.delete(index=index_name, doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=id)
             except NotFoundError:
                 pass
 
-            if delete_all:
-                try:
-                    es.delete(index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id)
-                except NotFoundError:
-                    pass
-
-            for entity_entity in entity.reverse_connections.all():
-                entity_b = entity_entity.entity_b
-                body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity_b)
-                body.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity_b,
-                                                                                                      count_deleted=False,
-                                                                                                      entity_not_to_count=entity))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_b.public_id,
-                    body=body)
-
-                if delete_all:
-                    body.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity_b,
-                                                                                                          count_deleted=True,
-                                                                                                          entity_not_to_count=entity))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_b.public_id,
-                        body=body)
+    def _update_entities_documents(self, entities, docs=None, all_docs=None):
+        missing = {}
+        for entity in entities:
+            if docs is not None and entity.id in docs and not self._update_document(
+                    index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME, id=entity.public_id,
+                    doc=docs[entity.id]) and not entity.deleted and entity.published:
+                missing[entity.id] = entity
+            if all_docs is not None and entity.id in all_docs and not self._update_document(
+                    index=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME, id=entity.public_id, doc=all_docs[entity.id]):
+                missing[entity.id] = entity
+        if missing:
+            self.add_entities(entities=list(missing.values()), overwrite=False, add_connections=False)
+
+    def q_update_entity_partial(self, entity, slices, attribute=None, update_connections=False):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.update_entities_partial, entity_ids=[entity.id], slices=slices, attribute=attribute,
+                      update_connections=update_connections, ttl=-1)
 
-                self.delete_connection(entity_entity=entity_entity, calculate_count=False, delete_all=delete_all)
+    def q_update_entities_partial(self, entity_ids, slices, attribute=None, update_connections=False):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.update_entities_partial, entity_ids=entity_ids, slices=slices, attribute=attribute,
+                      update_connections=update_connections, ttl=-1)
+
+    def update_entities_partial(self, entity_ids, slices, attribute=None, update_connections=False):
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
+            entities = list(models.StageEntity.objects.filter(pk__in=entity_ids).select_related('entity_type'))
+            docs, all_docs = ElasticsearchDB._get_elasticsearch_entities_partial_to_index(entities=entities,
+                                                                                           slices=slices,
+                                                                                           attribute=attribute)
+            visible_docs = {}
+            for entity in entities:
+                if not entity.deleted and entity.published:
+                    visible_docs[entity.id] = docs[entity.id]
+                elif const.ELASTICSEARCH_ENTITY_SLICE_STATE in slices:
+                    self.delete_entity(entity=entity, delete_all=False, calculate_count=False)
+            self._update_entities_documents(entities=entities, docs=visible_docs, all_docs=all_docs)
+
+            if update_connections or const.ELASTICSEARCH_ENTITY_SLICE_STATE in slices:
+                entity_entities = list(models.StageEntityEntity.objects.filter(
+                    Q(entity_a__in=entities) | Q(entity_b__in=entities)).order_by('id'))
+                for i in range(0, len(entity_entities), 1000):
+                    self.add_connections(entity_entities=entity_entities[i:i + 1000], calculate_count=False,
+                                         overwrite=True)
+
+    def q_delete_entity(self, entity, delete_all=True, calculate_count=True):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.delete_entity, entity=entity, delete_all=delete_all, calculate_count=calculate_count,
+                      ttl=-1)
 
-            for entity_entity in entity.connections.all():
-                entity_a = entity_entity.entity_a
-                body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity_a)
-                body.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity_a,
-                                                                                                      count_deleted=False,
-                                                                                                      entity_not_to_count=entity))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_a.public_id,
-                    body=body)
-
-                if delete_all:
-                    body.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity_a,
-                                                                                                          count_deleted=True,
-                                                                                                          entity_not_to_count=entity))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_a.public_id,
-                        body=body)
+    def delete_entity(self, entity, delete_all=True, calculate_count=True):
+        if entity is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
+            self._delete_document(index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME, id=entity.public_id)
 
+            if delete_all:
+                self._delete_document(index=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME, id=entity.public_id)
+
+            entity_entities = list(entity.reverse_connections.select_related('entity_b__entity_type').all()) + list(
+                entity.connections.select_related('entity_a__entity_type').all())
+            neighbours = {}
+            for entity_entity in entity_entities:
+                neighbour = entity_entity.entity_b if entity_entity.entity_a_id == entity.id else entity_entity.entity_a
+                neighbours[neighbour.id] = neighbour
+            neighbours = list(neighbours.values())
+
+            if calculate_count and neighbours:
+                counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_connection_type_category_counts_to_index(
+                    neighbours, entity_not_to_count=entity)
+                self._update_entities_documents(entities=neighbours, docs=counts,
+                                                all_docs=all_counts if delete_all else None)
+
+            for entity_entity in entity_entities:
                 self.delete_connection(entity_entity=entity_entity, calculate_count=False, delete_all=delete_all)
 
     def q_add_connection(self, entity_entity, calculate_count=True, overwrite=False):
@@ -3094,80 +3330,69 @@ class ElasticsearchDB(BaseDatabase):
                       overwrite=overwrite, ttl=-1)
 
     def add_connection(self, entity_entity, calculate_count=True, overwrite=False):
-        if entity_entity is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            body_a = None
-            body_b = None
-            if entity_entity.deleted or not entity_entity.published or entity_entity.entity_a.deleted or not entity_entity.entity_a.published or entity_entity.entity_b.deleted or not entity_entity.entity_b.published or not entity_entity.entity_entity_collections.filter(
-                    deleted=False, published=True, collection__deleted=False, collection__published=True,
-                    collection__source__deleted=False, collection__source__published=True).exists():
-                self.delete_connection(entity_entity=entity_entity, calculate_count=True, delete_all=False)
-            else:
-                if overwrite or not es.exists(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id):
-                    body = ElasticsearchDB._get_elasticsearch_connection_to_index(entity_entity)
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id,
-                        body=body)
-
-                if calculate_count:
-                    entity = entity_entity.entity_a
-                    body_a = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                    body_a.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                          count_deleted=False))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                        body=body_a)
-
-                    entity = entity_entity.entity_b
-                    body_b = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                    body_b.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                          count_deleted=False))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                        body=body_b)
+        if entity_entity is not None:
+            self.add_connections(entity_entities=[entity_entity], calculate_count=calculate_count, overwrite=overwrite)
 
-            if overwrite or not es.exists(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id):
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id,
-                    body=ElasticsearchDB._get_elasticsearch_connection_to_index(entity_entity))
+    def q_add_connections(self, entity_entities, calculate_count=True, overwrite=False):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.add_connections, entity_entities=entity_entities, calculate_count=calculate_count,
+                      overwrite=overwrite, ttl=-1)
+
+    def add_connections(self, entity_entities, calculate_count=True, overwrite=False, attributes=None):
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
+            entity_entities = [entity_entity for entity_entity in entity_entities if entity_entity is not None]
+            ElasticsearchDB._load_connections_related(entity_entities)
+            visible, published, not_deleted = ElasticsearchDB._get_entity_entity_collections_states(
+                [entity_entity.id for entity_entity in entity_entities])
+
+            visible_entity_entities = []
+            for entity_entity in entity_entities:
+                if entity_entity.deleted or not entity_entity.published or entity_entity.entity_a.deleted or not entity_entity.entity_a.published or entity_entity.entity_b.deleted or not entity_entity.entity_b.published or entity_entity.id not in visible:
+                    self.delete_connection(entity_entity=entity_entity, calculate_count=calculate_count,
+                                           delete_all=False)
+                else:
+                    visible_entity_entities.append(entity_entity)
+
+            entity_entities_to_index = visible_entity_entities
+            all_entity_entities_to_index = entity_entities
+            if not overwrite:
+                indexed = self._get_indexed_ids(index=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME,
+                                                ids=[entity_entity.id for entity_entity in entity_entities_to_index])
+                entity_entities_to_index = [entity_entity for entity_entity in entity_entities_to_index if
+                                            str(entity_entity.id) not in indexed]
+                indexed = self._get_indexed_ids(index=const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME,
+                                                ids=[entity_entity.id for entity_entity in all_entity_entities_to_index])
+                all_entity_entities_to_index = [entity_entity for entity_entity in all_entity_entities_to_index if
+                                                str(entity_entity.id) not in indexed]
+
+            bodies = ElasticsearchDB._get_elasticsearch_connections_to_index(list(
+                {entity_entity.id: entity_entity for entity_entity in
+                 entity_entities_to_index + all_entity_entities_to_index}.values()), attributes=attributes)
+
+            for entity_entity in entity_entities_to_index:
+                self._index_document(index=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME, id=entity_entity.id,
+                                     body=bodies[entity_entity.id])
+
+            for entity_entity in all_entity_entities_to_index:
+                self._index_document(index=const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME, id=entity_entity.id,
+                                     body=bodies[entity_entity.id])
 
             if calculate_count:
-                entity = entity_entity.entity_a
-                if body_a is None:
-                    body_a = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                body_a.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                      count_deleted=True))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                    body=body_a)
-
-                entity = entity_entity.entity_b
-                if body_b is None:
-                    body_b = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                body_b.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                      count_deleted=True))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id,
-                    body=body_b)
+                visible_entities = {}
+                for entity_entity in visible_entity_entities:
+                    visible_entities[entity_entity.entity_a_id] = entity_entity.entity_a
+                    visible_entities[entity_entity.entity_b_id] = entity_entity.entity_b
+                entities = {}
+                for entity_entity in entity_entities:
+                    entities[entity_entity.entity_a_id] = entity_entity.entity_a
+                    entities[entity_entity.entity_b_id] = entity_entity.entity_b
+                counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_connection_type_category_counts_to_index(
+                    list(entities.values()))
+                self._update_entities_documents(
+                    entities=list(entities.values()),
+                    docs={entity_id: counts[entity_id] for entity_id in visible_entities.keys()},
+                    all_docs=all_counts)
 
     def q_update_connection(self, entity_entity, calculate_count=True):
         es_db = ElasticsearchDB.get_db()
@@ -3177,6 +3402,15 @@ class ElasticsearchDB(BaseDatabase):
     def update_connection(self, entity_entity, calculate_count=True):
         self.add_connection(entity_entity=entity_entity, calculate_count=calculate_count, overwrite=True)
 
+    def q_update_connections(self, entity_entities, calculate_count=True):
+        es_db = ElasticsearchDB.get_db()
+        queue = ElasticsearchDB._get_queue()
+        queue.enqueue(es_db.update_connections, entity_entities=entity_entities, calculate_count=calculate_count,
+                      ttl=-1)
+
+    def update_connections(self, entity_entities, calculate_count=True):
+        self.add_connections(entity_entities=entity_entities, calculate_count=calculate_count, overwrite=True)
+
     def q_delete_connection(self, entity_entity, calculate_count=True, delete_all=True):
         es_db = ElasticsearchDB.get_db()
         queue = ElasticsearchDB._get_queue()
@@ -3185,61 +3419,19 @@ class ElasticsearchDB(BaseDatabase):
 
     def delete_connection(self, entity_entity, calculate_count=True, delete_all=True):
         if entity_entity is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id)
-            except NotFoundError:
-                pass
+            self._delete_document(index=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME, id=entity_entity.id)
 
             if delete_all:
-                try:
-                    es.delete(index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity.id)
-                except NotFoundError:
-                    pass
+                self._delete_document(index=const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME, id=entity_entity.id)
 
             if calculate_count:
-                entity = entity_entity.entity_a
-                body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                body.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                      count_deleted=False,
-                                                                                                      entity_entity_not_to_count=entity_entity))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id, body=body)
-
-                if delete_all:
-                    body.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                          count_deleted=True,
-                                                                                                          entity_entity_not_to_count=entity_entity))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id, body=body)
-
-                entity = entity_entity.entity_b
-                body = ElasticsearchDB._get_elasticsearch_entity_to_index(entity)
-                body.update(
-                    ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                      count_deleted=False,
-                                                                                                      entity_entity_not_to_count=entity_entity))
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ENTITIES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id, body=body)
-
-                if delete_all:
-                    body.update(
-                        ElasticsearchDB._get_elasticsearch_entity_connection_type_category_count_to_index(entity=entity,
-                                                                                                          count_deleted=True,
-                                                                                                          entity_entity_not_to_count=entity_entity))
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity.public_id, body=body)
+                entities = [entity_entity.entity_a]
+                if entity_entity.entity_b_id != entity_entity.entity_a_id:
+                    entities.append(entity_entity.entity_b)
+                counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_connection_type_category_counts_to_index(
+                    entities, entity_entity_not_to_count=entity_entity)
+                self._update_entities_documents(entities=entities, docs=counts,
+                                                all_docs=all_counts if delete_all else None)
 
     def q_add_attribute(self, attribute, overwrite=False):
         es_db = ElasticsearchDB.get_db()
@@ -3256,11 +3448,8 @@ class ElasticsearchDB(BaseDatabase):
                     index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME),
                     doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=root_attribute.string_id):
                 body = ElasticsearchDB._get_elasticsearch_attribute_to_index(attribute=root_attribute)
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=root_attribute.string_id,
-                    body=body)
+                self._index_document(index=const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME, id=root_attribute.string_id,
+                                     body=body)
 
     def q_update_attribute(self, attribute):
         es_db = ElasticsearchDB.get_db()
@@ -3280,14 +3469,7 @@ class ElasticsearchDB(BaseDatabase):
             if attribute.attribute is not None:
                 self.update_attribute(attribute)
             else:
-                es = self.get_elasticsearch()
-                try:
-                    es.delete(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=attribute.string_id)
-                except NotFoundError:
-                    pass
+                self._delete_document(index=const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME, id=attribute.string_id)
 
     def q_add_connection_type(self, connection_type, overwrite=False):
         es_db = ElasticsearchDB.get_db()
@@ -3301,11 +3483,8 @@ class ElasticsearchDB(BaseDatabase):
                     index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME),
                     doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=connection_type.string_id):
                 body = ElasticsearchDB._get_elasticsearch_connection_type_to_index(connection_type=connection_type)
-                es.index(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=connection_type.string_id,
-                    body=body)
+                self._index_document(index=const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME,
+                                     id=connection_type.string_id, body=body)
 
     def q_update_connection_type(self, connection_type):
         es_db = ElasticsearchDB.get_db()
@@ -3322,14 +3501,35 @@ class ElasticsearchDB(BaseDatabase):
 
     def delete_connection_type(self, connection_type):
         if connection_type is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=connection_type.string_id)
-            except NotFoundError:
-                pass
+            self._delete_document(index=const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME, id=connection_type.string_id)
+
+    @staticmethod
+    def _is_attribute_value_change_to_delete(attribute_value_change, visible_entity_entity_ids=None):
+        ret = attribute_value_change.deleted or not attribute_value_change.published or \
+              attribute_value_change.attribute.finally_deleted or not attribute_value_change.attribute.finally_published or \
+              attribute_value_change.changeset.deleted or not attribute_value_change.changeset.published or \
+              attribute_value_change.changeset.collection.deleted or not attribute_value_change.changeset.collection.published or \
+              attribute_value_change.changeset.collection.source.deleted or not attribute_value_change.changeset.collection.source.published or (
+                      attribute_value_change.entity is not None and (
+                      attribute_value_change.entity.deleted or not attribute_value_change.entity.published)) or (
+                      attribute_value_change.entity_entity is not None and (
+                      attribute_value_change.entity_entity.deleted or not attribute_value_change.entity_entity.published or
+                      attribute_value_change.entity_entity.entity_a.deleted or not attribute_value_change.entity_entity.entity_a.published or
+                      attribute_value_change.entity_entity.entity_b.deleted or not attribute_value_change.entity_entity.entity_b.published)) or (
+                      attribute_value_change.old_value_codebook_item is not None and (
+                      attribute_value_change.old_value_codebook_item.deleted or not attribute_value_change.old_value_codebook_item.published or
+                      attribute_value_change.old_value_codebook_item.codebook.deleted or not attribute_value_change.old_value_codebook_item.codebook.published)) or (
+                      attribute_value_change.new_value_codebook_item is not None and (
+                      attribute_value_change.new_value_codebook_item.deleted or not attribute_value_change.new_value_codebook_item.published or
+                      attribute_value_change.new_value_codebook_item.codebook.deleted or not attribute_value_change.new_value_codebook_item.codebook.published))
+        if not ret and attribute_value_change.entity_entity is not None:
+            if visible_entity_entity_ids is not None:
+                ret = attribute_value_change.entity_entity_id not in visible_entity_entity_ids
+            else:
+                ret = not attribute_value_change.entity_entity.entity_entity_collections.filter(
+                    deleted=False, published=True, collection__deleted=False, collection__published=True,
+                    collection__source__deleted=False, collection__source__published=True).exists()
+        return ret
 
     def q_add_attribute_value_change(self, attribute_value_change, overwrite=False):
         es_db = ElasticsearchDB.get_db()
@@ -3340,30 +3540,7 @@ class ElasticsearchDB(BaseDatabase):
     def add_attribute_value_change(self, attribute_value_change, overwrite=False):
         if attribute_value_change is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
             es = self.get_elasticsearch()
-            delete = attribute_value_change.deleted or not attribute_value_change.published or \
-                     attribute_value_change.attribute.finally_deleted or not attribute_value_change.attribute.finally_published or \
-                     attribute_value_change.changeset.deleted or not attribute_value_change.changeset.published or \
-                     attribute_value_change.changeset.collection.deleted or not attribute_value_change.changeset.collection.published or \
-                     attribute_value_change.changeset.collection.source.deleted or not attribute_value_change.changeset.collection.source.published or (
-                             attribute_value_change.entity is not None and (
-                             attribute_value_change.entity.deleted or not attribute_value_change.entity.published)) or (
-                             attribute_value_change.entity_entity is not None and (
-                             attribute_value_change.entity_entity.deleted or not attribute_value_change.entity_entity.published or
-                             attribute_value_change.entity_entity.entity_a.deleted or not attribute_value_change.entity_entity.entity_a.published or
-                             attribute_value_change.entity_entity.entity_b.deleted or not attribute_value_change.entity_entity.entity_b.published)) or (
-                             attribute_value_change.old_value_codebook_item is not None and (
-                             attribute_value_change.old_value_codebook_item.deleted or not attribute_value_change.old_value_codebook_item.published or
-                             attribute_value_change.old_value_codebook_item.codebook.deleted or not attribute_value_change.old_value_codebook_item.codebook.published)) or (
-                             attribute_value_change.new_value_codebook_item is not None and (
-                             attribute_value_change.new_value_codebook_item.deleted or not attribute_value_change.new_value_codebook_item.published or
-                             attribute_value_change.new_value_codebook_item.codebook.deleted or not attribute_value_change.new_value_codebook_item.codebook.published))
-            if not delete and attribute_value_change.entity_entity is not None:
-                delete = not attribute_value_change.entity_entity.entity_entity_collections.filter(deleted=False,
-                                                                                                   published=True,
-                                                                                                   collection__deleted=False,
-                                                                                                   collection__published=True,
-                                                                                                   collection__source__deleted=False,
-                                                                                                   collection__source__published=True).exists()
+            delete = ElasticsearchDB._is_attribute_value_change_to_delete(attribute_value_change)
             if delete:
                 self.delete_attribute_value_change(attribute_value_change=attribute_value_change)
             else:
@@ -3373,11 +3550,8 @@ class ElasticsearchDB(BaseDatabase):
                         doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=attribute_value_change.id):
                     body = ElasticsearchDB._get_elasticsearch_attribute_value_change_to_index(
                         attribute_value_change=attribute_value_change)
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=attribute_value_change.id,
-                        body=body)
+                    self._index_document(index=const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME,
+                                         id=attribute_value_change.id, body=body)
 
     def q_update_attribute_value_change(self, attribute_value_change):
         es_db = ElasticsearchDB.get_db()
@@ -3394,14 +3568,28 @@ class ElasticsearchDB(BaseDatabase):
 
     def delete_attribute_value_change(self, attribute_value_change):
         if attribute_value_change is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=attribute_value_change.id)
-            except NotFoundError:
-                pass
+            self._delete_document(index=const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME,
+                                  id=attribute_value_change.id)
+
+    @staticmethod
+    def _is_entity_entity_change_to_delete(entity_entity_change, visible_entity_entity_ids=None):
+        ret = entity_entity_change.deleted or not entity_entity_change.published or \
+              entity_entity_change.changeset.deleted or not entity_entity_change.changeset.published or \
+              entity_entity_change.changeset.collection.deleted or not entity_entity_change.changeset.collection.published or \
+              entity_entity_change.changeset.collection.source.deleted or not entity_entity_change.changeset.collection.source.published or \
+              (
+                      entity_entity_change.entity_entity is not None and (
+                      entity_entity_change.entity_entity.deleted or not entity_entity_change.entity_entity.published or
+                      entity_entity_change.entity_entity.entity_a.deleted or not entity_entity_change.entity_entity.entity_a.published or
+                      entity_entity_change.entity_entity.entity_b.deleted or not entity_entity_change.entity_entity.entity_b.published))
+        if not ret:
+            if visible_entity_entity_ids is not None:
+                ret = entity_entity_change.entity_entity_id not in visible_entity_entity_ids
+            else:
+                ret = not entity_entity_change.entity_entity.entity_entity_collections.filter(
+                    deleted=False, published=True, collection__deleted=False, collection__published=True,
+                    collection__source__deleted=False, collection__source__published=True).exists()
+        return ret
 
     def q_add_entity_entity_change(self, entity_entity_change, overwrite=False):
         es_db = ElasticsearchDB.get_db()
@@ -3412,22 +3600,7 @@ class ElasticsearchDB(BaseDatabase):
     def add_entity_entity_change(self, entity_entity_change, overwrite=False):
         if entity_entity_change is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
             es = self.get_elasticsearch()
-            delete = entity_entity_change.deleted or not entity_entity_change.published or \
-                     entity_entity_change.changeset.deleted or not entity_entity_change.changeset.published or \
-                     entity_entity_change.changeset.collection.deleted or not entity_entity_change.changeset.collection.published or \
-                     entity_entity_change.changeset.collection.source.deleted or not entity_entity_change.changeset.collection.source.published or \
-                     (
-                             entity_entity_change.entity_entity is not None and (
-                             entity_entity_change.entity_entity.deleted or not entity_entity_change.entity_entity.published or
-                             entity_entity_change.entity_entity.entity_a.deleted or not entity_entity_change.entity_entity.entity_a.published or
-                             entity_entity_change.entity_entity.entity_b.deleted or not entity_entity_change.entity_entity.entity_b.published))
-            if not delete:
-                delete = not entity_entity_change.entity_entity.entity_entity_collections.filter(deleted=False,
-                                                                                                 published=True,
-                                                                                                 collection__deleted=False,
-                                                                                                 collection__published=True,
-                                                                                                 collection__source__deleted=False,
-                                                                                                 collection__source__published=True).exists()
+            delete = ElasticsearchDB._is_entity_entity_change_to_delete(entity_entity_change)
             if delete:
                 self.delete_entity_entity_change(entity_entity_change=entity_entity_change)
             else:
@@ -3437,11 +3610,8 @@ class ElasticsearchDB(BaseDatabase):
                         doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity_change.id):
                     body = ElasticsearchDB._get_elasticsearch_entity_entity_change_to_index(
                         entity_entity_change=entity_entity_change)
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity_change.id,
-                        body=body)
+                    self._index_document(index=const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME,
+                                         id=entity_entity_change.id, body=body)
 
     def q_update_entity_entity_change(self, entity_entity_change):
         es_db = ElasticsearchDB.get_db()
@@ -3458,14 +3628,7 @@ class ElasticsearchDB(BaseDatabase):
 
     def delete_entity_entity_change(self, entity_entity_change):
         if entity_entity_change is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
-            es = self.get_elasticsearch()
-            try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=entity_entity_change.id)
-            except NotFoundError:
-                pass
+            self._delete_document(index=const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME, id=entity_entity_change.id)
 
     def q_add_codebook_value(self, codebook_value, overwrite=False):
         es_db = ElasticsearchDB.get_db()
@@ -3482,11 +3645,8 @@ class ElasticsearchDB(BaseDatabase):
                         index=ElasticsearchDB.get_elasticsearch_index_name(const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME),
                         doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=codebook_value.id):
                     body = ElasticsearchDB._get_elasticsearch_codebook_value_to_index(codebook_value=codebook_value)
-                    es.index(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=codebook_value.id,
-                        body=body)
+                    self._index_document(index=const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME, id=codebook_value.id,
+                                         body=body)
 
     def q_update_codebook_value(self, codebook_value):
         es_db = ElasticsearchDB.get_db()
@@ -3503,14 +3663,171 @@ class ElasticsearchDB(BaseDatabase):
 
     def delete_codebook_value(self, codebook_value):
         if codebook_value is not None and ElasticsearchDB.is_elasticsearch_settings_exists():
+            self._delete_document(index=const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME, id=codebook_value.id)
+
+    @staticmethod
+    def _get_bulk_action(index, id, body=None, overwrite=True):
+        ret = {
+            '_index': ElasticsearchDB.get_elasticsearch_index_name(index),
+            '_type': ElasticsearchDB.get_elasticsearch_doc_type(),
+            '_id': id,
+        }
+        if body is None:
+            ret['_op_type'] = 'delete'
+        else:
+            ret['_op_type'] = 'index' if overwrite else 'create'
+            ret['_source'] = body
+        return ret
+
+    @staticmethod
+    def get_entities_bulk_actions(entities, overwrite=False, add_connections=True, connections_by_entity_a=False,
+                                  attributes=None):
+        entities = list(entities)
+        if entities:
+            if attributes is None:
+                attributes = AttributeValuesPrefetch.get_attributes()
+            bodies = ElasticsearchDB._get_elasticsearch_entities_to_index(entities, attributes=attributes)
+            counts, all_counts = ElasticsearchDB._get_elasticsearch_entities_stored_connection_type_category_counts_to_index(
+                entities)
+            for entity in entities:
+                if entity.deleted or not entity.published:
+                    yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME,
+                                                           id=entity.public_id)
+                else:
+                    body = dict(bodies[entity.id])
+                    body.update(counts[entity.id])
+                    yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ENTITIES_INDEX_NAME,
+                                                           id=entity.public_id, body=body, overwrite=overwrite)
+                body = dict(bodies[entity.id])
+                body.update(all_counts[entity.id])
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME,
+                                                       id=entity.public_id, body=body, overwrite=overwrite)
+
+            if add_connections:
+                q = Q(entity_a__in=entities)
+                if not connections_by_entity_a:
+                    q = q | Q(entity_b__in=entities)
+                entity_entities = list(models.StageEntityEntity.objects.filter(q).order_by('id'))
+                for i in range(0, len(entity_entities), 1000):
+                    yield from ElasticsearchDB.get_connections_bulk_actions(
+                        entity_entities=entity_entities[i:i + 1000], overwrite=overwrite, attributes=attributes)
+
+    @staticmethod
+    def get_connections_bulk_actions(entity_entities, overwrite=False, attributes=None):
+        entity_entities = list(entity_entities)
+        if entity_entities:
+            ElasticsearchDB._load_connections_related(entity_entities)
+            visible, published, not_deleted = ElasticsearchDB._get_entity_entity_collections_states(
+                [entity_entity.id for entity_entity in entity_entities])
+            bodies = ElasticsearchDB._get_elasticsearch_connections_to_index(entity_entities, attributes=attributes)
+            for entity_entity in entity_entities:
+                if entity_entity.deleted or not entity_entity.published or entity_entity.entity_a.deleted or not entity_entity.entity_a.published or entity_entity.entity_b.deleted or not entity_entity.entity_b.published or entity_entity.id not in visible:
+                    yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME,
+                                                           id=entity_entity.id)
+                else:
+                    yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME,
+                                                           id=entity_entity.id, body=bodies[entity_entity.id],
+                                                           overwrite=overwrite)
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME,
+                                                       id=entity_entity.id, body=bodies[entity_entity.id],
+                                                       overwrite=overwrite)
+
+    @staticmethod
+    def get_attributes_bulk_actions(attributes, overwrite=False):
+        for attribute in attributes:
+            root_attribute = helpers.get_root_attribute(attribute)
+            if root_attribute.finally_deleted or not root_attribute.finally_published:
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME,
+                                                       id=root_attribute.string_id)
+            else:
+                yield ElasticsearchDB._get_bulk_action(
+                    index=const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME, id=root_attribute.string_id,
+                    body=ElasticsearchDB._get_elasticsearch_attribute_to_index(attribute=root_attribute),
+                    overwrite=overwrite)
+
+    @staticmethod
+    def get_connection_types_bulk_actions(connection_types, overwrite=False):
+        for connection_type in connection_types:
+            yield ElasticsearchDB._get_bulk_action(
+                index=const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME, id=connection_type.string_id,
+                body=ElasticsearchDB._get_elasticsearch_connection_type_to_index(connection_type=connection_type),
+                overwrite=overwrite)
+
+    @staticmethod
+    def get_attribute_value_changes_bulk_actions(attribute_value_changes, overwrite=False):
+        attribute_value_changes = list(attribute_value_changes)
+        visible, published, not_deleted = ElasticsearchDB._get_entity_entity_collections_states(
+            set([attribute_value_change.entity_entity_id for attribute_value_change in attribute_value_changes if
+                 attribute_value_change.entity_entity_id is not None]))
+        for attribute_value_change in attribute_value_changes:
+            if ElasticsearchDB._is_attribute_value_change_to_delete(attribute_value_change,
+                                                                    visible_entity_entity_ids=visible):
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME,
+                                                       id=attribute_value_change.id)
+            else:
+                yield ElasticsearchDB._get_bulk_action(
+                    index=const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME, id=attribute_value_change.id,
+                    body=ElasticsearchDB._get_elasticsearch_attribute_value_change_to_index(
+                        attribute_value_change=attribute_value_change), overwrite=overwrite)
+
+    @staticmethod
+    def get_entity_entity_changes_bulk_actions(entity_entity_changes, overwrite=False):
+        entity_entity_changes = list(entity_entity_changes)
+        visible, published, not_deleted = ElasticsearchDB._get_entity_entity_collections_states(
+            set([entity_entity_change.entity_entity_id for entity_entity_change in entity_entity_changes]))
+        for entity_entity_change in entity_entity_changes:
+            if ElasticsearchDB._is_entity_entity_change_to_delete(entity_entity_change,
+                                                                  visible_entity_entity_ids=visible):
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME,
+                                                       id=entity_entity_change.id)
+            else:
+                yield ElasticsearchDB._get_bulk_action(
+                    index=const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME, id=entity_entity_change.id,
+                    body=ElasticsearchDB._get_elasticsearch_entity_entity_change_to_index(
+                        entity_entity_change=entity_entity_change), overwrite=overwrite)
+
+    @staticmethod
+    def get_codebook_values_bulk_actions(codebook_values, overwrite=False):
+        for codebook_value in codebook_values:
+            if codebook_value.deleted or not codebook_value.published or codebook_value.codebook.deleted or not codebook_value.codebook.published:
+                yield ElasticsearchDB._get_bulk_action(index=const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME,
+                                                       id=codebook_value.id)
+            else:
+                yield ElasticsearchDB._get_bulk_action(
+                    index=const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME, id=codebook_value.id,
+                    body=ElasticsearchDB._get_elasticsearch_codebook_value_to_index(codebook_value=codebook_value),
+                    overwrite=overwrite)
+
+    def bulk(self, actions, chunk_size=500, thread_count=1, max_errors=None, callback=None):
+        ret = {
+            'success': 0,
+            'skipped': 0,
+            'failed': 0,
+            'errors': [],
+        }
+        if ElasticsearchDB.is_elasticsearch_settings_exists():
             es = self.get_elasticsearch()
-            try:
-                es.delete(
-                    index=ElasticsearchDB.get_elasticsearch_index_name(
-                        const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME),
-                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), id=codebook_value.id)
-            except NotFoundError:
-                pass
+            if thread_count > 1:
+                results = elasticsearch_helpers.parallel_bulk(es, actions, thread_count=thread_count,
+                                                              chunk_size=chunk_size, queue_size=thread_count,
+                                                              raise_on_error=False, raise_on_exception=False)
+            else:
+                results = elasticsearch_helpers.streaming_bulk(es, actions, chunk_size=chunk_size,
+                                                               raise_on_error=False, raise_on_exception=False)
+            for ok, item in results:
+                op_type, result = next(iter(item.items()))
+                if ok:
+                    ret['success'] += 1
+                elif (op_type == 'delete' and result.get('status') == 404) or (
+                        op_type == 'create' and result.get('status') == 409):
+                    ret['skipped'] += 1
+                else:
+                    ret['failed'] += 1
+                    if max_errors is None or len(ret['errors']) < max_errors:
+                        ret['errors'].append(item)
+                if callback is not None:
+                    callback(ret['success'] + ret['skipped'] + ret['failed'])
+        return ret
 
 
 class Neo4jDB(BaseDatabase):
@@ -3518,9 +3835,63 @@ class Neo4jDB(BaseDatabase):
         'TYPE': 'bolt',
         'HOST': '127.0.0.1',
         'PORT': '7687',
+
+        'MAX_CONNECTION_POOL_SIZE': 50,
+        'CONNECTION_ACQUISITION_TIMEOUT': 60,
+        'MAX_CONNECTION_LIFETIME': 3600,
+
+        'GRAPH_MODEL': 'node',
     }
 
-    neo4j = None
+    const.NEO4J_GRAPH_MODEL_NODE = 'node'
+    const.NEO4J_GRAPH_MODEL_NATIVE = 'native'
+
+    const.NEO4J_IMPORT_ARRAY_DELIMITER = ';'
+    const.NEO4J_IMPORT_NODES_HEADER = [
+        ('public_id', 'public_id:ID(node)'),
+        ('is_pep', 'is_pep:boolean'),
+        ('entity_type_string_id', 'entity_type_string_id'),
+        ('entity_type_name', 'entity_type_name'),
+        ('published', 'published:boolean'),
+        ('deleted', 'deleted:boolean'),
+        ('name', 'name'),
+        ('legal_entity_type_id', 'legal_entity_type_id:long[]'),
+        ('legal_entity_type_value', 'legal_entity_type_value:string[]'),
+    ]
+    const.NEO4J_IMPORT_RELATIONSHIPS_HEADER = [
+        ('id', ':ID(relationship)'),
+        ('id', 'id:long'),
+        ('connection_type_string_id', 'connection_type_string_id'),
+        ('connection_type_name', 'connection_type_name'),
+        ('connection_type_reverse_name', 'connection_type_reverse_name'),
+        ('connection_type_category_string_id', 'connection_type_category_string_id'),
+        ('connection_type_category_name', 'connection_type_category_name'),
+        ('valid_from', 'valid_from'),
+        ('valid_to', 'valid_to'),
+        ('transaction_amount', 'transaction_amount:double'),
+        ('transaction_date', 'transaction_date'),
+        ('transaction_currency_code', 'transaction_currency_code'),
+        ('transaction_currency_sign', 'transaction_currency_sign'),
+        ('transaction_currency_sign_before_value', 'transaction_currency_sign_before_value:boolean'),
+        ('published', 'published:boolean'),
+        ('deleted', 'deleted:boolean'),
+        ('entity_a_public_id', 'entity_a_public_id'),
+        ('entity_a_is_pep', 'entity_a_is_pep:boolean'),
+        ('entity_a_entity_type_string_id', 'entity_a_entity_type_string_id'),
+        ('entity_a_published', 'entity_a_published:boolean'),
+        ('entity_a_deleted', 'entity_a_deleted:boolean'),
+        ('entity_a_legal_entity_type_id', 'entity_a_legal_entity_type_id:long[]'),
+        ('entity_b_public_id', 'entity_b_public_id'),
+        ('entity_b_is_pep', 'entity_b_is_pep:boolean'),
+        ('entity_b_entity_type_string_id', 'entity_b_entity_type_string_id'),
+        ('entity_b_published', 'entity_b_published:boolean'),
+        ('entity_b_deleted', 'entity_b_deleted:boolean'),
+        ('entity_b_legal_entity_type_id', 'entity_b_legal_entity_type_id:long[]'),
+    ]
+
+    _driver = None
+    _driver_pid = None
+    _driver_lock = threading.Lock()
 
     @staticmethod
     def get_db():
@@ -3576,164 +3947,203 @@ class Neo4jDB(BaseDatabase):
         ret = ret + Neo4jDB._get_neo4j_setting('HOST') + ':' + Neo4jDB._get_neo4j_setting('PORT')
         return ret
 
+    @staticmethod
+    def get_neo4j_driver():
+        pid = os.getpid()
+        if Neo4jDB._driver_pid != pid:
+            Neo4jDB._driver = None
+            Neo4jDB._driver_pid = pid
+            Neo4jDB._driver_lock = threading.Lock()
+        if Neo4jDB._driver is None:
+            with Neo4jDB._driver_lock:
+                if Neo4jDB._driver is None:
+                    Neo4jDB._driver = GraphDatabase.driver(
+                        Neo4jDB._get_neo4j_connection_strings(),
+                        auth=(Neo4jDB._get_neo4j_setting('USER'), Neo4jDB._get_neo4j_setting('PASSWORD')),
+                        max_connection_pool_size=Neo4jDB._get_neo4j_setting('MAX_CONNECTION_POOL_SIZE'),
+                        connection_acquisition_timeout=Neo4jDB._get_neo4j_setting('CONNECTION_ACQUISITION_TIMEOUT'),
+                        max_connection_lifetime=Neo4jDB._get_neo4j_setting('MAX_CONNECTION_LIFETIME'))
+        return Neo4jDB._driver
+
     def get_neo4j(self):
-        if self.neo4j is None:
-            self.neo4j = GraphDatabase.driver(Neo4jDB._get_neo4j_connection_strings(), auth=(
-                Neo4jDB._get_neo4j_setting('USER'), Neo4jDB._get_neo4j_setting('PASSWORD')))
-        return self.neo4j
+        return Neo4jDB.get_neo4j_driver()
 
     @staticmethod
-    def _get_neo4j_entity_to_index(entity):
-        ret = {
-            'public_id': entity.public_id,
-            'is_pep': BaseDatabase._is_pep(entity=entity),
-            'entity_type_string_id': entity.entity_type.string_id,
-            'entity_type_name': entity.entity_type.name,
-            'published': entity.published,
-            'deleted': entity.deleted
-        }
+    def is_neo4j_native_graph_model():
+        return Neo4jDB._get_neo4j_setting('GRAPH_MODEL') == const.NEO4J_GRAPH_MODEL_NATIVE
 
-        entity_first_name = ''
-        entity_second_name = ''
-        entity_name = ''
-        entity_legal_entity_entity_type_ids = set()
-        entity_legal_entity_entity_type_values = set()
-        for attribute_value in entity.attribute_values.filter(
-                Q(attribute__finally_deleted=False, attribute__finally_published=True,
-                  attribute_value_collections__deleted=False,
-                  attribute_value_collections__published=True,
-                  attribute_value_collections__collection__deleted=False,
-                  attribute_value_collections__collection__published=True,
-                  attribute_value_collections__collection__source__deleted=False,
-                  attribute_value_collections__collection__source__published=True
-                  ) & (
-                        Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
-                                                        value_codebook_item__published=True,
-                                                        value_codebook_item__codebook__deleted=False,
-                                                        value_codebook_item__codebook__published=True)) & (
-                        Q(attribute__string_id='person_first_name') | Q(
-                    attribute__string_id='person_last_name') | Q(
-                    attribute__string_id='legal_entity_name') | Q(
-                    attribute__string_id='legal_entity_entity_type') | Q(
-                    attribute__string_id='real_estate_name') | Q(attribute__string_id='movable_name') | Q(
-                    attribute__string_id='savings_name'))).distinct():
-            if attribute_value.attribute.string_id == 'person_first_name':
-                entity_first_name = entity_first_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'person_last_name':
-                entity_second_name = entity_second_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'legal_entity_name':
-                entity_name = entity_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'legal_entity_entity_type':
-                entity_legal_entity_entity_type_ids.add(attribute_value.get_raw_first_value().id)
-                entity_legal_entity_entity_type_values.add(attribute_value.get_raw_first_value().value)
-            elif attribute_value.attribute.string_id == 'real_estate_name':
-                entity_name = entity_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'movable_name':
-                entity_name = entity_name + ' ' + attribute_value.get_raw_first_value()
-            elif attribute_value.attribute.string_id == 'savings_name':
-                entity_name = entity_name + ' ' + attribute_value.get_raw_first_value()
-        if entity_name == '':
-            entity_name = entity_first_name.strip() + ' ' + entity_second_name.strip()
-        entity_name = entity_name.strip()
+    @staticmethod
+    def get_neo4j_connection_pattern(entity_a='entity_a', r='r', entity_b='entity_b', directed=True):
+        arrow = '->' if directed else '-'
+        if Neo4jDB.is_neo4j_native_graph_model():
+            return '(' + entity_a + ':node)-[' + r + ':connection]' + arrow + '(' + entity_b + ':node)'
+        return '(' + entity_a + ':node)-[:relationship]' + arrow + '(' + r + ':relationship)-[:relationship]' + arrow + '(' + entity_b + ':node)'
 
-        ret.update({
-            'name': entity_name
-        })
-        if entity.entity_type.string_id == 'legal_entity':
-            ret.update({
-                'legal_entity_type_id': list(entity_legal_entity_entity_type_ids),
-                'legal_entity_type_value': list(entity_legal_entity_entity_type_values)
-            })
+    @staticmethod
+    def _get_neo4j_legal_entity_type(entity_summary):
+        ids = []
+        values = []
+        for item in entity_summary['legal_entity_type'] or []:
+            item_id = item[const.ELASTICSEARCH_VALUE_FIELD_NAME + const.ELASTICSEARCH_CODEBOOK_ITEM_ID_FIELD_SUFIX]
+            if item_id not in ids:
+                ids.append(item_id)
+                values.append(item[const.ELASTICSEARCH_VALUE_FIELD_NAME])
+        return ids, values
 
+    @staticmethod
+    def _get_neo4j_entities_to_index(entities, entities_summaries=None):
+        ret = {}
+        if entities_summaries is None:
+            entities_summaries = ElasticsearchDB._get_elasticsearch_entities_summaries(entities)
+        for entity in entities:
+            entity_summary = entities_summaries[entity.id]
+            ret[entity.id] = {
+                'public_id': entity.public_id,
+                'is_pep': entity_summary['is_pep'],
+                'entity_type_string_id': entity.entity_type.string_id,
+                'entity_type_name': entity.entity_type.name,
+                'published': entity.published,
+                'deleted': entity.deleted,
+                'name': entity_summary['name'],
+            }
+            if entity.entity_type.string_id == 'legal_entity':
+                legal_entity_type_ids, legal_entity_type_values = Neo4jDB._get_neo4j_legal_entity_type(entity_summary)
+                ret[entity.id].update({
+                    'legal_entity_type_id': legal_entity_type_ids,
+                    'legal_entity_type_value': legal_entity_type_values
+                })
         return ret
 
     @staticmethod
-    def _get_neo4j_connection_to_index(entity_entity):
-        currency_code = None
-        currency_sign = None
-        currency_sign_before_value = None
-        if entity_entity.transaction_currency is not None:
-            currency_code = entity_entity.transaction_currency.code
-            currency_sign = entity_entity.transaction_currency.sign
-            currency_sign_before_value = entity_entity.transaction_currency.sign_before_value
-        ret = {
-            'id': entity_entity.id,
-            'connection_type_string_id': entity_entity.connection_type.string_id,
-            'connection_type_name': entity_entity.connection_type.name,
-            'connection_type_reverse_name': entity_entity.connection_type.reverse_name,
-            'connection_type_category_string_id': entity_entity.connection_type.category.string_id,
-            'connection_type_category_name': entity_entity.connection_type.category.name,
-            'valid_from': None if entity_entity.valid_from is None else entity_entity.valid_from.isoformat(),
-            'valid_to': None if entity_entity.valid_to is None else entity_entity.valid_to.isoformat(),
-            'transaction_amount': None if entity_entity.transaction_amount is None else float(
-                entity_entity.transaction_amount),
-            'transaction_date': None if entity_entity.transaction_date is None else entity_entity.transaction_date.isoformat(),
-            'transaction_currency_code': currency_code,
-            'transaction_currency_sign': currency_sign,
-            'transaction_currency_sign_before_value': currency_sign_before_value,
-            'published': entity_entity.published and entity_entity.entity_a.published and entity_entity.entity_b.published and entity_entity.entity_entity_collections.filter(
-                published=True, collection__published=True, collection__source__published=True).exists(),
-            'deleted': entity_entity.deleted or entity_entity.entity_a.deleted or entity_entity.entity_b.deleted or not entity_entity.entity_entity_collections.filter(
-                deleted=False, collection__deleted=False, collection__source__deleted=False).exists(),
-
-            'entity_a_public_id': entity_entity.entity_a.public_id,
-            'entity_a_is_pep': BaseDatabase._is_pep(entity=entity_entity.entity_a),
-            'entity_a_entity_type_string_id': entity_entity.entity_a.entity_type.string_id,
-            'entity_a_published': entity_entity.entity_a.published,
-            'entity_a_deleted': entity_entity.entity_a.deleted,
-
-            'entity_b_public_id': entity_entity.entity_b.public_id,
-            'entity_b_is_pep': BaseDatabase._is_pep(entity=entity_entity.entity_b),
-            'entity_b_entity_type_string_id': entity_entity.entity_b.entity_type.string_id,
-            'entity_b_published': entity_entity.entity_b.published,
-            'entity_b_deleted': entity_entity.entity_b.deleted,
-        }
+    def _get_neo4j_entity_to_index(entity):
+        return Neo4jDB._get_neo4j_entities_to_index([entity])[entity.id]
 
-        if entity_entity.entity_a.entity_type.string_id == 'legal_entity':
-            entity_legal_entity_entity_type_ids = set()
-            for attribute_value in entity_entity.entity_a.attribute_values.filter(
-                    Q(attribute__finally_deleted=False, attribute__finally_published=True,
-                      attribute_value_collections__deleted=False,
-                      attribute_value_collections__published=True,
-                      attribute_value_collections__collection__deleted=False,
-                      attribute_value_collections__collection__published=True,
-                      attribute_value_collections__collection__source__deleted=False,
-                      attribute_value_collections__collection__source__published=True,
-                      attribute__string_id='legal_entity_entity_type'
-                      ) & (
-                            ~Q(value_codebook_item=None) & Q(value_codebook_item__deleted=False,
-                                                            value_codebook_item__published=True,
-                                                            value_codebook_item__codebook__deleted=False,
-                                                            value_codebook_item__codebook__published=True))).distinct():
-                entity_legal_entity_entity_type_ids.add(attribute_value.get_raw_first_value().id)
+    @staticmethod
+    def _get_neo4j_connections_to_index(entity_entities, collections_states=None):
+        ret = {}
+        ElasticsearchDB._load_connections_related(entity_entities)
+        if collections_states is None:
+            collections_states = ElasticsearchDB._get_entity_entity_collections_states(
+                [entity_entity.id for entity_entity in entity_entities])
+        visible, published, not_deleted = collections_states
+        entities_summaries = ElasticsearchDB._get_elasticsearch_entities_summaries(list(
+            {entity.id: entity for entity_entity in entity_entities for entity in
+             (entity_entity.entity_a, entity_entity.entity_b)}.values()))
+        for entity_entity in entity_entities:
+            currency_code = None
+            currency_sign = None
+            currency_sign_before_value = None
+            if entity_entity.transaction_currency is not None:
+                currency_code = entity_entity.transaction_currency.code
+                currency_sign = entity_entity.transaction_currency.sign
+                currency_sign_before_value = entity_entity.transaction_currency.sign_before_value
+            properties = {
+                'id': entity_entity.id,
+                'connection_type_string_id': entity_entity.connection_type.string_id,
+                'connection_type_name': entity_entity.connection_type.name,
+                'connection_type_reverse_name': entity_entity.connection_type.reverse_name,
+                'connection_type_category_string_id': entity_entity.connection_type.category.string_id,
+                'connection_type_category_name': entity_entity.connection_type.category.name,
+                'valid_from': None if entity_entity.valid_from is None else entity_entity.valid_from.isoformat(),
+                'valid_to': None if entity_entity.valid_to is None else entity_entity.valid_to.isoformat(),
+                'transaction_amount': None if entity_entity.transaction_amount is None else float(
+                    entity_entity.transaction_amount),
+                'transaction_date': None if entity_entity.transaction_date is None else entity_entity.transaction_date.isoformat(),
+                'transaction_currency_code': currency_code,
+                'transaction_currency_sign': currency_sign,
+                'transaction_currency_sign_before_value': currency_sign_before_value,
+                'published': entity_entity.published and entity_entity.entity_a.published and entity_entity.entity_b.published and entity_entity.id in published,
+                'deleted': entity_entity.deleted or entity_entity.entity_a.deleted or entity_entity.entity_b.deleted or entity_entity.id not in not_deleted,
+            }
+            for prefix, entity in (('entity_a_', entity_entity.entity_a), ('entity_b_', entity_entity.entity_b)):
+                properties.update({
+                    prefix + 'public_id': entity.public_id,
+                    prefix + 'is_pep': entities_summaries[entity.id]['is_pep'],
+                    prefix + 'entity_type_string_id': entity.entity_type.string_id,
+                    prefix + 'published': entity.published,
+                    prefix + 'deleted': entity.deleted,
+                })
+                if entity.entity_type.string_id == 'legal_entity':
+                    properties.update({
+                        prefix + 'legal_entity_type_id': Neo4jDB._get_neo4j_legal_entity_type(
+                            entities_summaries[entity.id])[0],
+                    })
+            ret[entity_entity.id] = properties
+        return ret
 
-            ret.update({
-                'entity_a_legal_entity_type_id': list(entity_legal_entity_entity_type_ids),
+    @staticmethod
+    def _get_neo4j_connection_to_index(entity_entity):
+        return Neo4jDB._get_neo4j_connections_to_index([entity_entity])[entity_entity.id]
+
+    @staticmethod
+    def _get_neo4j_connections_to_write(entity_entities):
+        ret = []
+        entity_entities = list(entity_entities)
+        collections_states = ElasticsearchDB._get_entity_entity_collections_states(
+            [entity_entity.id for entity_entity in entity_entities])
+        visible = collections_states[0]
+        properties = Neo4jDB._get_neo4j_connections_to_index(entity_entities=entity_entities,
+                                                             collections_states=collections_states)
+        for entity_entity in entity_entities:
+            ret.append({
+                'entity_entity_id': entity_entity.id,
+                'entity_a_public_id': entity_entity.entity_a.public_id,
+                'entity_b_public_id': entity_entity.entity_b.public_id,
+                'properties': None if (
+                        entity_entity.deleted or not entity_entity.published or entity_entity.entity_a.deleted or not entity_entity.entity_a.published or entity_entity.entity_b.deleted or not entity_entity.entity_b.published or entity_entity.id not in visible) else
+                properties[entity_entity.id],
             })
+        return ret
 
-        if entity_entity.entity_b.entity_type.string_id == 'legal_entity':
-            entity_legal_entity_entity_type_ids = set()
-            for attribute_value in entity_entity.entity_b.attribute_values.filter(
-                    Q(attribute__finally_deleted=False, attribute__finally_published=True,
-                      attribute_value_collections__deleted=False,
-                      attribute_value_collections__published=True,
-                      attribute_value_collections__collection__deleted=False,
-                      attribute_value_collections__collection__published=True,
-                      attribute_value_collections__collection__source__deleted=False,
-                      attribute_value_collections__collection__source__published=True,
-                      attribute__string_id='legal_entity_entity_type'
-                      ) & (
-                            ~Q(value_codebook_item=None) & Q(value_codebook_item__deleted=False,
-                                                            value_codebook_item__published=True,
-                                                            value_codebook_item__codebook__deleted=False,
-                                                            value_codebook_item__codebook__published=True))).distinct():
-                entity_legal_entity_entity_type_ids.add(attribute_value.get_raw_first_value().id)
+    @staticmethod
+    def _get_neo4j_import_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (list, tuple, set)):
+            return const.NEO4J_IMPORT_ARRAY_DELIMITER.join(
+                str(item).replace(const.NEO4J_IMPORT_ARRAY_DELIMITER, ' ') for item in value)
+        return value
 
-            ret.update({
-                'entity_b_legal_entity_type_id': list(entity_legal_entity_entity_type_ids),
-            })
+    @staticmethod
+    def get_neo4j_import_nodes_header():
+        return [column for key, column in const.NEO4J_IMPORT_NODES_HEADER] + [':LABEL']
 
-        return ret
+    @staticmethod
+    def get_neo4j_import_node_rows(entities):
+        properties = Neo4jDB._get_neo4j_entities_to_index(entities)
+        return [Neo4jDB.get_neo4j_import_node_row(properties=properties[entity.id]) for entity in entities]
+
+    @staticmethod
+    def get_neo4j_import_node_row(properties):
+        return [Neo4jDB._get_neo4j_import_value(properties.get(key)) for key, column in
+                const.NEO4J_IMPORT_NODES_HEADER] + ['node']
+
+    @staticmethod
+    def get_neo4j_import_relationships_header():
+        return [column for key, column in const.NEO4J_IMPORT_RELATIONSHIPS_HEADER] + [':LABEL']
+
+    @staticmethod
+    def get_neo4j_import_relationship_row(properties):
+        return [Neo4jDB._get_neo4j_import_value(properties.get(key)) for key, column in
+                const.NEO4J_IMPORT_RELATIONSHIPS_HEADER] + ['relationship']
+
+    @staticmethod
+    def get_neo4j_import_connections_header():
+        return [':START_ID(node)', ':END_ID(node)', ':TYPE'] + [column for key, column in
+                                                                const.NEO4J_IMPORT_RELATIONSHIPS_HEADER if
+                                                                not column.startswith(':ID')]
+
+    @staticmethod
+    def get_neo4j_import_connection_row(properties):
+        return [properties['entity_a_public_id'], properties['entity_b_public_id'], 'connection'] + [
+            Neo4jDB._get_neo4j_import_value(properties.get(key)) for key, column in
+            const.NEO4J_IMPORT_RELATIONSHIPS_HEADER if not column.startswith(':ID')]
+
+    @staticmethod
+    def get_neo4j_import_edges_header(start, end):
+        return [':START_ID(' + start + ')', ':END_ID(' + end + ')', ':TYPE']
 
     def q_init(self, command=None):
         neo4j_db = Neo4jDB.get_db()
@@ -3751,6 +4161,7 @@ class Neo4jDB(BaseDatabase):
         with neo4j.session() as session:
             with session.begin_transaction() as tx:
                 tx.run('MATCH ()-[r:relationship]->() DELETE r')
+                tx.run('MATCH ()-[r:connection]->() DELETE r')
                 tx.run('MATCH (r:relationship) DELETE r')
                 tx.run('MATCH (n:node) DELETE n')
 
@@ -3759,10 +4170,15 @@ class Neo4jDB(BaseDatabase):
                 'All relationships and nodes deleted!'))
 
         with neo4j.session() as session:
+            for result in session.run('CALL db.constraints'):
+                description = result.value('description', None)
+                if description and (':node )' in description or ':relationship )' in description):
+                    session.run('DROP ' + description)
+
             results = session.run('CALL db.indexes')
             for result in results:
                 label = result.value('label', None)
-                if label in ['node', 'relationship']:
+                if label in ['node', 'relationship'] and 'unique' not in (result.value('type', None) or ''):
                     props = result.value('properties', None)
                     if props:
                         session.run('DROP INDEX ON :' + label + '(' + ','.join(p for p in props) + ')')
@@ -3770,78 +4186,185 @@ class Neo4jDB(BaseDatabase):
         if command is not None:
             command.stdout.write(command.style.SUCCESS('All indexes deleted!'))
 
+        self.create_indexes(command=command)
+
+    def create_indexes(self, command=None):
+        if not Neo4jDB.is_neo4j_settings_exists():
+            if command is not None:
+                command.stdout.write(command.style.ERROR('Neo4j not configured'))
+            return
+
+        neo4j = self.get_neo4j()
+
         with neo4j.session() as session:
-            session.run('CREATE INDEX ON :node(public_id)')
+            session.run('CREATE CONSTRAINT ON (n:node) ASSERT n.public_id IS UNIQUE')
             session.run('CREATE INDEX ON :node(entity_type_string_id)')
             session.run('CREATE INDEX ON :node(legal_entity_type_id)')
             session.run('CREATE INDEX ON :node(is_pep)')
             session.run('CREATE INDEX ON :node(published)')
             session.run('CREATE INDEX ON :node(deleted)')
 
-            session.run('CREATE INDEX ON :relationship(id)')
-            session.run('CREATE INDEX ON :relationship(connection_type_string_id)')
-            session.run('CREATE INDEX ON :relationship(connection_type_category_string_id)')
-            session.run('CREATE INDEX ON :relationship(valid_from)')
-            session.run('CREATE INDEX ON :relationship(valid_to)')
-            session.run('CREATE INDEX ON :relationship(transaction_amount)')
-            session.run('CREATE INDEX ON :relationship(transaction_date)')
-            session.run('CREATE INDEX ON :relationship(transaction_currency_code)')
-            session.run('CREATE INDEX ON :relationship(published)')
-            session.run('CREATE INDEX ON :relationship(deleted)')
-
-            session.run('CREATE INDEX ON :relationship(entity_a_public_id)')
-            session.run('CREATE INDEX ON :relationship(entity_a_is_pep)')
-            session.run('CREATE INDEX ON :relationship(entity_a_entity_type_string_id)')
-            session.run('CREATE INDEX ON :relationship(entity_a_published)')
-            session.run('CREATE INDEX ON :relationship(entity_a_deleted)')
-            session.run('CREATE INDEX ON :relationship(entity_a_legal_entity_type_id)')
-
-            session.run('CREATE INDEX ON :relationship(entity_b_public_id)')
-            session.run('CREATE INDEX ON :relationship(entity_b_is_pep)')
-            session.run('CREATE INDEX ON :relationship(entity_b_entity_type_string_id)')
-            session.run('CREATE INDEX ON :relationship(entity_b_published)')
-            session.run('CREATE INDEX ON :relationship(entity_b_deleted)')
-            session.run('CREATE INDEX ON :relationship(entity_b_legal_entity_type_id)')
+            if not Neo4jDB.is_neo4j_native_graph_model():
+                session.run('CREATE CONSTRAINT ON (r:relationship) ASSERT r.id IS UNIQUE')
+                session.run('CREATE INDEX ON :relationship(connection_type_string_id)')
+                session.run('CREATE INDEX ON :relationship(connection_type_category_string_id)')
+                session.run('CREATE INDEX ON :relationship(valid_from)')
+                session.run('CREATE INDEX ON :relationship(valid_to)')
+                session.run('CREATE INDEX ON :relationship(transaction_amount)')
+                session.run('CREATE INDEX ON :relationship(transaction_date)')
+                session.run('CREATE INDEX ON :relationship(transaction_currency_code)')
+                session.run('CREATE INDEX ON :relationship(published)')
+                session.run('CREATE INDEX ON :relationship(deleted)')
+
+                session.run('CREATE INDEX ON :relationship(entity_a_public_id)')
+                session.run('CREATE INDEX ON :relationship(entity_a_is_pep)')
+                session.run('CREATE INDEX ON :relationship(entity_a_entity_type_string_id)')
+                session.run('CREATE INDEX ON :relationship(entity_a_published)')
+                session.run('CREATE INDEX ON :relationship(entity_a_deleted)')
+                session.run('CREATE INDEX ON :relationship(entity_a_legal_entity_type_id)')
+
+                session.run('CREATE INDEX ON :relationship(entity_b_public_id)')
+                session.run('CREATE INDEX ON :relationship(entity_b_is_pep)')
+                session.run('CREATE INDEX ON :relationship(entity_b_entity_type_string_id)')
+                session.run('CREATE INDEX ON :relationship(entity_b_published)')
+                session.run('CREATE INDEX ON :relationship(entity_b_deleted)')
+                session.run('CREATE INDEX ON :relationship(entity_b_legal_entity_type_id)')
 
         if command is not None:
             command.stdout.write(command.style.SUCCESS('All indexes created!'))
 
-    def q_add_entity(self, entity, overwrite=False, add_connections=True):
+    def init_constraints(self, command=None):
+        if not Neo4jDB.is_neo4j_settings_exists():
+            if command is not None:
+                command.stdout.write(command.style.ERROR('Neo4j not configured'))
+            return
+
+        neo4j = self.get_neo4j()
+
+        with neo4j.session() as session:
+            labels = [('node', 'public_id')]
+            if not Neo4jDB.is_neo4j_native_graph_model():
+                labels.append(('relationship', 'id'))
+            for label, property_name in labels:
+                for result in session.run('CALL db.indexes'):
+                    if result.value('label', None) == label and result.value('properties', None) == [
+                            property_name] and 'unique' not in (result.value('type', None) or ''):
+                        session.run('DROP INDEX ON :' + label + '(' + property_name + ')')
+                session.run('CREATE CONSTRAINT ON (n:' + label + ') ASSERT n.' + property_name + ' IS UNIQUE')
+
+                if command is not None:
+                    command.stdout.write(command.style.SUCCESS(label + ':' + property_name + '\tunique constraint created'))
+
+    def q_add_entity(self, entity, overwrite=False, add_connections=True, depends_on=None):
         neo4j_db = Neo4jDB.get_db()
         queue = Neo4jDB._get_queue()
-        queue.enqueue(neo4j_db.add_entity, entity=entity, overwrite=overwrite, add_connections=add_connections, ttl=-1)
+        queue.enqueue(neo4j_db.add_entity, entity=entity, overwrite=overwrite, add_connections=add_connections,
+                      depends_on=depends_on, ttl=-1)
 
     def add_entity(self, entity, overwrite=False, add_connections=True):
         if entity is not None and Neo4jDB.is_neo4j_settings_exists():
-            neo4j = self.get_neo4j()
-            if entity.deleted or not entity.published:
-                self.delete_entity(entity=entity)
-            else:
-                with neo4j.session() as session:
-                    exists = session.run('MATCH (n:node { public_id: $public_id }) RETURN COUNT(*)',
-                                         public_id=entity.public_id).single().value() > 0
-                if overwrite and exists:
-                    properties = Neo4jDB._get_neo4j_entity_to_index(entity)
-                    with neo4j.session() as session:
-                        session.run('MATCH (n:node { public_id: $public_id }) SET n = $properties',
-                                    public_id=entity.public_id, properties=properties)
-
-                if not exists:
-                    properties = Neo4jDB._get_neo4j_entity_to_index(entity)
-                    with neo4j.session() as session:
-                        session.run('CREATE (n:node $properties)', properties=properties)
+            properties = None
+            if not entity.deleted and entity.published:
+                properties = Neo4jDB._get_neo4j_entity_to_index(entity)
 
+            connections = []
             if add_connections:
-                for entity_entity in entity.reverse_connections.all():
-                    self.add_connection(entity_entity=entity_entity, overwrite=overwrite)
+                connections = Neo4jDB._get_neo4j_connections_to_write(
+                    chain(entity.reverse_connections.all(), entity.connections.all()))
 
-                for entity_entity in entity.connections.all():
-                    self.add_connection(entity_entity=entity_entity, overwrite=overwrite)
+            with self.get_neo4j().session() as session:
+                session.write_transaction(Neo4jDB._write_entity, public_id=entity.public_id, properties=properties,
+                                          connections=connections, overwrite=overwrite)
 
-    def q_update_entity(self, entity, update_connections=True):
+    @staticmethod
+    def _write_entity(tx, public_id, properties, connections, overwrite=False):
+        if properties is None:
+            Neo4jDB._delete_entity(tx=tx, public_id=public_id)
+        elif overwrite:
+            tx.run('MERGE (n:node { public_id: $public_id }) SET n = $properties', public_id=public_id,
+                   properties=properties)
+        else:
+            tx.run('MERGE (n:node { public_id: $public_id }) ON CREATE SET n = $properties', public_id=public_id,
+                   properties=properties)
+
+        for connection_to_write in connections:
+            Neo4jDB._write_connection(tx=tx, overwrite=overwrite, **connection_to_write)
+
+    def add_entities(self, entities, overwrite=False, add_connections=True, batch_size=1000, commit_size=10000):
+        ret = {
+            'nodes': 0,
+            'connections': 0,
+        }
+        if Neo4jDB.is_neo4j_settings_exists():
+            entities = list(entities)
+            deleted_nodes = [entity.public_id for entity in entities if entity.deleted or not entity.published]
+            visible_entities = [entity for entity in entities if not entity.deleted and entity.published]
+            properties = Neo4jDB._get_neo4j_entities_to_index(visible_entities)
+            nodes = [{
+                'public_id': entity.public_id,
+                'properties': properties[entity.id],
+            } for entity in visible_entities]
+
+            with self.get_neo4j().session() as session:
+                if Neo4jDB.is_neo4j_native_graph_model():
+                    statement = 'UNWIND $rows AS row MATCH (n:node { public_id: row }) DETACH DELETE n'
+                else:
+                    statement = 'UNWIND $rows AS row MATCH (n:node { public_id: row }) OPTIONAL MATCH (n)-[:relationship]-(r:relationship) DETACH DELETE r, n'
+                Neo4jDB._run_unwind(session=session, rows=deleted_nodes, batch_size=batch_size,
+                                    commit_size=commit_size, statement=statement)
+                Neo4jDB._run_unwind(session=session, rows=nodes, batch_size=batch_size, commit_size=commit_size,
+                                    statement='UNWIND $rows AS row MERGE (n:node { public_id: row.public_id }) ' + (
+                                        'SET' if overwrite else 'ON CREATE SET') + ' n = row.properties')
+            ret['nodes'] = len(nodes) + len(deleted_nodes)
+
+            if add_connections and entities:
+                ret['connections'] = self.add_connections(
+                    entity_entities=models.StageEntityEntity.objects.filter(
+                        Q(entity_a__in=entities) | Q(entity_b__in=entities)).distinct(), overwrite=overwrite,
+                    batch_size=batch_size, commit_size=commit_size)
+        return ret
+
+    def add_connections(self, entity_entities, overwrite=False, batch_size=1000, commit_size=10000):
+        ret = 0
+        if Neo4jDB.is_neo4j_settings_exists():
+            connections = []
+            deleted_connections = []
+            for connection_to_write in Neo4jDB._get_neo4j_connections_to_write(entity_entities):
+                if connection_to_write['properties'] is None:
+                    deleted_connections.append(connection_to_write)
+                else:
+                    connections.append(connection_to_write)
+
+            if Neo4jDB.is_neo4j_native_graph_model():
+                delete_statement = 'UNWIND $rows AS row MATCH (:node { public_id: row.entity_a_public_id })-[r:connection { id: row.entity_entity_id }]->(:node { public_id: row.entity_b_public_id }) DELETE r'
+                write_statement = 'UNWIND $rows AS row MATCH (a:node { public_id: row.entity_a_public_id }), (b:node { public_id: row.entity_b_public_id }) MERGE (a)-[r:connection { id: row.entity_entity_id }]->(b) ' + (
+                    'SET' if overwrite else 'ON CREATE SET') + ' r = row.properties'
+            else:
+                delete_statement = 'UNWIND $rows AS row MATCH (r:relationship { id: row.entity_entity_id }) DETACH DELETE r'
+                write_statement = 'UNWIND $rows AS row MATCH (a:node { public_id: row.entity_a_public_id }), (b:node { public_id: row.entity_b_public_id }) MERGE (r:relationship { id: row.entity_entity_id }) ' + (
+                    'SET' if overwrite else 'ON CREATE SET') + ' r = row.properties MERGE (a)-[:relationship]->(r) MERGE (r)-[:relationship]->(b)'
+
+            with self.get_neo4j().session() as session:
+                Neo4jDB._run_unwind(session=session, rows=deleted_connections, batch_size=batch_size,
+                                    commit_size=commit_size, statement=delete_statement)
+                Neo4jDB._run_unwind(session=session, rows=connections, batch_size=batch_size, commit_size=commit_size,
+                                    statement=write_statement)
+            ret = len(connections) + len(deleted_connections)
+        return ret
+
+    @staticmethod
+    def _run_unwind(session, statement, rows, batch_size=1000, commit_size=10000):
+        for i in range(0, len(rows), commit_size):
+            commit_rows = rows[i:i + commit_size]
+            with session.begin_transaction() as tx:
+                for j in range(0, len(commit_rows), batch_size):
+                    tx.run(statement, rows=commit_rows[j:j + batch_size])
+
+    def q_update_entity(self, entity, update_connections=True, depends_on=None):
         neo4j_db = Neo4jDB.get_db()
         queue = Neo4jDB._get_queue()
-        queue.enqueue(neo4j_db.update_entity, entity=entity, update_connections=update_connections, ttl=-1)
+        queue.enqueue(neo4j_db.update_entity, entity=entity, update_connections=update_connections,
+                      depends_on=depends_on, ttl=-1)
 
     def update_entity(self, entity, update_connections=True):
         self.add_entity(entity=entity, overwrite=True, add_connections=update_connections)
@@ -3853,12 +4376,17 @@ class Neo4jDB(BaseDatabase):
 
     def delete_entity(self, entity):
         if entity is not None and Neo4jDB.is_neo4j_settings_exists():
-            neo4j = self.get_neo4j()
-            with neo4j.session() as session:
-                with session.begin_transaction() as tx:
-                    tx.run(
-                        'MATCH (n:node { public_id: $public_id })-[r1:relationship]-(r:relationship)-[r2:relationship]-() DELETE r1, r2, r, n',
-                        public_id=entity.public_id)
+            with self.get_neo4j().session() as session:
+                session.write_transaction(Neo4jDB._delete_entity, public_id=entity.public_id)
+
+    @staticmethod
+    def _delete_entity(tx, public_id):
+        if Neo4jDB.is_neo4j_native_graph_model():
+            tx.run('MATCH (n:node { public_id: $public_id }) DETACH DELETE n', public_id=public_id)
+        else:
+            tx.run(
+                'MATCH (n:node { public_id: $public_id }) OPTIONAL MATCH (n)-[:relationship]-(r:relationship) DETACH DELETE r, n',
+                public_id=public_id)
 
     def q_add_connection(self, entity_entity, overwrite=False):
         neo4j_db = Neo4jDB.get_db()
@@ -3867,27 +4395,27 @@ class Neo4jDB(BaseDatabase):
 
     def add_connection(self, entity_entity, overwrite=False):
         if entity_entity is not None and Neo4jDB.is_neo4j_settings_exists():
-            neo4j = self.get_neo4j()
-            if entity_entity.deleted or not entity_entity.published or entity_entity.entity_a.deleted or not entity_entity.entity_a.published or entity_entity.entity_b.deleted or not entity_entity.entity_b.published or not entity_entity.entity_entity_collections.filter(
-                    deleted=False, published=True, collection__deleted=False, collection__published=True,
-                    collection__source__deleted=False, collection__source__published=True).exists():
-                self.delete_connection(entity_entity=entity_entity)
-            else:
-                with neo4j.session() as session:
-                    exists = session.run('MATCH (r:relationship { id: $entity_entity_id }) RETURN COUNT(*)',
-                                         entity_entity_id=entity_entity.id).single().value() > 0
-                if overwrite and exists:
-                    properties = Neo4jDB._get_neo4j_connection_to_index(entity_entity)
-                    with neo4j.session() as session:
-                        session.run('MATCH (r:relationship { id: $entity_entity_id }) SET r = $properties',
-                                    entity_entity_id=entity_entity.id, properties=properties)
-                if not exists:
-                    properties = Neo4jDB._get_neo4j_connection_to_index(entity_entity)
-                    with neo4j.session() as session:
-                        session.run(
-                            'MATCH (a:node { public_id: $entity_a_public_id }), (b:node { public_id: $entity_b_public_id }) CREATE (a)-[r1:relationship]->(r:relationship $properties)-[r2:relationship]->(b)',
-                            entity_a_public_id=entity_entity.entity_a.public_id,
-                            entity_b_public_id=entity_entity.entity_b.public_id, properties=properties)
+            connection = Neo4jDB._get_neo4j_connections_to_write([entity_entity])[0]
+            with self.get_neo4j().session() as session:
+                session.write_transaction(Neo4jDB._write_connection, overwrite=overwrite, **connection)
+
+    @staticmethod
+    def _write_connection(tx, entity_entity_id, entity_a_public_id, entity_b_public_id, properties, overwrite=False):
+        if properties is None:
+            Neo4jDB._delete_connection(tx=tx, entity_entity_id=entity_entity_id,
+                                       entity_a_public_id=entity_a_public_id, entity_b_public_id=entity_b_public_id)
+        elif Neo4jDB.is_neo4j_native_graph_model():
+            tx.run(
+                'MATCH (a:node { public_id: $entity_a_public_id }), (b:node { public_id: $entity_b_public_id }) MERGE (a)-[r:connection { id: $entity_entity_id }]->(b) ' + (
+                    'SET r = $properties' if overwrite else 'ON CREATE SET r = $properties'),
+                entity_entity_id=entity_entity_id, entity_a_public_id=entity_a_public_id,
+                entity_b_public_id=entity_b_public_id, properties=properties)
+        else:
+            tx.run(
+                'MATCH (a:node { public_id: $entity_a_public_id }), (b:node { public_id: $entity_b_public_id }) MERGE (r:relationship { id: $entity_entity_id }) ' + (
+                    'SET r = $properties ' if overwrite else 'ON CREATE SET r = $properties ') + 'MERGE (a)-[:relationship]->(r) MERGE (r)-[:relationship]->(b)',
+                entity_entity_id=entity_entity_id, entity_a_public_id=entity_a_public_id,
+                entity_b_public_id=entity_b_public_id, properties=properties)
 
     def q_update_connection(self, entity_entity):
         neo4j_db = Neo4jDB.get_db()
@@ -3904,6 +4432,45 @@ class Neo4jDB(BaseDatabase):
 
     def delete_connection(self, entity_entity):
         if entity_entity is not None and Neo4jDB.is_neo4j_settings_exists():
-            neo4j = self.get_neo4j()
-            with neo4j.session() as session:
-                session.run('MATCH (r:relationship {id: $entity_entity_id})-[r1:relationship]-() DELETE r1, r', entity_entity_id=entity_entity.id)
+            with self.get_neo4j().session() as session:
+                session.write_transaction(Neo4jDB._delete_connection, entity_entity_id=entity_entity.id,
+                                          entity_a_public_id=entity_entity.entity_a.public_id,
+                                          entity_b_public_id=entity_entity.entity_b.public_id)
+
+    @staticmethod
+    def _delete_connection(tx, entity_entity_id, entity_a_public_id=None, entity_b_public_id=None):
+        if not Neo4jDB.is_neo4j_native_graph_model():
+            tx.run('MATCH (r:relationship { id: $entity_entity_id }) DETACH DELETE r',
+                   entity_entity_id=entity_entity_id)
+        elif entity_a_public_id is not None and entity_b_public_id is not None:
+            tx.run(
+                'MATCH (:node { public_id: $entity_a_public_id })-[r:connection { id: $entity_entity_id }]->(:node { public_id: $entity_b_public_id }) DELETE r',
+                entity_entity_id=entity_entity_id, entity_a_public_id=entity_a_public_id,
+                entity_b_public_id=entity_b_public_id)
+        else:
+            tx.run('MATCH ()-[r:connection { id: $entity_entity_id }]->() DELETE r', entity_entity_id=entity_entity_id)
+
+    def convert_graph_model(self, batch_size=10000, command=None):
+        if not Neo4jDB.is_neo4j_settings_exists():
+            if command is not None:
+                command.stdout.write(command.style.ERROR('Neo4j not configured'))
+            return
+
+        if Neo4jDB.is_neo4j_native_graph_model():
+            statement = 'MATCH (a:node)-[:relationship]->(r:relationship)-[:relationship]->(b:node) WITH a, r, b LIMIT $batch_size CREATE (a)-[c:connection]->(b) SET c = properties(r) DETACH DELETE r RETURN COUNT(*)'
+        else:
+            statement = 'MATCH (a:node)-[c:connection]->(b:node) WITH a, c, b LIMIT $batch_size CREATE (a)-[:relationship]->(r:relationship)-[:relationship]->(b) SET r = properties(c) DELETE c RETURN COUNT(*)'
+
+        ret = 0
+        with self.get_neo4j().session() as session:
+            while True:
+                count = session.write_transaction(lambda tx: tx.run(statement, batch_size=batch_size).single().value())
+                if not count:
+                    break
+                ret += count
+                if command is not None:
+                    command.stdout.write('Converted ' + str(ret) + ' connections')
+        if command is not None:
+            command.stdout.write(command.style.SUCCESS(
+                'Graph converted to ' + Neo4jDB._get_neo4j_setting('GRAPH_MODEL') + ' model!'))
+        return ret
@@ -0,0 +1,739 @@
+import datetime
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from mocbackend import const, models
+
+logger = logging.getLogger(__name__)
+
+const.GRAPH_ENGINE_DEFAULTS = {
+    'ENABLED': False,
+    'SYNC_INTERVAL': 60,
+    'SYNC_MARGIN': 60,
+    'REBUILD_INTERVAL': 3600,
+    'CHUNK_SIZE': 10000,
+    'SNAPSHOT_DIR': None,
+}
+
+const.GRAPH_NODE_VISIBLE = 1
+const.GRAPH_NODE_IS_PEP = 2
+const.GRAPH_NODE_IS_PEP_KNOWN = 4
+const.GRAPH_EDGE_VISIBLE = 1
+
+const.GRAPH_SNAPSHOT_MAGIC = b'MOCGRAPH'
+const.GRAPH_SNAPSHOT_VERSION = 1
+const.GRAPH_SNAPSHOT_FILE_PREFIX = 'graph-'
+const.GRAPH_SNAPSHOT_FILE_SUFFIX = '.snapshot'
+const.GRAPH_SNAPSHOT_SECTIONS = [
+    ('entity_ids', 'q'),
+    ('public_id_offsets', 'q'),
+    ('public_id_data', 'B'),
+    ('public_id_order', 'i'),
+    ('node_entity_types', 'i'),
+    ('node_flags', 'b'),
+    ('edge_ids', 'q'),
+    ('edge_a', 'i'),
+    ('edge_b', 'i'),
+    ('edge_connection_types', 'i'),
+    ('edge_valid_from', 'i'),
+    ('edge_valid_to', 'i'),
+    ('edge_flags', 'b'),
+    ('offsets', 'q'),
+    ('slot_edges', 'i'),
+]
+const.GRAPH_SNAPSHOT_MUTABLE_SECTIONS = ['node_entity_types', 'node_flags']
+
+
+def get_setting(setting_name):
+    graph_engine = getattr(settings, 'GRAPH_ENGINE', None) or {}
+    return graph_engine.get(setting_name, const.GRAPH_ENGINE_DEFAULTS[setting_name])
+
+
+def to_ordinal(value):
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value.toordinal()
+
+
+def from_ordinal(value):
+    return None if value == 0 else datetime.date.fromordinal(value).isoformat()
+
+
+def get_visible_entity_entity_ids(entity_entity_ids=None):
+    queryset = models.StageEntityEntityCollection.objects.filter(
+        deleted=False, published=True, collection__deleted=False, collection__published=True,
+        collection__source__deleted=False, collection__source__published=True)
+    if entity_entity_ids is not None:
+        queryset = queryset.filter(entity_entity_id__in=entity_entity_ids)
+    return set(queryset.values_list('entity_entity_id', flat=True).iterator())
+
+
+def get_snapshot_path(snapshot_dir):
+    if snapshot_dir is None or not os.path.isdir(snapshot_dir):
+        return None
+    paths = sorted(glob.glob(os.path.join(snapshot_dir, const.GRAPH_SNAPSHOT_FILE_PREFIX + '*' +
+                                          const.GRAPH_SNAPSHOT_FILE_SUFFIX)))
+    return paths[-1] if paths else None
+
+
+class CompactGraph:
+    def __init__(self):
+        self.built_at = None
+        self.synced_at = None
+        self.path = None
+
+        self.entity_type_string_ids = {}
+        self.entity_type_ids = {}
+        self.connection_type_string_ids = {}
+        self.connection_type_ids = {}
+        self.connection_type_categories = {}
+        self.category_string_ids = {}
+        self.category_ids = {}
+
+        self.base_count = 0
+        self.entity_ids = array('q')
+        self.public_id_offsets = array('q', [0])
+        self.public_id_data = b''
+        self.public_id_order = array('i')
+        self.node_entity_types = array('i')
+        self.node_flags = array('b')
+
+        self.edge_ids = array('q')
+        self.edge_a = array('i')
+        self.edge_b = array('i')
+        self.edge_connection_types = array('i')
+        self.edge_valid_from = array('i')
+        self.edge_valid_to = array('i')
+        self.edge_flags = array('b')
+
+        self.offsets = array('q', [0])
+        self.slot_edges = array('i')
+
+        self._added_public_ids = []
+        self._added_index_by_public_id = {}
+        self._added_index_by_entity_id = {}
+        self._overrides = {}
+        self._added = {}
+        self._lock = threading.Lock()
+
+    def load_lookups(self):
+        self.entity_type_string_ids = dict(models.StaticEntityType.objects.values_list('id', 'string_id'))
+        self.entity_type_ids = {value: key for key, value in self.entity_type_string_ids.items()}
+        self.category_string_ids = dict(models.StaticConnectionTypeCategory.objects.values_list('id', 'string_id'))
+        self.category_ids = {value: key for key, value in self.category_string_ids.items()}
+        self.connection_type_string_ids = {}
+        self.connection_type_categories = {}
+        for connection_type_id, string_id, category_id in models.StaticConnectionType.objects.values_list(
+                'id', 'string_id', 'category_id'):
+            self.connection_type_string_ids[connection_type_id] = string_id
+            self.connection_type_categories[connection_type_id] = category_id
+        self.connection_type_ids = {value: key for key, value in self.connection_type_string_ids.items()}
+
+    @staticmethod
+    def get_node_flags(published, deleted, is_pep):
+        ret = const.GRAPH_NODE_VISIBLE if published and not deleted else 0
+        if is_pep is not None:
+            ret |= const.GRAPH_NODE_IS_PEP_KNOWN
+            if is_pep:
+                ret |= const.GRAPH_NODE_IS_PEP
+        return ret
+
+    @staticmethod
+    def get_entities_queryset():
+        return models.StageEntity.objects.order_by('id').values_list('id', 'public_id', 'entity_type_id', 'is_pep',
+                                                                     'published', 'deleted')
+
+    @staticmethod
+    def get_connections_queryset():
+        return models.StageEntityEntity.objects.order_by('id').values_list('id', 'entity_a_id', 'entity_b_id',
+                                                                           'connection_type_id', 'valid_from',
+                                                                           'valid_to', 'published', 'deleted')
+
+    @staticmethod
+    def build():
+        ret = CompactGraph()
+        ret.built_at = timezone.now()
+        started = time.time()
+        ret.load_lookups()
+
+        public_ids = []
+        for entity_id, public_id, entity_type_id, is_pep, published, deleted in CompactGraph.get_entities_queryset().iterator():
+            public_id = public_id.encode('utf-8')
+            ret.entity_ids.append(entity_id)
+            ret.public_id_offsets.append(ret.public_id_offsets[-1] + len(public_id))
+            public_ids.append(public_id)
+            ret.node_entity_types.append(entity_type_id)
+            ret.node_flags.append(CompactGraph.get_node_flags(published=published, deleted=deleted, is_pep=is_pep))
+        ret.base_count = len(public_ids)
+        ret.public_id_data = b''.join(public_ids)
+        ret.public_id_order = array('i', sorted(range(ret.base_count), key=public_ids.__getitem__))
+        del public_ids
+
+        visible = get_visible_entity_entity_ids()
+        degrees = array('q', [0]) * ret.base_count
+        for entity_entity_id, entity_a_id, entity_b_id, connection_type_id, valid_from, valid_to, published, deleted in CompactGraph.get_connections_queryset().iterator():
+            a = ret.get_index_by_entity_id(entity_a_id)
+            b = ret.get_index_by_entity_id(entity_b_id)
+            if a is None or b is None:
+                continue
+            ret.edge_ids.append(entity_entity_id)
+            ret.edge_a.append(a)
+            ret.edge_b.append(b)
+            ret.edge_connection_types.append(connection_type_id)
+            ret.edge_valid_from.append(to_ordinal(valid_from))
+            ret.edge_valid_to.append(to_ordinal(valid_to))
+            ret.edge_flags.append(
+                const.GRAPH_EDGE_VISIBLE if published and not deleted and entity_entity_id in visible else 0)
+            degrees[a] += 1
+            degrees[b] += 1
+        del visible
+
+        ret.offsets = array('q', [0]) * (ret.base_count + 1)
+        for i in range(ret.base_count):
+            ret.offsets[i + 1] = ret.offsets[i] + degrees[i]
+        ret.slot_edges = array('i', [0]) * ret.offsets[-1]
+        positions = array('q', ret.offsets[:-1])
+        for e in range(len(ret.edge_ids)):
+            a = ret.edge_a[e]
+            b = ret.edge_b[e]
+            ret.slot_edges[positions[a]] = e
+            positions[a] += 1
+            ret.slot_edges[positions[b]] = e
+            positions[b] += 1
+
+        ret.synced_at = ret.built_at
+        logger.info('Graph built with ' + str(ret.base_count) + ' nodes and ' + str(
+            len(ret.edge_ids)) + ' edges in ' + str(round(time.time() - started, 1)) + 's')
+        return ret
+
+    def write(self, path):
+        sections = {}
+        offset = 0
+        for name, typecode in const.GRAPH_SNAPSHOT_SECTIONS:
+            value = memoryview(getattr(self, name)).cast('B')
+            sections[name] = [offset, typecode, len(value) // array(typecode).itemsize]
+            offset += len(value) + (-len(value) % 8)
+        header = json.dumps({
+            'built_at': self.built_at.isoformat(),
+            'byteorder': sys.byteorder,
+            'sections': sections,
+        }).encode('utf-8')
+        data_offset = len(const.GRAPH_SNAPSHOT_MAGIC) + 8 + len(header)
+        data_offset += -data_offset % 8
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(const.GRAPH_SNAPSHOT_MAGIC)
+            fp.write(struct.pack('<II', const.GRAPH_SNAPSHOT_VERSION, len(header)))
+            fp.write(header)
+            fp.write(b'\0' * (data_offset - fp.tell()))
+            for name, typecode in const.GRAPH_SNAPSHOT_SECTIONS:
+                value = memoryview(getattr(self, name)).cast('B')
+                fp.write(value)
+                fp.write(b'\0' * (-len(value) % 8))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def open(path):
+        with open(path, 'rb') as fp:
+            buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic_length = len(const.GRAPH_SNAPSHOT_MAGIC)
+        if buffer[:magic_length] != const.GRAPH_SNAPSHOT_MAGIC:
+            raise ValueError('Not a graph snapshot: ' + path)
+        version, header_length = struct.unpack_from('<II', buffer, magic_length)
+        if version != const.GRAPH_SNAPSHOT_VERSION:
+            raise ValueError('Unsupported graph snapshot version ' + str(version) + ': ' + path)
+        header = json.loads(buffer[magic_length + 8:magic_length + 8 + header_length].decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError('Graph snapshot byte order mismatch: ' + path)
+        data_offset = magic_length + 8 + header_length
+        data_offset += -data_offset % 8
+
+        ret = CompactGraph()
+        ret.path = path
+        ret.built_at = parse_datetime(header['built_at'])
+        ret.synced_at = ret.built_at
+        view = memoryview(buffer)
+        for name, (offset, typecode, length) in header['sections'].items():
+            start = data_offset + offset
+            value = view[start:start + length * array(typecode).itemsize].cast(typecode)
+            if name in const.GRAPH_SNAPSHOT_MUTABLE_SECTIONS:
+                value = array(typecode, value)
+            setattr(ret, name, value)
+        ret.base_count = len(ret.entity_ids)
+        ret.load_lookups()
+        return ret
+
+    def get_public_id(self, index):
+        if index >= self.base_count:
+            return self._added_public_ids[index - self.base_count]
+        return bytes(self.public_id_data[self.public_id_offsets[index]:self.public_id_offsets[index + 1]]).decode(
+            'utf-8')
+
+    def _get_base_public_id(self, index):
+        return bytes(self.public_id_data[self.public_id_offsets[index]:self.public_id_offsets[index + 1]])
+
+    def get_index_by_public_id(self, public_id):
+        ret = self._added_index_by_public_id.get(public_id)
+        if ret is not None:
+            return ret
+        key = public_id.encode('utf-8')
+        low = 0
+        high = self.base_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_base_public_id(self.public_id_order[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.base_count and self._get_base_public_id(self.public_id_order[low]) == key:
+            return self.public_id_order[low]
+        return None
+
+    def get_index_by_entity_id(self, entity_id):
+        i = bisect_left(self.entity_ids, entity_id, 0, self.base_count)
+        if i < self.base_count and self.entity_ids[i] == entity_id:
+            return i
+        return self._added_index_by_entity_id.get(entity_id)
+
+    def get_base_edge(self, entity_entity_id):
+        e = bisect_left(self.edge_ids, entity_entity_id)
+        if e < len(self.edge_ids) and self.edge_ids[e] == entity_entity_id:
+            return e
+        return None
+
+    def sync(self, since=None):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            synced_at = timezone.now()
+            since = (since or self.synced_at) - datetime.timedelta(seconds=get_setting('SYNC_MARGIN'))
+            self.load_lookups()
+
+            for entity_id, public_id, entity_type_id, is_pep, published, deleted in CompactGraph.get_entities_queryset().filter(
+                    updated_at__gte=since).iterator():
+                flags = CompactGraph.get_node_flags(published=published, deleted=deleted, is_pep=is_pep)
+                index = self.get_index_by_entity_id(entity_id)
+                if index is None:
+                    index = len(self.node_flags)
+                    self._added_public_ids.append(public_id)
+                    self._added_index_by_public_id[public_id] = index
+                    self._added_index_by_entity_id[entity_id] = index
+                    self.node_entity_types.append(entity_type_id)
+                    self.node_flags.append(flags)
+                else:
+                    self.node_entity_types[index] = entity_type_id
+                    self.node_flags[index] = flags
+
+            entity_entity_ids = set(models.StageEntityEntity.objects.filter(updated_at__gte=since).values_list(
+                'id', flat=True).iterator())
+            entity_entity_ids.update(models.StageEntityEntityCollection.objects.filter(
+                updated_at__gte=since).values_list('entity_entity_id', flat=True).iterator())
+            entity_entity_ids = sorted(entity_entity_ids)
+            chunk_size = get_setting('CHUNK_SIZE')
+            for i in range(0, len(entity_entity_ids), chunk_size):
+                chunk = entity_entity_ids[i:i + chunk_size]
+                visible = get_visible_entity_entity_ids(entity_entity_ids=chunk)
+                rows = {row[0]: row for row in CompactGraph.get_connections_queryset().filter(id__in=chunk)}
+                for entity_entity_id in chunk:
+                    self.apply_connection(entity_entity_id=entity_entity_id, row=rows.get(entity_entity_id),
+                                          visible=entity_entity_id in visible)
+
+            self.synced_at = synced_at
+            if entity_entity_ids:
+                logger.info('Graph synced ' + str(len(entity_entity_ids)) + ' edges, ' + str(
+                    len(self._overrides)) + ' edges overridden')
+        finally:
+            self._lock.release()
+
+    def apply_connection(self, entity_entity_id, row, visible):
+        attrs = None
+        if row is not None:
+            entity_entity_id, entity_a_id, entity_b_id, connection_type_id, valid_from, valid_to, published, deleted = row
+            a = self.get_index_by_entity_id(entity_a_id)
+            b = self.get_index_by_entity_id(entity_b_id)
+            if a is not None and b is not None:
+                attrs = (a, b, connection_type_id, to_ordinal(valid_from), to_ordinal(valid_to),
+                         const.GRAPH_EDGE_VISIBLE if published and not deleted and visible else 0)
+
+        e = self.get_base_edge(entity_entity_id)
+        base_ends = () if e is None else (self.edge_a[e], self.edge_b[e])
+        self._overrides[entity_entity_id] = attrs
+        if attrs is not None:
+            for index in (attrs[0], attrs[1]):
+                if index not in base_ends:
+                    self._added[index] = self._added.get(index, frozenset()) | {entity_entity_id}
+
+    def iterate_edges(self, index, visible_only=True):
+        # yields (entity_entity_id, other_index, connection_type_id, valid_from, valid_to, outgoing)
+        overrides = self._overrides
+        if index < self.base_count:
+            for slot in range(self.offsets[index], self.offsets[index + 1]):
+                e = self.slot_edges[slot]
+                entity_entity_id = self.edge_ids[e]
+                if overrides and entity_entity_id in overrides:
+                    attrs = overrides[entity_entity_id]
+                    if attrs is None or index not in (attrs[0], attrs[1]):
+                        continue
+                    a, b, connection_type_id, valid_from, valid_to, flags = attrs
+                else:
+                    a = self.edge_a[e]
+                    b = self.edge_b[e]
+                    connection_type_id = self.edge_connection_types[e]
+                    valid_from = self.edge_valid_from[e]
+                    valid_to = self.edge_valid_to[e]
+                    flags = self.edge_flags[e]
+                other = b if a == index else a
+                if visible_only and not (flags & const.GRAPH_EDGE_VISIBLE and self.is_visible(a) and self.is_visible(b)):
+                    continue
+                yield entity_entity_id, other, connection_type_id, valid_from, valid_to, a == index
+        for entity_entity_id in self._added.get(index, ()):
+            attrs = overrides.get(entity_entity_id)
+            if attrs is None or index not in (attrs[0], attrs[1]):
+                continue
+            a, b, connection_type_id, valid_from, valid_to, flags = attrs
+            if visible_only and not (flags & const.GRAPH_EDGE_VISIBLE and self.is_visible(a) and self.is_visible(b)):
+                continue
+            yield entity_entity_id, b if a == index else a, connection_type_id, valid_from, valid_to, a == index
+
+    def is_visible(self, index):
+        return bool(self.node_flags[index] & const.GRAPH_NODE_VISIBLE)
+
+    def get_index(self, public_id):
+        index = self.get_index_by_public_id(public_id)
+        if index is None or not self.is_visible(index):
+            return None
+        return index
+
+    def get_category_string_id(self, connection_type_id):
+        return self.category_string_ids.get(self.connection_type_categories.get(connection_type_id))
+
+    def get_edge_filter(self, filters):
+        categories = None
+        connection_types = None
+        if filters.connection_type_categories is not None:
+            categories = set(self.category_ids.get(value) for value in filters.connection_type_categories)
+        if filters.connection_types is not None:
+            connection_types = set(self.connection_type_ids.get(value) for value in filters.connection_types)
+        valid_from = None if filters.valid_from is None else to_ordinal(filters.valid_from)
+        valid_to = None if filters.valid_to is None else to_ordinal(filters.valid_to)
+
+        def edge_filter(connection_type_id, edge_valid_from, edge_valid_to):
+            if categories is not None or connection_types is not None:
+                if not ((categories is not None and self.connection_type_categories.get(
+                        connection_type_id) in categories) or (
+                                connection_types is not None and connection_type_id in connection_types)):
+                    return False
+            if valid_from is not None and (edge_valid_from == 0 or edge_valid_from < valid_from):
+                return False
+            if valid_to is not None and (edge_valid_to == 0 or edge_valid_to > valid_to):
+                return False
+            return True
+
+        return edge_filter
+
+    def get_node_filter(self, filters):
+        entity_types = None
+        if filters.entity_types is not None:
+            entity_types = set(self.entity_type_ids.get(value) for value in filters.entity_types)
+        is_pep = filters.is_pep
+
+        def node_filter(index):
+            if entity_types is not None and self.node_entity_types[index] not in entity_types:
+                return False
+            if is_pep is not None:
+                flags = self.node_flags[index]
+                if not flags & const.GRAPH_NODE_IS_PEP_KNOWN or bool(flags & const.GRAPH_NODE_IS_PEP) != is_pep:
+                    return False
+            return True
+
+        return node_filter
+
+    def neighbours(self, index, edge_filter=None, node_filter=None, depth=1):
+        ret = {index: 0}
+        frontier = [index]
+        for distance in range(1, depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for entity_entity_id, other, connection_type_id, valid_from, valid_to, outgoing in self.iterate_edges(
+                        node):
+                    if other in ret:
+                        continue
+                    if edge_filter is not None and not edge_filter(connection_type_id, valid_from, valid_to):
+                        continue
+                    if node_filter is not None and not node_filter(other):
+                        continue
+                    ret[other] = distance
+                    next_frontier.append(other)
+            frontier = next_frontier
+        del ret[index]
+        return ret
+
+    def connection_counts(self, index):
+        ret = {}
+        for entity_entity_id, other, connection_type_id, valid_from, valid_to, outgoing in self.iterate_edges(index):
+            category = self.get_category_string_id(connection_type_id)
+            ret[category] = ret.get(category, 0) + 1
+        return ret
+
+    def connections_between(self, indexes):
+        ret = {}
+        indexes = set(indexes)
+        for index in indexes:
+            for entity_entity_id, other, connection_type_id, valid_from, valid_to, outgoing in self.iterate_edges(
+                    index):
+                if other in indexes and index < other:
+                    categories, entity_entity_ids = ret.setdefault((index, other), (set(), set()))
+                    categories.add(self.get_category_string_id(connection_type_id))
+                    entity_entity_ids.add(entity_entity_id)
+        return ret
+
+
+_graph = None
+_graph_pid = None
+_graph_lock = threading.Lock()
+_rebuilding = False
+
+
+def is_enabled():
+    return bool(get_setting('ENABLED'))
+
+
+def load():
+    path = get_snapshot_path(get_setting('SNAPSHOT_DIR'))
+    if path is None:
+        return CompactGraph.build()
+    if _graph is not None and _graph.path == path:
+        graph = _graph
+    else:
+        graph = CompactGraph.open(path)
+        logger.info('Graph snapshot ' + path + ' opened')
+    return graph
+
+
+def _rebuild():
+    global _graph, _rebuilding
+    try:
+        graph = load()
+        if graph is not _graph:
+            graph.sync(since=graph.built_at)
+            _graph = graph
+    except Exception:
+        logger.exception('Graph rebuild failed')
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def rebuild():
+    global _rebuilding
+    with _graph_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, name='graph-rebuild', daemon=True).start()
+
+
+def open_snapshot():
+    global _graph
+    path = get_snapshot_path(get_setting('SNAPSHOT_DIR'))
+    if path is None:
+        return None
+    try:
+        graph = CompactGraph.open(path)
+        graph.sync(since=graph.built_at)
+    except Exception:
+        logger.exception('Graph snapshot ' + path + ' could not be opened')
+        return None
+    logger.info('Graph snapshot ' + path + ' opened')
+    _graph = graph
+    return graph
+
+
+def get_graph():
+    global _graph_pid, _rebuilding
+    if not is_enabled():
+        return None
+    pid = os.getpid()
+    if _graph_pid != pid:
+        with _graph_lock:
+            if _graph_pid != pid:
+                _graph_pid = pid
+                _rebuilding = False
+    graph = _graph
+    if graph is None:
+        graph = open_snapshot()
+        if graph is None:
+            rebuild()
+        return graph
+    now = timezone.now()
+    if (now - graph.built_at).total_seconds() > get_setting('REBUILD_INTERVAL') and (
+            graph.path is None or get_snapshot_path(get_setting('SNAPSHOT_DIR')) != graph.path):
+        rebuild()
+    elif (now - graph.synced_at).total_seconds() > get_setting('SYNC_INTERVAL'):
+        graph.sync()
+    return graph
+
+
+def is_connection_filters_supported(filters):
+    if filters.transaction_date_from is not None or filters.transaction_date_to is not None or \
+            filters.transaction_amount_from is not None or filters.transaction_amount_to is not None:
+        return False
+    try:
+        to_ordinal(filters.valid_from)
+        to_ordinal(filters.valid_to)
+    except ValueError:
+        return False
+    return True
+
+
+def is_neighbours_supported(filters):
+    return filters.entity_public_id is not None and filters.legal_entity_types is None and \
+           is_connection_filters_supported(filters)
+
+
+def get_neighbours(graph, filters, offset, limit, count=False):
+    ret = {
+        'total': 0,
+        'pairs': [],
+    }
+    index = graph.get_index(filters.entity_public_id)
+    if index is None:
+        return ret
+    neighbours = sorted(graph.neighbours(index=index, edge_filter=graph.get_edge_filter(filters),
+                                         node_filter=graph.get_node_filter(filters)))
+    if not neighbours:
+        return ret
+    ret['total'] = len(neighbours) + 1
+    page = neighbours[offset:offset + limit]
+    if not page:
+        return ret
+    for (a, b), (categories, entity_entity_ids) in sorted(graph.connections_between([index] + page).items()):
+        pair = [graph.get_public_id(a), graph.get_public_id(b), sorted(categories)]
+        if count:
+            pair.append(len(entity_entity_ids))
+        ret['pairs'].append(pair)
+    return ret
+
+
+def get_ego_network(root, root_payload, depth, max_nodes, max_edges, expand, get_extra_edges):
+    nodes = {root: dict(root_payload, depth=0, pruned=None)}
+    edges = {}
+    truncated = False
+    frontier = [root]
+    for distance in range(1, depth + 1):
+        if not frontier:
+            break
+        next_frontier = []
+        for key in frontier:
+            nodes[key]['pruned'] = 0
+        for key, total, candidates in expand(frontier, list(nodes)):
+            shown = 0
+            for other, other_payload, edge, edge_payload in candidates:
+                if other not in nodes:
+                    if len(nodes) >= max_nodes or len(edges) >= max_edges:
+                        break
+                    nodes[other] = dict(other_payload, depth=distance, pruned=None)
+                    next_frontier.append(other)
+                if edge not in edges and len(edges) < max_edges:
+                    edges[edge] = edge_payload
+                shown += 1
+            nodes[key]['pruned'] = total - shown
+            if total > shown:
+                truncated = True
+        frontier = next_frontier
+    if len(edges) < max_edges:
+        for edge, edge_payload in get_extra_edges(list(nodes), list(edges), max_edges - len(edges)):
+            edges.setdefault(edge, edge_payload)
+    return {
+        'truncated': truncated,
+        'nodes': list(nodes.values()),
+        'edges': list(edges.values()),
+    }
+
+
+def get_graph_ego_network(graph, public_id, filters, depth, fan_out, max_nodes, max_edges, priority, category_order):
+    root = graph.get_index(public_id)
+    if root is None:
+        return None
+    edge_filter = graph.get_edge_filter(filters)
+    category_order = {value: i for i, value in enumerate(category_order)}
+
+    def get_priority(connection_type_id, valid_from, other):
+        ret = []
+        for value in priority:
+            if value == 'category':
+                ret.append(category_order.get(graph.get_category_string_id(connection_type_id), len(category_order)))
+            elif value == 'pep':
+                ret.append(0 if graph.node_flags[other] & const.GRAPH_NODE_IS_PEP else 1)
+            elif value == 'recency':
+                ret.append(-valid_from)
+        return ret
+
+    def expand(frontier, visited):
+        visited = set(visited)
+        for index in frontier:
+            best = {}
+            for entity_entity_id, other, connection_type_id, valid_from, valid_to, outgoing in graph.iterate_edges(
+                    index):
+                if other in visited or not edge_filter(connection_type_id, valid_from, valid_to):
+                    continue
+                key = get_priority(connection_type_id, valid_from, other) + [entity_entity_id]
+                if other not in best or key < best[other][0]:
+                    best[other] = (key, entity_entity_id)
+            selected = sorted(best.items(), key=lambda item: item[1][0])[:fan_out]
+            yield index, len(best), [
+                (other, {'public_id': graph.get_public_id(other)}, entity_entity_id, {'id': entity_entity_id}) for
+                other, (key, entity_entity_id) in selected]
+
+    def get_extra_edges(indexes, entity_entity_ids, limit):
+        entity_entity_ids = set(entity_entity_ids)
+        ret = []
+        for (a, b), (categories, ids) in graph.connections_between(indexes).items():
+            ret.extend(entity_entity_id for entity_entity_id in ids if entity_entity_id not in entity_entity_ids)
+        return [(entity_entity_id, {'id': entity_entity_id}) for entity_entity_id in sorted(ret)[:limit]]
+
+    ret = get_ego_network(root=root, root_payload={'public_id': public_id}, depth=depth, max_nodes=max_nodes,
+                          max_edges=max_edges, expand=expand, get_extra_edges=get_extra_edges)
+    edges = get_edges([edge['id'] for edge in ret['edges']])
+    ret['edges'] = [edges[edge['id']] for edge in ret['edges'] if edge['id'] in edges]
+    return ret
+
+
+def get_edges(entity_entity_ids):
+    ret = {}
+    for row in models.StageEntityEntity.objects.filter(id__in=entity_entity_ids).values(
+            'id', 'entity_a__public_id', 'entity_b__public_id', 'connection_type__string_id', 'connection_type__name',
+            'connection_type__category__string_id', 'valid_from', 'valid_to', 'transaction_amount',
+            'transaction_currency__code'):
+        ret[row['id']] = {
+            'id': row['id'],
+            'entity_a_public_id': row['entity_a__public_id'],
+            'entity_b_public_id': row['entity_b__public_id'],
+            'connection_type_string_id': row['connection_type__string_id'],
+            'connection_type_name': row['connection_type__name'],
+            'connection_type_category_string_id': row['connection_type__category__string_id'],
+            'valid_from': None if row['valid_from'] is None else row['valid_from'].isoformat(),
+            'valid_to': None if row['valid_to'] is None else row['valid_to'].isoformat(),
+            'transaction_amount': None if row['transaction_amount'] is None else float(row['transaction_amount']),
+            'transaction_currency_code': row['transaction_currency__code'],
+        }
+    return ret
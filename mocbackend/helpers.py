@@ -1,7 +1,10 @@
 import datetime
+import multiprocessing
 
 import django_rq
 from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
 from django.utils import six, timezone
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import utc
@@ -422,6 +425,73 @@ def get_queue(queue, default_timeout='60m'):
     return django_rq.get_queue(queue, default_timeout=default_timeout)
 
 
+def get_id_at_offset(queryset, offset):
+    return next(iter(queryset.order_by('id').values_list('id', flat=True)[offset:offset + 1]), None)
+
+
+def get_id_ranges(queryset, parts, offset=None, limit=None):
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    max_id = None
+    if offset is None:
+        min_id = queryset.order_by().aggregate(min_id=Min('id'))['min_id']
+    else:
+        min_id = get_id_at_offset(queryset=queryset, offset=offset)
+    if limit is not None:
+        max_id = next(iter(ids[(offset or 0) + limit - 1:(offset or 0) + limit]), None) if limit > 0 else min_id
+        if limit <= 0:
+            min_id = None
+    if max_id is None:
+        max_id = queryset.order_by().aggregate(max_id=Max('id'))['max_id']
+
+    ret = []
+    if min_id is not None and max_id is not None and parts > 0:
+        step = max(-(-(max_id - min_id + 1) // parts), 1)
+        from_id = min_id
+        while from_id <= max_id:
+            to_id = min(from_id + step - 1, max_id)
+            ret.append((from_id, to_id))
+            from_id = to_id + 1
+    return ret
+
+
+def iterate_by_id(queryset, chunk_size=10000, batch_size=500, limit=None):
+    queryset = queryset.order_by('id')
+    last_id = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        count = 0
+        batch = []
+        for obj in chunk[:size].iterator():
+            batch.append(obj)
+            count += 1
+            last_id = obj.id
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        if remaining is not None:
+            remaining -= count
+        if count < size:
+            break
+
+
+def run_in_processes(function, tasks, processes):
+    connections.close_all()
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
 class JSONChunkGenerator:
     _first = True
     _renderer = None
@@ -1,13 +1,40 @@
-from django.core.management import BaseCommand
-from neo4j.v1 import GraphDatabase
+import json
+import time
+import traceback
 
-from mocbackend import models
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Q
+
+from mocbackend import helpers, models
 from mocbackend.databases import Neo4jDB
 
 
+def build_range(task):
+    family, options, checkpoint_id = task
+    started = time.time()
+    checkpoint = models.ReindexCheckpoint.objects.get(id=checkpoint_id)
+    ret = {
+        'rows': 0,
+    }
+    try:
+        ret['rows'] = Command().build(family=family, options=options, checkpoint=checkpoint, verbose=False)
+    except Exception:
+        ret['exception'] = traceback.format_exc()
+    ret['from_id'] = checkpoint.range_from_id
+    ret['to_id'] = checkpoint.range_to_id
+    ret['seconds'] = time.time() - started
+    return ret
+
+
 class Command(BaseCommand):
+    resume_options = ['overwrite', 'offset', 'limit', 'chunk_size', 'from_id', 'to_id', 'unwind', 'batch_size',
+                      'commit_size', 'entities-only_force_pep', 'entities-by_public_id', 'entities-by_attribute']
+
     def add_arguments(self, parser):
         parser.add_argument('--init-entities', dest='init-entities', action='store_true')
+        parser.add_argument('--init-constraints', dest='init-constraints', action='store_true')
+        parser.add_argument('--create-indexes', dest='create-indexes', action='store_true')
+        parser.add_argument('--convert-graph-model', dest='convert-graph-model', action='store_true')
 
         parser.add_argument('--overwrite', dest='overwrite', action='store_true')
         parser.add_argument('--queue', dest='queue', action='store_true')
@@ -15,6 +42,17 @@ class Command(BaseCommand):
         parser.add_argument('--offset', dest='offset', type=int)
         parser.add_argument('--limit', dest='limit', type=int)
         parser.add_argument('--chunk_size', dest='chunk_size', type=int)
+        parser.add_argument('--from_id', dest='from_id', type=int)
+        parser.add_argument('--to_id', dest='to_id', type=int)
+
+        parser.add_argument('--unwind', dest='unwind', action='store_true')
+        parser.add_argument('--batch_size', dest='batch_size', type=int, default=1000)
+        parser.add_argument('--commit_size', dest='commit_size', type=int, default=10000)
+
+        parser.add_argument('--workers', dest='workers', type=int, default=1)
+        parser.add_argument('--worker_ranges', dest='worker_ranges', type=int, default=4)
+
+        parser.add_argument('--resume', dest='resume', action='store_true')
 
         parser.add_argument('--entities', dest='entities', action='store_true')
         parser.add_argument('--entities-only_force_pep', dest='entities-only_force_pep', action='store_true')
@@ -22,49 +60,209 @@ class Command(BaseCommand):
         parser.add_argument('--entities-by_attribute', dest='entities-by_attribute')
 
     def handle(self, *args, **options):
+        if options['resume'] and options['queue']:
+            raise CommandError('--resume can not be used with --queue, checkpoints do not track enqueued jobs')
+
         neo4j_db = Neo4jDB.get_db()
 
         if options['init-entities']:
             neo4j_db.init(command=self)
 
+        if options['init-constraints']:
+            neo4j_db.init_constraints(command=self)
+
+        if options['convert-graph-model']:
+            neo4j_db.convert_graph_model(batch_size=options['commit_size'], command=self)
+            neo4j_db.create_indexes(command=self)
+
+        if options['create-indexes']:
+            neo4j_db.create_indexes(command=self)
+
         if options['entities']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
+            unwind = options['unwind']
+            for family in ['entities', 'connections']:
+                if family == 'connections' and not unwind:
+                    break
+                checkpoints, family_options = self.get_checkpoints(family=family, options=options)
+                unwind = family_options['unwind']
+                if options['workers'] > 1:
+                    self.build_in_workers(family=family, options=family_options, checkpoints=checkpoints)
+                else:
+                    for checkpoint in checkpoints:
+                        self.build(family=family, options=family_options, checkpoint=checkpoint)
+
+        self.stdout.write(self.style.SUCCESS('Finished!'))
+
+    @staticmethod
+    def is_entities_filtered(options):
+        return options['entities-only_force_pep'] or (
+                options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '') or (
+                       options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '') or \
+               options['from_id'] is not None or options['to_id'] is not None or options['offset'] is not None or \
+               options['limit'] is not None
+
+    @staticmethod
+    def get_queryset(options, family='entities'):
+        ret = models.StageEntity.objects.all().select_related('entity_type').order_by('id')
+
+        if options['entities-only_force_pep']:
+            ret = ret.filter(force_pep=True)
+
+        if options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '':
+            ret = ret.filter(public_id=options['entities-by_public_id'])
+        elif options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '':
+            ret = ret.filter(attribute_values__attribute__string_id=options['entities-by_attribute']).distinct()
+
+        if options['from_id'] is not None:
+            ret = ret.filter(id__gte=options['from_id'])
+        if options['to_id'] is not None:
+            ret = ret.filter(id__lte=options['to_id'])
 
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
+        if family == 'connections':
+            if options['offset'] is not None or options['limit'] is not None:
+                ret = Command.get_entities_in_range(queryset=ret, offset=options['offset'] or 0,
+                                                    limit=options['limit'])
+            entity_ids = ret.order_by().values('id')
+            ret = models.StageEntityEntity.objects.all().order_by('id')
+            if Command.is_entities_filtered(options):
+                ret = ret.filter(Q(entity_a_id__in=entity_ids) | Q(entity_b_id__in=entity_ids))
+        return ret
 
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
+    @staticmethod
+    def get_entities_in_range(queryset, offset, limit=None):
+        from_id = helpers.get_id_at_offset(queryset=queryset, offset=offset)
+        if from_id is None or (limit is not None and limit <= 0):
+            return queryset.none()
+        ret = queryset.filter(id__gte=from_id)
+        if limit is not None:
+            to_id = helpers.get_id_at_offset(queryset=queryset, offset=offset + limit - 1)
+            if to_id is not None:
+                ret = ret.filter(id__lte=to_id)
+        return ret
 
-                entities = models.StageEntity.objects.all().order_by('id')
+    @staticmethod
+    def get_worker_options(options):
+        return {key: value for key, value in options.items() if key not in ['stdout', 'stderr']}
 
-                if options['entities-only_force_pep']:
-                    entities = entities.filter(force_pep=True)
+    def get_checkpoints(self, family, options):
+        if options['resume']:
+            ret = models.ReindexCheckpoint.get_to_resume(target='neo4j', family=family)
+            if ret is not None:
+                self.stdout.write("Resuming " + family + " from " + str(len(ret)) + " unfinished checkpoints...")
+                return ret, self.get_resume_options(checkpoints=ret, options=options)
+            self.stdout.write("No checkpoint for " + family + ", starting from the beginning...")
 
-                if options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '':
-                    entities = entities.filter(public_id=options['entities-by_public_id'])
-                elif options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '':
-                    entities = entities.filter(
-                        attribute_values__attribute__string_id=options['entities-by_attribute']).distinct()
+        queryset = self.get_queryset(options=options, family=family)
+        offset = options['offset'] if family == 'entities' else None
+        limit = options['limit'] if family == 'entities' else None
+        if options['workers'] > 1:
+            ranges = [(from_id, to_id, None) for from_id, to_id in
+                      helpers.get_id_ranges(queryset=queryset, parts=options['workers'] * options['worker_ranges'],
+                                            offset=offset, limit=limit)]
+        elif offset is not None:
+            from_id = helpers.get_id_at_offset(queryset=queryset, offset=offset)
+            ranges = [] if from_id is None else [(from_id, None, limit)]
+        else:
+            ranges = [(None, None, limit)]
+        return models.ReindexCheckpoint.start(target='neo4j', family=family, ranges=ranges,
+                                              options=json.dumps(self.get_worker_options(options), default=str)), options
 
-                entities = entities[current_from:current_to]
+    def get_resume_options(self, checkpoints, options):
+        ret = dict(options)
+        if checkpoints and checkpoints[0].options is not None:
+            stored = json.loads(checkpoints[0].options)
+            for key in self.resume_options:
+                if key in stored and stored[key] != options[key]:
+                    self.stdout.write("Using " + key + "=" + str(stored[key]) + " from the interrupted run")
+                    ret[key] = stored[key]
+        return ret
 
-                do_while = len(entities) > 0
+    def build(self, family, options, checkpoint, verbose=True):
+        neo4j_db = Neo4jDB.get_db()
+
+        queryset = self.get_queryset(options=options, family=family)
+        if checkpoint.range_from_id is not None:
+            queryset = queryset.filter(id__gte=checkpoint.range_from_id)
+        if checkpoint.range_to_id is not None:
+            queryset = queryset.filter(id__lte=checkpoint.range_to_id)
+        if checkpoint.last_id is not None:
+            queryset = queryset.filter(id__gt=checkpoint.last_id)
+
+        chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
+        limit = checkpoint.get_remaining_limit()
+        batch_size = options['commit_size'] if options['unwind'] else 500
 
-                self.stdout.write(
-                    "Indexing " + str(len(entities)) + " entities (from " + str(current_from + 1) + " to " + str(
-                        current_to) + ")...")
-                for entity in entities:
+        started = time.time()
+        ret = 0
+        reported = 0
+        first_id = None
+        last_id = None
+        for batch in helpers.iterate_by_id(queryset=queryset, chunk_size=max(chunk_size, batch_size),
+                                           batch_size=batch_size, limit=limit):
+            if first_id is None:
+                first_id = batch[0].id
+            last_id = batch[-1].id
+            if options['unwind']:
+                batch_started = time.time()
+                if family == 'entities':
+                    neo4j_db.add_entities(entities=batch, overwrite=options['overwrite'], add_connections=False,
+                                          batch_size=options['batch_size'], commit_size=options['commit_size'])
+                else:
+                    neo4j_db.add_connections(entity_entities=batch, overwrite=options['overwrite'],
+                                             batch_size=options['batch_size'], commit_size=options['commit_size'])
+                if verbose:
+                    elapsed = time.time() - batch_started
+                    self.stdout.write(
+                        "Batch of " + str(len(batch)) + " " + family + " (ids " + str(batch[0].id) + " to " + str(
+                            last_id) + ") in " + str(round(elapsed, 2)) + "s, " + str(
+                            round(len(batch) / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
+            else:
+                for entity in batch:
                     if options['queue']:
                         neo4j_db.q_add_entity(entity=entity, overwrite=options['overwrite'], add_connections=True)
                     else:
                         neo4j_db.add_entity(entity=entity, overwrite=options['overwrite'], add_connections=True)
+            ret += len(batch)
+            checkpoint.save_progress(last_id=last_id, rows=len(batch))
 
-                current_from = current_to
+            if verbose and ret - reported >= chunk_size:
+                self.write_progress(family=family, rows=ret, first_id=first_id, last_id=last_id, started=started)
+                reported = ret
+        if verbose and ret > reported:
+            self.write_progress(family=family, rows=ret, first_id=first_id, last_id=last_id, started=started)
+        checkpoint.save_progress(finished=True)
+        return ret
 
-        self.stdout.write(self.style.SUCCESS('Finished!'))
+    def write_progress(self, family, rows, first_id, last_id, started):
+        elapsed = time.time() - started
+        self.stdout.write(
+            "Indexed " + str(rows) + " " + family + " (ids " + str(first_id) + " to " + str(last_id) + "), " + str(
+                round(rows / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
+
+    def build_in_workers(self, family, options, checkpoints):
+        worker_options = self.get_worker_options(options)
+        tasks = [(family, worker_options, checkpoint.id) for checkpoint in checkpoints]
+
+        self.stdout.write(
+            "Indexing " + family + " in " + str(len(tasks)) + " id ranges with " + str(
+                options['workers']) + " workers...")
+        started = time.time()
+        done = 0
+        rows = 0
+        failed = 0
+        for result in helpers.run_in_processes(function=build_range, tasks=tasks, processes=options['workers']):
+            done += 1
+            rows += result['rows']
+            if 'exception' in result:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    "Range " + str(result['from_id']) + "-" + str(result['to_id']) + " failed:\n" + result[
+                        'exception']))
+            elapsed = time.time() - started
+            self.stdout.write(
+                "[" + str(done) + "/" + str(len(tasks)) + "] ids " + str(result['from_id']) + "-" + str(
+                    result['to_id']) + ": " + str(result['rows']) + " " + family + " in " + str(
+                    round(result['seconds'], 1)) + "s, total " + str(rows) + " " + family + ", " + str(
+                    round(rows / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
+        if failed:
+            self.stdout.write(self.style.ERROR('Failed ranges: ' + str(failed)))
@@ -0,0 +1,95 @@
+import gc
+import os
+import time
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from mocbackend import const, graph, helpers
+
+
+def get_memory():
+    ret = {}
+    with open('/proc/self/status') as fp:
+        for line in fp:
+            key, value = line.split(':', 1)
+            if key in ['VmRSS', 'RssAnon', 'RssFile']:
+                ret[key] = int(value.split()[0])
+    return ret
+
+
+def benchmark(task):
+    mode, path, queries = task
+    memory_before = get_memory()
+    started = time.time()
+    compact_graph = graph.CompactGraph.build() if mode == 'build' else graph.CompactGraph.open(path)
+    ret = {
+        'mode': mode,
+        'seconds': time.time() - started,
+    }
+
+    started = time.time()
+    nodes = len(compact_graph.node_flags)
+    step = max(nodes // queries, 1) if queries else 1
+    for index in range(0, nodes, step)[:queries]:
+        compact_graph.neighbours(index=index, depth=2)
+    ret['query_seconds'] = time.time() - started
+    ret['queries'] = len(range(0, nodes, step)[:queries])
+
+    memory_after = get_memory()
+    ret['memory'] = {key: memory_after.get(key, 0) - memory_before.get(key, 0) for key in memory_after}
+    return ret
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--output_dir', dest='output_dir')
+        parser.add_argument('--keep', dest='keep', type=int, default=2)
+        parser.add_argument('--benchmark', dest='benchmark', action='store_true')
+        parser.add_argument('--benchmark_queries', dest='benchmark_queries', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir'] or graph.get_setting('SNAPSHOT_DIR')
+        if output_dir is None:
+            self.stdout.write(self.style.ERROR('Missing --output_dir or GRAPH_ENGINE SNAPSHOT_DIR'))
+            return
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        started = time.time()
+        compact_graph = graph.CompactGraph.build()
+        path = os.path.join(output_dir, const.GRAPH_SNAPSHOT_FILE_PREFIX + timezone.localtime(
+            compact_graph.built_at).strftime('%Y%m%d%H%M%S') + const.GRAPH_SNAPSHOT_FILE_SUFFIX)
+        compact_graph.write(path)
+        self.stdout.write(
+            "Snapshot " + path + " with " + str(compact_graph.base_count) + " nodes and " + str(
+                len(compact_graph.edge_ids)) + " edges (" + str(
+                round(os.path.getsize(path) / 1024 / 1024, 1)) + " MB) in " + str(
+                round(time.time() - started, 1)) + "s")
+        del compact_graph
+        gc.collect()
+
+        self.remove_old(output_dir=output_dir, keep=options['keep'])
+
+        if options['benchmark']:
+            for mode in ['build', 'open']:
+                for result in helpers.run_in_processes(function=benchmark,
+                                                       tasks=[(mode, path, options['benchmark_queries'])],
+                                                       processes=1):
+                    self.stdout.write(
+                        "[" + result['mode'] + "] cold start " + str(round(result['seconds'], 3)) + "s, " + str(
+                            result['queries']) + " 2-hop queries in " + str(
+                            round(result['query_seconds'], 3)) + "s, RSS +" + str(
+                            result['memory'].get('VmRSS', 0)) + " kB (anon +" + str(
+                            result['memory'].get('RssAnon', 0)) + " kB, file +" + str(
+                            result['memory'].get('RssFile', 0)) + " kB)")
+
+        self.stdout.write(self.style.SUCCESS('Finished!'))
+
+    def remove_old(self, output_dir, keep):
+        paths = sorted(
+            file_name for file_name in os.listdir(output_dir) if file_name.startswith(
+                const.GRAPH_SNAPSHOT_FILE_PREFIX) and file_name.endswith(const.GRAPH_SNAPSHOT_FILE_SUFFIX))
+        for file_name in paths[:-keep] if keep > 0 else []:
+            os.remove(os.path.join(output_dir, file_name))
+            self.stdout.write("Removed " + file_name)
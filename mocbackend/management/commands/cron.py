@@ -7,7 +7,7 @@ from django.db.models import Q
 from django.utils import timezone
 from django.utils.timezone import localtime
 
-from mocbackend import helpers, models
+from mocbackend import helpers, models, const
 from mocbackend.databases import ElasticsearchDB, Neo4jDB
 
 
@@ -51,6 +51,12 @@ class Command(BaseCommand):
             elif options['schedule'] == 'update_dbs':
                 job_func_name = 'mocbackend.management.commands.cron.update'
                 time = '0 */12 * * *'
+            elif options['schedule'] == 'reconcile_connection_counts':
+                job_func_name = 'mocbackend.management.commands.cron.reconcile_connection_counts'
+                time = '30 3 * * *'
+            elif options['schedule'] == 'update_graph_metrics':
+                job_func_name = 'mocbackend.management.commands.cron.update_graph_metrics'
+                time = '30 4 * * *'
 
             if job_func_name is None:
                 print('Unknown job')
@@ -77,6 +83,10 @@ class Command(BaseCommand):
                 find_updated_entities_and_send_mail(dry_run=options['dry-run'], verbose=options['verbose'])
             elif options['run'] == 'update_dbs':
                 update(hours=options['hours'], dry_run=options['dry-run'], verbose=options['verbose'])
+            elif options['run'] == 'reconcile_connection_counts':
+                reconcile_connection_counts(dry_run=options['dry-run'], verbose=options['verbose'])
+            elif options['run'] == 'update_graph_metrics':
+                update_graph_metrics(dry_run=options['dry-run'], verbose=options['verbose'])
 
 
 def find_updated_entities_and_send_mail(dry_run=False, verbose=False):
@@ -235,16 +245,22 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
             cache.set('update_dbs_last_run', utcnow, None)
 
         entities_to_index_es = set()
+        entities_attributes_to_index_es = {}
+        entities_pep_to_index_es = set()
         connections_to_index_es = set()
 
         entities_to_index_neo4j = set()
         connections_to_index_neo4j = set()
 
+        entities_to_update_pep = set()
+        connections_ends_to_update_pep = set()
+
         for entity in models.StageEntity.objects.filter(
                 Q(created_at__gte=run_from, created_at__lt=utcnow) | Q(updated_at__gte=run_from,
                                                                        updated_at__lt=utcnow)):
             entities_to_index_es.add(entity)
             entities_to_index_neo4j.add(entity)
+            entities_to_update_pep.add(entity.id)
             for entity_entity in models.StageEntityEntity.objects.filter(Q(entity_a=entity) | Q(entity_b=entity)).all():
                 connections_to_index_es.add(entity_entity)
 
@@ -252,7 +268,8 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
                 Q(created_at__gte=run_from, created_at__lt=utcnow) | Q(
                     updated_at__gte=run_from, updated_at__lt=utcnow)):
             if attribute_value_collection.attribute_value.entity is not None:
-                entities_to_index_es.add(attribute_value_collection.attribute_value.entity)
+                entities_attributes_to_index_es.setdefault(attribute_value_collection.attribute_value.attribute,
+                                                           set()).add(attribute_value_collection.attribute_value.entity)
                 if attribute_value_collection.attribute_value.attribute.string_id in ['person_first_name',
                                                                                       'person_last_name',
                                                                                       'legal_entity_name',
@@ -272,7 +289,7 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
                 Q(created_at__gte=run_from, created_at__lt=utcnow) | Q(
                     updated_at__gte=run_from, updated_at__lt=utcnow)):
             if attribute_value.entity is not None:
-                entities_to_index_es.add(attribute_value.entity)
+                entities_attributes_to_index_es.setdefault(attribute_value.attribute, set()).add(attribute_value.entity)
                 if attribute_value.attribute.string_id in ['person_first_name', 'person_last_name', 'legal_entity_name',
                                                            'legal_entity_entity_type', 'real_estate_name',
                                                            'movable_name', 'savings_name']:
@@ -289,17 +306,38 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
                     updated_at__gte=run_from, updated_at__lt=utcnow)):
             connections_to_index_es.add(entity_entity_collection.entity_entity)
             connections_to_index_neo4j.add(entity_entity_collection.entity_entity)
+            connections_ends_to_update_pep.add(entity_entity_collection.entity_entity.entity_a_id)
+            connections_ends_to_update_pep.add(entity_entity_collection.entity_entity.entity_b_id)
 
         for entity_entity in models.StageEntityEntity.objects.filter(
                 Q(created_at__gte=run_from, created_at__lt=utcnow) | Q(
                     updated_at__gte=run_from, updated_at__lt=utcnow)):
             connections_to_index_es.add(entity_entity)
             connections_to_index_neo4j.add(entity_entity)
+            connections_ends_to_update_pep.add(entity_entity.entity_a_id)
+            connections_ends_to_update_pep.add(entity_entity.entity_b_id)
+
+        if not dry_run:
+            pep_changed = models.StageEntity.update_is_pep(
+                entity_ids=models.StageEntity.get_neighbourhood_ids(entity_ids=entities_to_update_pep,
+                                                                    hops=2) | models.StageEntity.get_neighbourhood_ids(
+                    entity_ids=connections_ends_to_update_pep, hops=1))
+            for entity in models.StageEntity.objects.filter(pk__in=pep_changed.keys()):
+                entities_pep_to_index_es.add(entity)
+                entities_to_index_neo4j.discard(entity)
+                entities_to_index_neo4j.add(entity)
+                for entity_entity in models.StageEntityEntity.objects.filter(Q(entity_a=entity) | Q(entity_b=entity)).all():
+                    connections_to_index_es.add(entity_entity)
+                    connections_to_index_neo4j.add(entity_entity)
 
         if verbose:
             print('Elasticsearch entities:')
             for entity in entities_to_index_es:
                 print(entity.entity_id)
+            print('Elasticsearch entities attributes:')
+            for attribute, entities in entities_attributes_to_index_es.items():
+                for entity in entities:
+                    print(entity.public_id + ' ' + attribute.string_id)
             print('Elasticsearch connections:')
             for connection in connections_to_index_es:
                 print(connection.id)
@@ -313,10 +351,25 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
 
         if not dry_run:
             es = ElasticsearchDB.get_db()
-            for entity in entities_to_index_es:
-                es.q_update_entity(entity=entity, update_connections=False)
-            for connection in connections_to_index_es:
-                es.q_update_connection(entity_entity=connection, calculate_count=True)
+            entities_fully_indexed_es = set(entities_to_index_es)
+            entities_to_index_es = list(entities_to_index_es)
+            for i in range(0, len(entities_to_index_es), 500):
+                es.q_update_entities(entities=entities_to_index_es[i:i + 500], update_connections=False)
+            for attribute, entities in entities_attributes_to_index_es.items():
+                entity_ids = [entity.id for entity in entities - entities_fully_indexed_es]
+                for i in range(0, len(entity_ids), 500):
+                    es.q_update_entities_partial(entity_ids=entity_ids[i:i + 500],
+                                                 slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE],
+                                                 attribute=attribute)
+            entity_ids = [entity.id for entity in entities_pep_to_index_es - entities_fully_indexed_es]
+            for i in range(0, len(entity_ids), 500):
+                es.q_update_entities_partial(entity_ids=entity_ids[i:i + 500],
+                                             slices=[const.ELASTICSEARCH_ENTITY_SLICE_IS_PEP])
+            connections_to_index_es = list(connections_to_index_es)
+            for i in range(0, len(connections_to_index_es), 500):
+                es.q_update_connections(entity_entities=connections_to_index_es[i:i + 500], calculate_count=False)
+            models.StageEntityConnectionCount.update_counts_index(
+                entity_entity_ids=[entity_entity.id for entity_entity in connections_to_index_es])
 
             neo4j = Neo4jDB.get_db()
             for entity in entities_to_index_neo4j:
@@ -328,3 +381,44 @@ def update(hours=None, fallback_hours=12, dry_run=False, verbose=False):
             cache.delete('update_dbs_running')
     elif update_dbs_running is not None:
         print('Another update_dbs is running.')
+
+
+def reconcile_connection_counts(entity_ids=None, dry_run=False, verbose=False):
+    if dry_run:
+        print('Reconcile connection counts' + (' for ' + str(len(entity_ids)) + ' entities' if entity_ids else ''))
+        return set()
+
+    changed = models.StageEntityConnectionCount.reconcile(entity_ids=entity_ids)
+
+    if verbose:
+        print('Connection counts corrected:')
+        for entity_id in changed:
+            print(entity_id)
+
+    es = ElasticsearchDB.get_db()
+    changed_list = list(changed)
+    for i in range(0, len(changed_list), 500):
+        es.q_update_entities_partial(entity_ids=changed_list[i:i + 500],
+                                     slices=[const.ELASTICSEARCH_ENTITY_SLICE_COUNTS])
+
+    return changed
+
+
+def update_graph_metrics(iterations=10, dry_run=False, verbose=False):
+    if dry_run:
+        print('Update graph metrics')
+        return set()
+
+    changed = models.StageEntityGraphMetrics.store(models.StageEntityGraphMetrics.compute(iterations=iterations))
+
+    if verbose:
+        print('Graph metrics changed for ' + str(len(changed)) + ' entities')
+
+    es = ElasticsearchDB.get_db()
+    es.put_entity_graph_metrics_mapping()
+    changed_list = list(changed)
+    for i in range(0, len(changed_list), 500):
+        es.q_update_entities_partial(entity_ids=changed_list[i:i + 500],
+                                     slices=[const.ELASTICSEARCH_ENTITY_SLICE_GRAPH_METRICS])
+
+    return changed
@@ -0,0 +1,137 @@
+import csv
+import gzip
+import os
+import time
+
+from django.core.management import BaseCommand
+
+from mocbackend import helpers, models, const
+from mocbackend.databases import ElasticsearchDB, Neo4jDB
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--output_dir', dest='output_dir', default='.')
+        parser.add_argument('--gzip', dest='gzip', action='store_true')
+        parser.add_argument('--chunk_size', dest='chunk_size', type=int, default=10000)
+        parser.add_argument('--batch_size', dest='batch_size', type=int, default=500)
+
+        parser.add_argument('--entities', dest='entities', action='store_true')
+        parser.add_argument('--connections', dest='connections', action='store_true')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['output_dir']):
+            os.makedirs(options['output_dir'])
+
+        files = []
+        if options['entities']:
+            files.append(('--nodes', self.export_entities(options=options)))
+
+        if options['connections']:
+            if Neo4jDB.is_neo4j_native_graph_model():
+                files.append(('--relationships', self.export_native_connections(options=options)))
+            else:
+                relationships_file, edges_in_file, edges_out_file = self.export_connections(options=options)
+                files.append(('--nodes', relationships_file))
+                files.append(('--relationships', edges_in_file))
+                files.append(('--relationships', edges_out_file))
+
+        if files:
+            self.stdout.write(
+                'neo4j-admin import --id-type=STRING --multiline-fields=true --array-delimiter="' +
+                const.NEO4J_IMPORT_ARRAY_DELIMITER + '" ' + ' '.join(
+                    argument + '=' + file_name for argument, file_name in files))
+            self.stdout.write('python manage.py build-graph-neo4j --create-indexes')
+
+        self.stdout.write(self.style.SUCCESS('Finished!'))
+
+    def open_csv(self, options, name):
+        file_name = os.path.join(options['output_dir'], name + ('.csv.gz' if options['gzip'] else '.csv'))
+        if options['gzip']:
+            fp = gzip.open(file_name, 'wt', encoding='utf-8', newline='')
+        else:
+            fp = open(file_name, 'w', encoding='utf-8', newline='')
+        return file_name, fp
+
+    def export_entities(self, options):
+        queryset = models.StageEntity.objects.filter(published=True, deleted=False).select_related('entity_type')
+
+        file_name, fp = self.open_csv(options=options, name='nodes')
+        with fp:
+            writer = csv.writer(fp)
+            writer.writerow(Neo4jDB.get_neo4j_import_nodes_header())
+
+            started = time.time()
+            rows = 0
+            reported = 0
+            for batch in helpers.iterate_by_id(queryset=queryset, chunk_size=options['chunk_size'],
+                                               batch_size=options['batch_size']):
+                writer.writerows(Neo4jDB.get_neo4j_import_node_rows(batch))
+                rows += len(batch)
+                if rows - reported >= options['chunk_size']:
+                    self.write_progress(name='entities', rows=rows, last_id=batch[-1].id, started=started)
+                    reported = rows
+            self.write_progress(name='entities', rows=rows, last_id=None, started=started)
+        return file_name
+
+    @staticmethod
+    def get_connections_queryset():
+        return models.StageEntityEntity.objects.filter(published=True, deleted=False, entity_a__published=True,
+                                                       entity_a__deleted=False, entity_b__published=True,
+                                                       entity_b__deleted=False)
+
+    def iterate_visible_connections(self, options):
+        started = time.time()
+        rows = 0
+        skipped = 0
+        reported = 0
+        for batch in helpers.iterate_by_id(queryset=self.get_connections_queryset(), chunk_size=options['chunk_size'],
+                                           batch_size=options['batch_size']):
+            collections_states = ElasticsearchDB._get_entity_entity_collections_states(
+                [entity_entity.id for entity_entity in batch])
+            visible_batch = [entity_entity for entity_entity in batch if entity_entity.id in collections_states[0]]
+            skipped += len(batch) - len(visible_batch)
+            properties = Neo4jDB._get_neo4j_connections_to_index(entity_entities=visible_batch,
+                                                                 collections_states=collections_states)
+            for entity_entity in visible_batch:
+                yield entity_entity, properties[entity_entity.id]
+                rows += 1
+            if rows - reported >= options['chunk_size']:
+                self.write_progress(name='connections', rows=rows, last_id=batch[-1].id, started=started)
+                reported = rows
+        self.write_progress(name='connections', rows=rows, last_id=None, started=started)
+        if skipped:
+            self.stdout.write('Skipped ' + str(skipped) + ' connections without visible collection')
+
+    def export_native_connections(self, options):
+        file_name, fp = self.open_csv(options=options, name='connections')
+        with fp:
+            writer = csv.writer(fp)
+            writer.writerow(Neo4jDB.get_neo4j_import_connections_header())
+            for entity_entity, properties in self.iterate_visible_connections(options=options):
+                writer.writerow(Neo4jDB.get_neo4j_import_connection_row(properties=properties))
+        return file_name
+
+    def export_connections(self, options):
+        relationships_file, relationships_fp = self.open_csv(options=options, name='relationships')
+        edges_in_file, edges_in_fp = self.open_csv(options=options, name='edges_in')
+        edges_out_file, edges_out_fp = self.open_csv(options=options, name='edges_out')
+        with relationships_fp, edges_in_fp, edges_out_fp:
+            relationships_writer = csv.writer(relationships_fp)
+            relationships_writer.writerow(Neo4jDB.get_neo4j_import_relationships_header())
+            edges_in_writer = csv.writer(edges_in_fp)
+            edges_in_writer.writerow(Neo4jDB.get_neo4j_import_edges_header(start='node', end='relationship'))
+            edges_out_writer = csv.writer(edges_out_fp)
+            edges_out_writer.writerow(Neo4jDB.get_neo4j_import_edges_header(start='relationship', end='node'))
+
+            for entity_entity, properties in self.iterate_visible_connections(options=options):
+                relationships_writer.writerow(Neo4jDB.get_neo4j_import_relationship_row(properties=properties))
+                edges_in_writer.writerow([entity_entity.entity_a.public_id, entity_entity.id, 'relationship'])
+                edges_out_writer.writerow([entity_entity.id, entity_entity.entity_b.public_id, 'relationship'])
+        return relationships_file, edges_in_file, edges_out_file
+
+    def write_progress(self, name, rows, last_id, started):
+        elapsed = time.time() - started
+        self.stdout.write(
+            "Exported " + str(rows) + " " + name + ("" if last_id is None else " (up to id " + str(
+                last_id) + ")") + ", " + str(round(rows / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
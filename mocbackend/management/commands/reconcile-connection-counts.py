@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from mocbackend import models
+from mocbackend.management.commands import cron
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', dest='entities', nargs='+', type=str)
+        parser.add_argument('--verbose', dest='verbose', action='store_true')
+
+    def handle(self, *args, **options):
+        entity_ids = None
+        if options['entities']:
+            entity_ids = list(
+                models.StageEntity.objects.filter(public_id__in=options['entities']).values_list('id', flat=True))
+        changed = cron.reconcile_connection_counts(entity_ids=entity_ids, verbose=options['verbose'])
+        self.stdout.write(self.style.SUCCESS('Connection counts corrected for ' + str(len(changed)) + ' entities'))
+        self.stdout.write(self.style.SUCCESS('Finished!'))
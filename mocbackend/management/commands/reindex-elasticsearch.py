@@ -1,10 +1,33 @@
-from django.core.management import BaseCommand
+import collections
+import json
+import time
+import traceback
 
-from mocbackend.databases import ElasticsearchDB
-from mocbackend import models
+from django.core.management import BaseCommand, CommandError
+
+from mocbackend.databases import ElasticsearchDB, AttributeValuesPrefetch
+from mocbackend import helpers, models, const
+
+
+def index_range(task):
+    name, options, checkpoint_id = task
+    started = time.time()
+    checkpoint = models.ReindexCheckpoint.objects.get(id=checkpoint_id)
+    try:
+        ret = Command().index(name=name, options=options, checkpoint=checkpoint, verbose=False)
+    except Exception:
+        ret = Command.get_empty_report()
+        ret['exception'] = traceback.format_exc()
+    ret['from_id'] = checkpoint.range_from_id
+    ret['to_id'] = checkpoint.range_to_id
+    ret['seconds'] = time.time() - started
+    return ret
 
 
 class Command(BaseCommand):
+    resume_options = ['overwrite', 'offset', 'limit', 'chunk_size', 'batch_size', 'from_id', 'to_id', 'bulk',
+                      'bulk_size', 'entities-only_force_pep', 'entities-by_public_id', 'entities-by_attribute']
+
     def add_arguments(self, parser):
         parser.add_argument('--init-entities', dest='init-entities', action='store_true')
         parser.add_argument('--init-attributes', dest='init-attributes', action='store_true')
@@ -19,6 +42,21 @@ class Command(BaseCommand):
         parser.add_argument('--offset', dest='offset', type=int)
         parser.add_argument('--limit', dest='limit', type=int)
         parser.add_argument('--chunk_size', dest='chunk_size', type=int)
+        parser.add_argument('--batch_size', dest='batch_size', type=int)
+        parser.add_argument('--from_id', dest='from_id', type=int)
+        parser.add_argument('--to_id', dest='to_id', type=int)
+
+        parser.add_argument('--bulk', dest='bulk', action='store_true')
+        parser.add_argument('--bulk_size', dest='bulk_size', type=int, default=500)
+        parser.add_argument('--bulk_threads', dest='bulk_threads', type=int, default=1)
+        parser.add_argument('--bulk_max_errors', dest='bulk_max_errors', type=int, default=100)
+        parser.add_argument('--bulk_errors_file', dest='bulk_errors_file', type=str)
+
+        parser.add_argument('--workers', dest='workers', type=int, default=1)
+        parser.add_argument('--worker_ranges', dest='worker_ranges', type=int, default=4)
+
+        parser.add_argument('--resume', dest='resume', action='store_true')
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true')
 
         parser.add_argument('--entities', dest='entities', action='store_true')
         parser.add_argument('--entities-only_force_pep', dest='entities-only_force_pep', action='store_true')
@@ -52,195 +90,332 @@ class Command(BaseCommand):
         if options['init-codebook-values']:
             es_db.init_codebook_values(command=self)
 
-        if options['entities']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
-
-                entities = models.StageEntity.objects.all().order_by('id')
-
-                if options['entities-only_force_pep']:
-                    entities = entities.filter(force_pep=True)
-
-                if options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '':
-                    entities = entities.filter(public_id=options['entities-by_public_id'])
-                elif options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '':
-                    entities = entities.filter(
-                        attribute_values__attribute__string_id=options['entities-by_attribute']).distinct()
-
-                entities = entities[current_from:current_to]
-
-                do_while = len(entities) > 0
-
-                self.stdout.write(
-                    "Indexing " + str(len(entities)) + " entities (from " + str(current_from + 1) + " to " + str(
-                        current_to) + ")...")
-                for entity in entities:
-                    if options['queue']:
-                        es_db.q_add_entity(entity=entity, overwrite=options['overwrite'], add_connections=True)
-                    else:
-                        es_db.add_entity(entity=entity, overwrite=options['overwrite'], add_connections=True)
-
-                current_from = current_to
-
-        if options['attributes']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
-
-                attributes = models.StageAttribute.objects.filter(attribute=None).order_by('id')
-                attributes = attributes[current_from:current_to]
-
-                do_while = len(attributes) > 0
-
-                self.stdout.write(
-                    "Indexing " + str(len(attributes)) + " attributes (from " + str(current_from + 1) + " to " + str(
-                        current_to) + ")...")
-                for attribute in attributes:
-                    if options['queue']:
-                        es_db.q_add_attribute(attribute=attribute, overwrite=options['overwrite'])
-                    else:
-                        es_db.add_attribute(attribute=attribute, overwrite=options['overwrite'])
-
-                current_from = current_to
-
-        if options['connection-types']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
+        if options['resume'] and options['queue']:
+            raise CommandError('--resume can not be used with --queue, checkpoints do not track enqueued jobs')
+
+        if options['bulk'] and options['queue']:
+            raise CommandError('--bulk indexes synchronously and can not be used with --queue')
+
+        if options['rebuild'] and (options['queue'] or self.is_entities_filtered(options) or any(
+                options[key] is not None for key in ['offset', 'limit', 'from_id', 'to_id'])):
+            raise CommandError('--rebuild indexes everything synchronously and can not be used with --queue, '
+                               'entity filters, --offset, --limit, --from_id or --to_id')
+
+        rebuild_indices = {
+            'entities': (es_db.init, [const.ELASTICSEARCH_ENTITIES_INDEX_NAME,
+                                      const.ELASTICSEARCH_ALL_ENTITIES_INDEX_NAME,
+                                      const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME,
+                                      const.ELASTICSEARCH_ALL_CONNECTIONS_INDEX_NAME]),
+            'attributes': (es_db.init_attributes, [const.ELASTICSEARCH_ATTRIBUTES_INDEX_NAME]),
+            'connection-types': (es_db.init_connection_types, [const.ELASTICSEARCH_CONNECTION_TYPES_INDEX_NAME]),
+            'attribute-values-log': (es_db.init_attribute_values_log,
+                                     [const.ELASTICSEARCH_ATTRIBUTE_VALUES_LOG_INDEX_NAME]),
+            'entity-entity-log': (es_db.init_entity_entity_log, [const.ELASTICSEARCH_ENTITY_ENTITY_LOG_INDEX_NAME]),
+            'codebook-values': (es_db.init_codebook_values, [const.ELASTICSEARCH_CODEBOOKS_INDEX_NAME]),
+        }
+
+        for name in ['entities', 'attributes', 'connection-types', 'attribute-values-log', 'entity-entity-log',
+                     'codebook-values']:
+            if options[name]:
+                version = None
+                if options['rebuild']:
+                    init, index_names = rebuild_indices[name]
+                    version = es_db.start_rebuild(names=index_names, init=init, resume=options['resume'],
+                                                  command=self)
+                    if version is None:
+                        continue
+                checkpoints, name_options = self.get_checkpoints(name=name, options=options, version=version)
+                if options['workers'] > 1:
+                    report = self.index_in_workers(name=name, options=name_options, checkpoints=checkpoints)
+                else:
+                    report = self.get_empty_report()
+                    for checkpoint in checkpoints:
+                        self.merge_report(report=report,
+                                          result=self.index(name=name, options=name_options, checkpoint=checkpoint),
+                                          max_errors=options['bulk_max_errors'])
+                self.write_report(report=report, options=name_options)
+                if options['rebuild']:
+                    self.finish_rebuild(name=name, index_names=rebuild_indices[name][1], version=version,
+                                        es_db=es_db)
 
-                connection_types = models.StaticConnectionType.objects.all().order_by('id')
-                connection_types = connection_types[current_from:current_to]
-
-                do_while = len(connection_types) > 0
-
-                self.stdout.write("Indexing " + str(len(connection_types)) + " connection types (from " + str(
-                    current_from + 1) + " to " + str(current_to) + ")...")
-                for connection_type in connection_types:
-                    if options['queue']:
-                        es_db.q_add_connection_type(connection_type=connection_type, overwrite=options['overwrite'])
-                    else:
-                        es_db.add_connection_type(connection_type=connection_type, overwrite=options['overwrite'])
-
-                current_from = current_to
-
-        if options['attribute-values-log']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
-
-                attribute_value_changes = models.LogAttributeValueChange.objects.all().order_by('id')
-                attribute_value_changes = attribute_value_changes[current_from:current_to]
-
-                do_while = len(attribute_value_changes) > 0
+        self.stdout.write(self.style.SUCCESS('Finished!'))
 
+    @staticmethod
+    def get_empty_report():
+        return {
+            'rows': 0,
+            'success': 0,
+            'skipped': 0,
+            'failed': 0,
+            'errors': [],
+        }
+
+    @staticmethod
+    def merge_report(report, result, max_errors=None):
+        report['rows'] += result['rows']
+        report['success'] += result['success']
+        report['skipped'] += result['skipped']
+        report['failed'] += result['failed']
+        for error in result['errors']:
+            if max_errors is None or len(report['errors']) < max_errors:
+                report['errors'].append(error)
+
+    def finish_rebuild(self, name, index_names, version, es_db):
+        if not models.ReindexCheckpoint.is_finished(target='elasticsearch', family=name, version=version):
+            self.stdout.write(self.style.ERROR(
+                'Rebuild of ' + name.replace('-', ' ') + ' version ' + version +
+                ' not finished, rerun with --rebuild --resume'))
+            for index_name in index_names:
+                ElasticsearchDB.index_name_overrides.pop(index_name, None)
+            return
+
+        es_db.finish_rebuild(names=index_names, command=self)
+
+    @staticmethod
+    def get_worker_options(options):
+        return {key: value for key, value in options.items() if key not in ['stdout', 'stderr']}
+
+    def get_checkpoints(self, name, options, version=None):
+        if options['resume']:
+            ret = models.ReindexCheckpoint.get_to_resume(target='elasticsearch', family=name, version=version)
+            if ret is not None:
                 self.stdout.write(
-                    "Indexing " + str(len(attribute_value_changes)) + " attribute values changes (from " + str(
-                        current_from + 1) + " to " + str(current_to) + ")...")
-                for attribute_value_change in attribute_value_changes:
-                    if options['queue']:
-                        es_db.q_add_attribute_value_change(attribute_value_change=attribute_value_change,
-                                                           overwrite=options['overwrite'])
-                    else:
-                        es_db.add_attribute_value_change(attribute_value_change=attribute_value_change,
-                                                         overwrite=options['overwrite'])
-
-                current_from = current_to
-
-        if options['entity-entity-log']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
-
-                entity_entity_changes = models.LogEntityEntityChange.objects.all().order_by('id')
-                entity_entity_changes = entity_entity_changes[current_from:current_to]
-
-                do_while = len(entity_entity_changes) > 0
-
-                self.stdout.write("Indexing " + str(len(entity_entity_changes)) + " connection changes (from " + str(
-                    current_from + 1) + " to " + str(current_to) + ")...")
-                for entity_entity_change in entity_entity_changes:
-                    if options['queue']:
-                        es_db.q_add_entity_entity_change(entity_entity_change=entity_entity_change,
-                                                         overwrite=options['overwrite'])
-                    else:
-                        es_db.add_entity_entity_change(entity_entity_change=entity_entity_change,
-                                                       overwrite=options['overwrite'])
-
-                current_from = current_to
-
-        if options['codebook-values']:
-            current_from = options['offset'] if options['offset'] is not None else 0
-            chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
-
-            total_to = None
-            if options['limit'] is not None:
-                total_to = current_from + options['limit']
-
-            do_while = True
-            while do_while and (total_to is None or (current_from < total_to)):
-                current_to = current_from + chunk_size
-                if total_to is not None and current_to > total_to:
-                    current_to = total_to
-
-                codebook_values = models.StageCodebookValue.objects.all().order_by('id')
-                codebook_values = codebook_values[current_from:current_to]
-
-                do_while = len(codebook_values) > 0
+                    "Resuming " + name.replace('-', ' ') + " from " + str(len(ret)) + " unfinished checkpoints...")
+                return ret, self.get_resume_options(checkpoints=ret, options=options)
+            self.stdout.write("No checkpoint for " + name.replace('-', ' ') + ", starting from the beginning...")
+
+        queryset = self.get_queryset(name=name, options=options)
+        if options['workers'] > 1:
+            ranges = [(from_id, to_id, None) for from_id, to_id in
+                      helpers.get_id_ranges(queryset=queryset, parts=options['workers'] * options['worker_ranges'],
+                                            offset=options['offset'], limit=options['limit'])]
+        elif options['offset'] is not None:
+            from_id = helpers.get_id_at_offset(queryset=queryset, offset=options['offset'])
+            ranges = [] if from_id is None else [(from_id, None, options['limit'])]
+        else:
+            ranges = [(None, None, options['limit'])]
+        return models.ReindexCheckpoint.start(target='elasticsearch', family=name, ranges=ranges,
+                                              options=json.dumps(self.get_worker_options(options), default=str),
+                                              version=version), options
+
+    def get_resume_options(self, checkpoints, options):
+        ret = dict(options)
+        if checkpoints and checkpoints[0].options is not None:
+            stored = json.loads(checkpoints[0].options)
+            for key in self.resume_options:
+                if key in stored and stored[key] != options[key]:
+                    self.stdout.write("Using " + key + "=" + str(stored[key]) + " from the interrupted run")
+                    ret[key] = stored[key]
+        return ret
+
+    @staticmethod
+    def get_queryset(name, options):
+        ret = None
+        if name == 'entities':
+            ret = models.StageEntity.objects.all().select_related('entity_type')
+            if options['entities-only_force_pep']:
+                ret = ret.filter(force_pep=True)
+            if options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '':
+                ret = ret.filter(public_id=options['entities-by_public_id'])
+            elif options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '':
+                ret = ret.filter(attribute_values__attribute__string_id=options['entities-by_attribute']).distinct()
+        elif name == 'attributes':
+            ret = models.StageAttribute.objects.filter(attribute=None)
+        elif name == 'connection-types':
+            ret = models.StaticConnectionType.objects.all().select_related('category')
+        elif name == 'attribute-values-log':
+            ret = models.LogAttributeValueChange.objects.all()
+            if options['bulk']:
+                ret = ret.select_related('attribute', 'changeset__collection__source', 'entity',
+                                         'entity_entity__entity_a', 'entity_entity__entity_b',
+                                         'old_value_codebook_item__codebook', 'new_value_codebook_item__codebook')
+        elif name == 'entity-entity-log':
+            ret = models.LogEntityEntityChange.objects.all()
+            if options['bulk']:
+                ret = ret.select_related('changeset__collection__source', 'entity_entity__entity_a',
+                                         'entity_entity__entity_b')
+        elif name == 'codebook-values':
+            ret = models.StageCodebookValue.objects.all().select_related('codebook')
+        if options['from_id'] is not None:
+            ret = ret.filter(id__gte=options['from_id'])
+        if options['to_id'] is not None:
+            ret = ret.filter(id__lte=options['to_id'])
+        return ret.order_by('id')
+
+    @staticmethod
+    def is_entities_filtered(options):
+        return options['entities-only_force_pep'] or (
+                options['entities-by_public_id'] is not None and options['entities-by_public_id'] != '') or (
+                       options['entities-by_attribute'] is not None and options['entities-by_attribute'] != '')
+
+    @staticmethod
+    def get_bulk_actions(name, batch, options, attributes=None):
+        if name == 'entities':
+            return ElasticsearchDB.get_entities_bulk_actions(
+                entities=batch, overwrite=options['overwrite'], add_connections=True,
+                connections_by_entity_a=not Command.is_entities_filtered(options), attributes=attributes)
+        elif name == 'attributes':
+            return ElasticsearchDB.get_attributes_bulk_actions(attributes=batch, overwrite=options['overwrite'])
+        elif name == 'connection-types':
+            return ElasticsearchDB.get_connection_types_bulk_actions(connection_types=batch,
+                                                                     overwrite=options['overwrite'])
+        elif name == 'attribute-values-log':
+            return ElasticsearchDB.get_attribute_value_changes_bulk_actions(attribute_value_changes=batch,
+                                                                            overwrite=options['overwrite'])
+        elif name == 'entity-entity-log':
+            return ElasticsearchDB.get_entity_entity_changes_bulk_actions(entity_entity_changes=batch,
+                                                                          overwrite=options['overwrite'])
+        return ElasticsearchDB.get_codebook_values_bulk_actions(codebook_values=batch, overwrite=options['overwrite'])
+
+    def index(self, name, options, checkpoint, verbose=True):
+        es_db = ElasticsearchDB.get_db()
 
-                self.stdout.write("Indexing " + str(len(codebook_values)) + " codebook values (from " + str(
-                    current_from + 1) + " to " + str(current_to) + ")...")
-                for codebook_value in codebook_values:
+        queryset = self.get_queryset(name=name, options=options)
+        if checkpoint.range_from_id is not None:
+            queryset = queryset.filter(id__gte=checkpoint.range_from_id)
+        if checkpoint.range_to_id is not None:
+            queryset = queryset.filter(id__lte=checkpoint.range_to_id)
+        if checkpoint.last_id is not None:
+            queryset = queryset.filter(id__gt=checkpoint.last_id)
+
+        batch_size = options['batch_size'] if options['batch_size'] is not None else 500
+
+        ret = self.get_empty_report()
+        batches = self.batches(queryset=queryset, name=name.replace('-', ' '), options=options, batch_size=batch_size,
+                               limit=checkpoint.get_remaining_limit(), verbose=verbose, report=ret)
+        attributes = AttributeValuesPrefetch.get_attributes() if name == 'entities' and not options['queue'] else None
+
+        if options['bulk']:
+            flushed = collections.deque()
+
+            def get_actions():
+                count = 0
+                for batch in batches:
+                    for action in self.get_bulk_actions(name=name, batch=batch, options=options,
+                                                        attributes=attributes):
+                        count += 1
+                        yield action
+                    flushed.append((count, batch[-1].id, len(batch)))
+
+            def save_progress(processed):
+                while flushed and flushed[0][0] <= processed:
+                    count, last_id, rows = flushed.popleft()
+                    checkpoint.save_progress(last_id=last_id, rows=rows)
+
+            ret.update(es_db.bulk(actions=get_actions(), chunk_size=options['bulk_size'],
+                                  thread_count=options['bulk_threads'], max_errors=options['bulk_max_errors'],
+                                  callback=save_progress))
+            while flushed:
+                count, last_id, rows = flushed.popleft()
+                checkpoint.save_progress(last_id=last_id, rows=rows)
+        else:
+            for batch in batches:
+                if name == 'entities':
                     if options['queue']:
-                        es_db.q_add_codebook_value(codebook_value=codebook_value, overwrite=options['overwrite'])
+                        es_db.q_add_entities(entities=batch, overwrite=options['overwrite'], add_connections=True)
                     else:
-                        es_db.add_codebook_value(codebook_value=codebook_value, overwrite=options['overwrite'])
-
-                current_from = current_to
-
-        self.stdout.write(self.style.SUCCESS('Finished!'))
+                        es_db.add_entities(entities=batch, overwrite=options['overwrite'], add_connections=True,
+                                           attributes=attributes)
+                else:
+                    for item in batch:
+                        if name == 'attributes':
+                            if options['queue']:
+                                es_db.q_add_attribute(attribute=item, overwrite=options['overwrite'])
+                            else:
+                                es_db.add_attribute(attribute=item, overwrite=options['overwrite'])
+                        elif name == 'connection-types':
+                            if options['queue']:
+                                es_db.q_add_connection_type(connection_type=item, overwrite=options['overwrite'])
+                            else:
+                                es_db.add_connection_type(connection_type=item, overwrite=options['overwrite'])
+                        elif name == 'attribute-values-log':
+                            if options['queue']:
+                                es_db.q_add_attribute_value_change(attribute_value_change=item,
+                                                                   overwrite=options['overwrite'])
+                            else:
+                                es_db.add_attribute_value_change(attribute_value_change=item,
+                                                                 overwrite=options['overwrite'])
+                        elif name == 'entity-entity-log':
+                            if options['queue']:
+                                es_db.q_add_entity_entity_change(entity_entity_change=item,
+                                                                 overwrite=options['overwrite'])
+                            else:
+                                es_db.add_entity_entity_change(entity_entity_change=item,
+                                                               overwrite=options['overwrite'])
+                        else:
+                            if options['queue']:
+                                es_db.q_add_codebook_value(codebook_value=item, overwrite=options['overwrite'])
+                            else:
+                                es_db.add_codebook_value(codebook_value=item, overwrite=options['overwrite'])
+                checkpoint.save_progress(last_id=batch[-1].id, rows=len(batch))
+        checkpoint.save_progress(finished=True)
+        return ret
+
+    def index_in_workers(self, name, options, checkpoints):
+        worker_options = self.get_worker_options(options)
+        tasks = [(name, worker_options, checkpoint.id) for checkpoint in checkpoints]
+
+        self.stdout.write(
+            "Indexing " + name.replace('-', ' ') + " in " + str(len(tasks)) + " id ranges with " + str(
+                options['workers']) + " workers...")
+        ret = self.get_empty_report()
+        started = time.time()
+        done = 0
+        for result in helpers.run_in_processes(function=index_range, tasks=tasks, processes=options['workers']):
+            done += 1
+            self.merge_report(report=ret, result=result, max_errors=options['bulk_max_errors'])
+            if 'exception' in result:
+                ret['failed'] += 1
+                self.stdout.write(self.style.ERROR(
+                    "Range " + str(result['from_id']) + "-" + str(result['to_id']) + " failed:\n" + result[
+                        'exception']))
+            elapsed = time.time() - started
+            self.stdout.write(
+                "[" + str(done) + "/" + str(len(tasks)) + "] ids " + str(result['from_id']) + "-" + str(
+                    result['to_id']) + ": " + str(result['rows']) + " rows in " + str(
+                    round(result['seconds'], 1)) + "s, total " + str(ret['rows']) + " rows, " + str(
+                    round(ret['rows'] / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
+        return ret
+
+    def batches(self, queryset, name, options, batch_size=500, limit=None, verbose=True, report=None):
+        chunk_size = options['chunk_size'] if options['chunk_size'] is not None else 10000
+
+        started = time.time()
+        rows = 0
+        reported_rows = 0
+        first_id = None
+        last_id = None
+        for batch in helpers.iterate_by_id(queryset=queryset, chunk_size=chunk_size, batch_size=batch_size,
+                                           limit=limit):
+            if first_id is None:
+                first_id = batch[0].id
+            last_id = batch[-1].id
+            rows += len(batch)
+            if report is not None:
+                report['rows'] += len(batch)
+            yield batch
+            if verbose and rows - reported_rows >= chunk_size:
+                self.write_progress(name=name, rows=rows, first_id=first_id, last_id=last_id, started=started)
+                reported_rows = rows
+        if verbose and rows > reported_rows:
+            self.write_progress(name=name, rows=rows, first_id=first_id, last_id=last_id, started=started)
+
+    def write_progress(self, name, rows, first_id, last_id, started):
+        elapsed = time.time() - started
+        self.stdout.write(
+            "Indexed " + str(rows) + " " + name + " (ids " + str(first_id) + " to " + str(last_id) + "), " + str(
+                round(rows / elapsed if elapsed > 0 else 0, 1)) + " rows/s")
+
+    def write_report(self, report, options):
+        if options['bulk']:
+            self.stdout.write(
+                'Bulk indexed: ' + str(report['success']) + ', skipped: ' + str(
+                    report['skipped']) + ', failed: ' + str(report['failed']))
+        elif report['failed']:
+            self.stdout.write(self.style.ERROR('Failed ranges: ' + str(report['failed'])))
+        for error in report['errors']:
+            self.stdout.write(self.style.ERROR(json.dumps(error, default=str)))
+        if options['bulk_errors_file'] and report['errors']:
+            with open(options['bulk_errors_file'], 'a') as errors_file:
+                for error in report['errors']:
+                    errors_file.write(json.dumps(error, default=str) + '\n')
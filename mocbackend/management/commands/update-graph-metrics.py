@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from mocbackend.management.commands import cron
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', dest='iterations', type=int, default=10)
+        parser.add_argument('--verbose', dest='verbose', action='store_true')
+
+    def handle(self, *args, **options):
+        changed = cron.update_graph_metrics(iterations=options['iterations'], verbose=options['verbose'])
+        self.stdout.write(self.style.SUCCESS('Graph metrics updated for ' + str(len(changed)) + ' entities'))
+        self.stdout.write(self.style.SUCCESS('Finished!'))
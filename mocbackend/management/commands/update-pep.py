@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from mocbackend import models
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', dest='entities', nargs='+', type=str)
+        parser.add_argument('--hops', dest='hops', type=int, default=2)
+
+    def handle(self, *args, **options):
+        if options['entities']:
+            entity_ids = models.StageEntity.objects.filter(public_id__in=options['entities']).values_list('id',
+                                                                                                         flat=True)
+            changed = models.StageEntity.update_is_pep_neighbourhood(entity_ids=entity_ids, hops=options['hops'])
+        else:
+            changed = models.StageEntity.update_is_pep()
+        self.stdout.write(self.style.SUCCESS('PEP changed for ' + str(len(changed)) + ' entities'))
+        self.stdout.write(self.style.SUCCESS('Finished!'))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2019-02-04 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0039_auto_20190122_0055'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stageentity',
+            name='is_pep',
+            field=models.NullBooleanField(default=None, editable=False),
+        ),
+    ]
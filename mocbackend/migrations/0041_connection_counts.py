@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2019-02-06 14:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0040_stageentity_is_pep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageEntityConnectionCount',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+                ('count_all', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('connection_type_category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entity_connection_counts', to='mocbackend.StaticConnectionTypeCategory')),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='connection_counts', to='mocbackend.StageEntity')),
+            ],
+            options={
+                'db_table': 'mocbackend_stage_entity_connection_count',
+            },
+        ),
+        migrations.CreateModel(
+            name='StageEntityEntityCounted',
+            fields=[
+                ('entity_entity', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='mocbackend.StageEntityEntity')),
+                ('visible', models.BooleanField()),
+                ('connection_type_category', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mocbackend.StaticConnectionTypeCategory')),
+                ('entity_a', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mocbackend.StageEntity')),
+                ('entity_b', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mocbackend.StageEntity')),
+            ],
+            options={
+                'db_table': 'mocbackend_stage_entity_entity_counted',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='stageentityconnectioncount',
+            unique_together=set([('entity', 'connection_type_category')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='stageentityentitycounted',
+            index_together=set([('entity_b', 'connection_type_category'), ('entity_a', 'connection_type_category')]),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2019-02-08 11:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0041_connection_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReindexCheckpoint',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('target', models.CharField(max_length=32)),
+                ('family', models.CharField(max_length=64)),
+                ('range_from_id', models.BigIntegerField(blank=True, null=True)),
+                ('range_to_id', models.BigIntegerField(blank=True, null=True)),
+                ('limit', models.BigIntegerField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(blank=True, null=True)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('options', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'mocbackend_reindex_checkpoint',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='reindexcheckpoint',
+            index_together=set([('target', 'family')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2019-02-12 10:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0042_reindexcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageEntityGraphMetrics',
+            fields=[
+                ('entity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='graph_metrics', serialize=False, to='mocbackend.StageEntity')),
+                ('degree', models.BigIntegerField(default=0)),
+                ('weighted_degree', models.FloatField(default=0)),
+                ('component_id', models.BigIntegerField(blank=True, null=True)),
+                ('component_size', models.BigIntegerField(default=1)),
+                ('centrality', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'mocbackend_stage_entity_graph_metrics',
+            },
+        ),
+    ]
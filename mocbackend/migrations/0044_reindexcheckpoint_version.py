@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.17 on 2019-02-14 09:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0043_stageentitygraphmetrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reindexcheckpoint',
+            name='version',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
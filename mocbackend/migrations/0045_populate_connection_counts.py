@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+POPULATE_COUNTED_SQL = '''
+    INSERT INTO mocbackend_stage_entity_entity_counted (entity_entity_id, entity_a_id, entity_b_id,
+        connection_type_category_id, visible)
+    SELECT ee.id, ee.entity_a_id, ee.entity_b_id, ct.category_id,
+        ee.deleted = FALSE AND ee.published = TRUE AND a.deleted = FALSE AND a.published = TRUE
+        AND b.deleted = FALSE AND b.published = TRUE AND EXISTS (
+            SELECT 1
+            FROM mocbackend_stage_entity_entity_collection eec
+            JOIN mocbackend_stage_collection c ON c.id = eec.collection_id
+            JOIN mocbackend_stage_source s ON s.id = c.source_id
+            WHERE eec.entity_entity_id = ee.id AND eec.deleted = FALSE AND eec.published = TRUE
+                AND c.deleted = FALSE AND c.published = TRUE AND s.deleted = FALSE AND s.published = TRUE
+        )
+    FROM mocbackend_stage_entity_entity ee
+    JOIN mocbackend_static_connection_type ct ON ct.id = ee.connection_type_id
+    JOIN mocbackend_stage_entity a ON a.id = ee.entity_a_id
+    JOIN mocbackend_stage_entity b ON b.id = ee.entity_b_id
+    ON CONFLICT (entity_entity_id) DO UPDATE
+    SET entity_a_id = EXCLUDED.entity_a_id, entity_b_id = EXCLUDED.entity_b_id,
+        connection_type_category_id = EXCLUDED.connection_type_category_id, visible = EXCLUDED.visible
+'''
+
+POPULATE_COUNTS_SQL = '''
+    WITH counted_connection AS (
+        SELECT entity_a_id AS entity_id, connection_type_category_id, visible
+        FROM mocbackend_stage_entity_entity_counted
+        UNION ALL
+        SELECT entity_b_id AS entity_id, connection_type_category_id, visible
+        FROM mocbackend_stage_entity_entity_counted
+    )
+    INSERT INTO mocbackend_stage_entity_connection_count AS cc (entity_id, connection_type_category_id, count,
+        count_all, updated_at)
+    SELECT con.entity_id, con.connection_type_category_id, SUM(CASE WHEN con.visible THEN 1 ELSE 0 END),
+        COUNT(*), NOW()
+    FROM counted_connection con
+    JOIN mocbackend_stage_entity e ON e.id = con.entity_id
+    GROUP BY con.entity_id, con.connection_type_category_id
+    ON CONFLICT (entity_id, connection_type_category_id) DO UPDATE
+    SET count = EXCLUDED.count, count_all = EXCLUDED.count_all, updated_at = NOW()
+'''
+
+
+def populate_connection_counts(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(POPULATE_COUNTED_SQL)
+        cursor.execute(POPULATE_COUNTS_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mocbackend', '0044_reindexcheckpoint_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_connection_counts, migrations.RunPython.noop),
+    ]
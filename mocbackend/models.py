@@ -1,11 +1,12 @@
+from array import array
 from itertools import chain
 
 from ckeditor import fields
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models import Q, Prefetch
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import Q, Prefetch, F
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.formats import number_format, date_format
@@ -230,6 +231,12 @@ class StaticConnectionType(ModelDiffMixin, models.Model):
             es.q_add_connection_type(connection_type=self)
         elif 'name' in changed_fields or 'reverse_name' in changed_fields or 'category' in changed_fields:
             es.q_update_connection_type(connection_type=self)
+        if not adding and 'potentially_pep' in changed_fields:
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, ttl=-1)
+        if not adding and 'category' in changed_fields:
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
         if not adding and has_changed:
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_index, ttl=-1)
@@ -239,11 +246,19 @@ class StaticConnectionType(ModelDiffMixin, models.Model):
         es = ElasticsearchDB.get_db()
         es.q_delete_connection_type(connection_type=self)
 
+    def update_pep(self):
+        StageEntity.update_is_pep_index(
+            entity_ids=StageEntity.get_connections_ends_ids(self.connections.all()), hops=1)
+
+    def update_connection_counts(self):
+        StageEntityConnectionCount.update_counts_index(
+            entity_entity_ids=self.connections.values_list('id', flat=True))
+
     def update_index(self):
         es = ElasticsearchDB.get_db()
         neo4j = Neo4jDB.get_db()
         for entity_entity in self.connections.all():
-            es.q_update_connection(entity_entity=entity_entity, calculate_count=True)
+            es.q_update_connection(entity_entity=entity_entity, calculate_count=False)
             neo4j.q_update_connection(entity_entity=entity_entity)
 
 
@@ -521,6 +536,10 @@ class StageSource(ModelDiffMixin, models.Model):
         if not adding and ('published' in changed_fields or 'deleted' in changed_fields):
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_attributes, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
         else:
             if not adding and (
                     'string_id' in changed_fields or 'name' in changed_fields or 'source_type' in changed_fields):
@@ -554,8 +573,16 @@ class StageSource(ModelDiffMixin, models.Model):
         len(attribute_value_changes)
         entity_entity_changes = LogEntityEntityChange.objects.filter(changeset__collection__source=self)
         len(entity_entity_changes)
+        entity_ids = StageEntity.get_connections_ends_ids(
+            StageEntityEntity.objects.filter(entity_entity_collections__collection__source=self))
+        entity_entity_ids = list(StageEntityEntity.objects.filter(
+            entity_entity_collections__collection__source=self).values_list('id', flat=True).distinct())
         super().delete(*args, **kwargs)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_pep, entity_ids=entity_ids, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_connection_counts, entity_entity_ids=entity_entity_ids, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.update_index, collections=collections, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_attribute_value_log_index, attribute_value_changes=attribute_value_changes, ttl=-1)
@@ -590,13 +617,25 @@ class StageSource(ModelDiffMixin, models.Model):
             for entity_entity_collection in collection.entity_entity_collections.all():
                 if entity_entity_collection.entity_entity not in processed_connections:
                     processed_connections.add(entity_entity_collection.entity_entity)
-                    es.q_update_connection(entity_entity=entity_entity_collection.entity_entity, calculate_count=True)
+                    es.q_update_connection(entity_entity=entity_entity_collection.entity_entity, calculate_count=False)
                     neo4j.q_update_connection(entity_entity=entity_entity_collection.entity_entity)
 
     def update_attributes(self):
         for attribute in StageAttribute.objects.filter(collection=self):
             attribute.save()
 
+    def update_pep(self, entity_ids=None):
+        if entity_ids is None:
+            entity_ids = StageEntity.get_connections_ends_ids(
+                StageEntityEntity.objects.filter(entity_entity_collections__collection__source=self))
+        StageEntity.update_is_pep_index(entity_ids=entity_ids, hops=1)
+
+    def update_connection_counts(self, entity_entity_ids=None):
+        if entity_entity_ids is None:
+            entity_entity_ids = StageEntityEntity.objects.filter(
+                entity_entity_collections__collection__source=self).values_list('id', flat=True).distinct()
+        StageEntityConnectionCount.update_counts_index(entity_entity_ids=entity_entity_ids)
+
     def update_attribute_index(self):
         es = ElasticsearchDB.get_db()
         for attribute in StageAttribute.objects.filter(collection__source=self, attribute=None):
@@ -750,6 +789,10 @@ class StageCollection(ModelDiffMixin, models.Model):
         if not adding and ('published' in changed_fields or 'deleted' in changed_fields or old_source is not None):
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_last_in_log_on_update, old_source=old_source, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
         if not adding and ('published' in changed_fields or 'deleted' in changed_fields):
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_attributes, ttl=-1)
@@ -787,9 +830,17 @@ class StageCollection(ModelDiffMixin, models.Model):
         len(attribute_value_changes)
         entity_entity_changes = LogEntityEntityChange.objects.filter(changeset__collection=self)
         len(entity_entity_changes)
+        entity_ids = StageEntity.get_connections_ends_ids(
+            StageEntityEntity.objects.filter(entity_entity_collections__collection=self))
+        entity_entity_ids = list(StageEntityEntity.objects.filter(
+            entity_entity_collections__collection=self).values_list('id', flat=True).distinct())
         source = self.source
         super().delete(*args, **kwargs)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_pep, entity_ids=entity_ids, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_connection_counts, entity_entity_ids=entity_entity_ids, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.update_last_in_log_on_delete, source=source, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.update_index, attribute_value_collections=attribute_value_collections,
@@ -860,13 +911,25 @@ class StageCollection(ModelDiffMixin, models.Model):
         for entity_entity_collection in entity_entity_collections:
             if entity_entity_collection.entity_entity not in processed_connections:
                 processed_connections.add(entity_entity_collection.entity_entity)
-                es.q_update_connection(entity_entity=entity_entity_collection.entity_entity, calculate_count=True)
+                es.q_update_connection(entity_entity=entity_entity_collection.entity_entity, calculate_count=False)
                 neo4j.q_update_connection(entity_entity=entity_entity_collection.entity_entity)
 
     def update_attributes(self):
         for attribute in StageAttribute.objects.filter(collection=self):
             attribute.save()
 
+    def update_pep(self, entity_ids=None):
+        if entity_ids is None:
+            entity_ids = StageEntity.get_connections_ends_ids(
+                StageEntityEntity.objects.filter(entity_entity_collections__collection=self))
+        StageEntity.update_is_pep_index(entity_ids=entity_ids, hops=1)
+
+    def update_connection_counts(self, entity_entity_ids=None):
+        if entity_entity_ids is None:
+            entity_entity_ids = StageEntityEntity.objects.filter(
+                entity_entity_collections__collection=self).values_list('id', flat=True).distinct()
+        StageEntityConnectionCount.update_counts_index(entity_entity_ids=entity_entity_ids)
+
     def update_attribute_index(self):
         es = ElasticsearchDB.get_db()
         for attribute in self.attributes.filter(attribute=None):
@@ -1368,13 +1431,16 @@ class StageAttribute(ModelDiffMixin, models.Model):
             if attribute_value.entity is not None:
                 if attribute_value.entity not in processed_entities:
                     processed_entities.add(attribute_value.entity)
-                    es.q_update_entity(entity=attribute_value.entity, update_connections=False)
                     if attribute_value.attribute in neo4j_attributes:
                         neo4j.q_update_entity(entity=attribute_value.entity, update_connections=False)
             elif attribute_value.entity_entity is not None:
                 if attribute_value.entity_entity not in processed_connections:
                     processed_connections.add(attribute_value.entity_entity)
                     es.q_update_connection(entity_entity=attribute_value.entity_entity, calculate_count=False)
+        entity_ids = [entity.id for entity in processed_entities]
+        for i in range(0, len(entity_ids), 500):
+            es.q_update_entities_partial(entity_ids=entity_ids[i:i + 500],
+                                         slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE], attribute=self)
 
     def update_index_delete(self, attribute_values_array):
         es = ElasticsearchDB.get_db()
@@ -1412,6 +1478,7 @@ class StageEntity(ModelDiffMixin, models.Model):
     entity_type = models.ForeignKey(StaticEntityType, on_delete=models.PROTECT, related_name='entities')
     linked_potentially_pep = models.BooleanField(default=False)
     force_pep = models.BooleanField(default=False)
+    is_pep = models.NullBooleanField(default=None, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     published = models.BooleanField(default=True)
@@ -1421,6 +1488,54 @@ class StageEntity(ModelDiffMixin, models.Model):
 
     _save_only_in_db = True
 
+    # person is pep if force_pep or connected directly or over one visible entity with visible connections to visible
+    # force_pep entity or with potentially_pep connection type to visible linked_potentially_pep legal entity
+    _update_is_pep_sql = '''
+        WITH visible_connection AS (
+            SELECT ee.entity_a_id, ee.entity_b_id, ct.potentially_pep
+            FROM mocbackend_stage_entity_entity ee
+            JOIN mocbackend_static_connection_type ct ON ct.id = ee.connection_type_id
+            WHERE ee.deleted = FALSE AND ee.published = TRUE {connection_filter} AND EXISTS (
+                SELECT 1
+                FROM mocbackend_stage_entity_entity_collection eec
+                JOIN mocbackend_stage_collection c ON c.id = eec.collection_id
+                JOIN mocbackend_stage_source s ON s.id = c.source_id
+                WHERE eec.entity_entity_id = ee.id AND eec.deleted = FALSE AND eec.published = TRUE
+                    AND c.deleted = FALSE AND c.published = TRUE AND s.deleted = FALSE AND s.published = TRUE
+            )
+        ), edge AS (
+            SELECT entity_a_id AS entity_id, entity_b_id AS other_id, potentially_pep FROM visible_connection
+            UNION ALL
+            SELECT entity_b_id AS entity_id, entity_a_id AS other_id, potentially_pep FROM visible_connection
+        ), linked_to_pep AS (
+            SELECT DISTINCT edge.entity_id
+            FROM edge
+            JOIN mocbackend_stage_entity o ON o.id = edge.other_id
+            JOIN mocbackend_static_entity_type ot ON ot.id = o.entity_type_id
+            WHERE o.deleted = FALSE AND o.published = TRUE AND (o.force_pep OR (
+                edge.potentially_pep AND o.linked_potentially_pep AND ot.string_id = 'legal_entity'))
+        ), pep AS (
+            SELECT entity_id FROM linked_to_pep
+            UNION
+            SELECT edge.entity_id
+            FROM edge
+            JOIN linked_to_pep ON linked_to_pep.entity_id = edge.other_id
+            JOIN mocbackend_stage_entity o ON o.id = edge.other_id
+            WHERE o.deleted = FALSE AND o.published = TRUE
+        ), calculated AS (
+            SELECT e.id, CASE WHEN et.string_id = 'person' THEN e.force_pep OR pep.entity_id IS NOT NULL END AS is_pep
+            FROM mocbackend_stage_entity e
+            JOIN mocbackend_static_entity_type et ON et.id = e.entity_type_id
+            LEFT JOIN pep ON pep.entity_id = e.id
+            WHERE TRUE {entity_filter}
+        )
+        UPDATE mocbackend_stage_entity e
+        SET is_pep = calculated.is_pep, updated_at = NOW()
+        FROM calculated
+        WHERE e.id = calculated.id AND e.is_pep IS DISTINCT FROM calculated.is_pep
+        RETURNING e.id, e.is_pep
+    '''
+
     class Meta:
         db_table = 'mocbackend_stage_entity'
         index_together = [
@@ -1450,15 +1565,24 @@ class StageEntity(ModelDiffMixin, models.Model):
         if not adding and 'published' in changed_fields or 'deleted' in changed_fields:
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_entity_entity_log_index, ttl=-1)
-        if not self._save_only_in_db:
-            es = ElasticsearchDB.get_db()
-            neo4j = Neo4jDB.get_db()
-            if adding:
-                es.q_add_entity(entity=self, overwrite=False, add_connections=True)
-                neo4j.q_add_entity(entity=self, overwrite=False, add_connections=True)
-            elif 'published' in changed_fields or 'deleted' in changed_fields or 'public_id' in changed_fields or 'entity_type' in changed_fields or 'linked_potentially_pep' in changed_fields or 'force_pep' in changed_fields:
-                es.q_update_entity(entity=self, update_connections=True)
-                neo4j.q_update_entity(entity=self, update_connections=False)
+        if not adding and ('published' in changed_fields or 'deleted' in changed_fields):
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
+        update_index = not self._save_only_in_db and (
+                adding or 'published' in changed_fields or 'deleted' in changed_fields or 'public_id' in changed_fields or 'entity_type' in changed_fields or 'linked_potentially_pep' in changed_fields or 'force_pep' in changed_fields)
+        if adding or 'published' in changed_fields or 'deleted' in changed_fields or 'entity_type' in changed_fields or 'linked_potentially_pep' in changed_fields or 'force_pep' in changed_fields:
+            exclude_ids = None
+            if update_index:
+                changed = StageEntity.update_is_pep(entity_ids=[self.id])
+                if self.id in changed:
+                    self.is_pep = changed[self.id]
+                exclude_ids = [self.id]
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            job = queue.enqueue(self.update_pep, exclude_ids=exclude_ids, ttl=-1)
+            if update_index:
+                self.update_index(adding=adding, depends_on=job)
+        elif update_index:
+            self.update_index(adding=adding)
 
     def delete(self, *args, **kwargs):
         attribute_value_changes = LogAttributeValueChange.objects.filter(entity=self)
@@ -1469,12 +1593,19 @@ class StageEntity(ModelDiffMixin, models.Model):
         entity_entity_changes = LogEntityEntityChange.objects.filter(
             Q(entity_entity__entity_a=self) | Q(entity_entity__entity_b=self))
         len(entity_entity_changes)
+        neighbour_ids = StageEntity.get_neighbourhood_ids(entity_ids=[self.id], hops=1) - {self.id}
+        entity_entity_ids = list(
+            StageEntityEntity.objects.filter(Q(entity_a=self) | Q(entity_b=self)).values_list('id', flat=True))
         super().delete(*args, **kwargs)
         es = ElasticsearchDB.get_db()
         neo4j = Neo4jDB.get_db()
-        es.q_delete_entity(entity=self, delete_all=True)
+        es.q_delete_entity(entity=self, delete_all=True, calculate_count=False)
         neo4j.q_delete_entity(entity=self)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_pep, entity_ids=neighbour_ids, hops=1, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_connection_counts, entity_entity_ids=entity_entity_ids, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_attribute_value_log_index, attribute_value_changes=attribute_value_changes, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_attribute_value_log_index, attribute_value_changes=attribute_value_changes2, ttl=-1)
@@ -1505,6 +1636,86 @@ class StageEntity(ModelDiffMixin, models.Model):
         for entity_entity_change in entity_entity_changes:
             es.q_delete_entity_entity_change(entity_entity_change=entity_entity_change)
 
+    def update_index(self, adding=False, depends_on=None):
+        es = ElasticsearchDB.get_db()
+        neo4j = Neo4jDB.get_db()
+        if adding:
+            es.q_add_entity(entity=self, overwrite=False, add_connections=True, depends_on=depends_on)
+            neo4j.q_add_entity(entity=self, overwrite=False, add_connections=True, depends_on=depends_on)
+        else:
+            es.q_update_entity(entity=self, update_connections=True, depends_on=depends_on)
+            neo4j.q_update_entity(entity=self, update_connections=False, depends_on=depends_on)
+
+    def update_pep(self, entity_ids=None, hops=2, exclude_ids=None):
+        if entity_ids is None:
+            entity_ids = [self.id]
+        StageEntity.update_is_pep_index(entity_ids=entity_ids, hops=hops, exclude_ids=exclude_ids)
+
+    def update_connection_counts(self, entity_entity_ids=None):
+        if entity_entity_ids is None:
+            entity_entity_ids = StageEntityEntity.objects.filter(Q(entity_a=self) | Q(entity_b=self)).values_list(
+                'id', flat=True)
+        StageEntityConnectionCount.update_counts_index(entity_entity_ids=entity_entity_ids)
+
+    @staticmethod
+    def get_neighbourhood_ids(entity_ids, hops=1):
+        ret = set(entity_ids)
+        current = set(entity_ids)
+        for i in range(hops):
+            if not current:
+                break
+            neighbours = StageEntity.get_connections_ends_ids(
+                StageEntityEntity.objects.filter(Q(entity_a_id__in=current) | Q(entity_b_id__in=current)))
+            current = neighbours - ret
+            ret.update(neighbours)
+        return ret
+
+    @staticmethod
+    def get_connections_ends_ids(entity_entities):
+        ret = set()
+        for entity_a_id, entity_b_id in entity_entities.values_list('entity_a_id', 'entity_b_id'):
+            ret.add(entity_a_id)
+            ret.add(entity_b_id)
+        return ret
+
+    @staticmethod
+    def update_is_pep(entity_ids=None):
+        params = None
+        connection_filter = ''
+        entity_filter = ''
+        if entity_ids is not None:
+            entity_ids = list(entity_ids)
+            if not entity_ids:
+                return {}
+            params = {
+                'entity_ids': entity_ids,
+                'area_ids': list(StageEntity.get_neighbourhood_ids(entity_ids=entity_ids, hops=1))
+            }
+            connection_filter = 'AND (ee.entity_a_id = ANY(%(area_ids)s) OR ee.entity_b_id = ANY(%(area_ids)s))'
+            entity_filter = 'AND e.id = ANY(%(entity_ids)s)'
+        with connection.cursor() as cursor:
+            cursor.execute(StageEntity._update_is_pep_sql.format(connection_filter=connection_filter,
+                                                                 entity_filter=entity_filter), params)
+            return dict(cursor.fetchall())
+
+    @staticmethod
+    def update_is_pep_neighbourhood(entity_ids, hops=1):
+        return StageEntity.update_is_pep(entity_ids=StageEntity.get_neighbourhood_ids(entity_ids=entity_ids, hops=hops))
+
+    @staticmethod
+    def update_is_pep_index(entity_ids, hops=1, exclude_ids=None):
+        changed = StageEntity.update_is_pep_neighbourhood(entity_ids=entity_ids, hops=hops)
+        changed_ids = [entity_id for entity_id in changed if exclude_ids is None or entity_id not in exclude_ids]
+        if changed_ids:
+            es = ElasticsearchDB.get_db()
+            neo4j = Neo4jDB.get_db()
+            for i in range(0, len(changed_ids), 500):
+                es.q_update_entities_partial(entity_ids=changed_ids[i:i + 500],
+                                             slices=[const.ELASTICSEARCH_ENTITY_SLICE_IS_PEP], update_connections=True)
+            for entity in StageEntity.objects.filter(pk__in=changed_ids):
+                neo4j.q_update_entity(entity=entity, update_connections=True)
+        return changed
+
 
 class StageEntityEntity(ModelDiffMixin, models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -1560,14 +1771,24 @@ class StageEntityEntity(ModelDiffMixin, models.Model):
             queue.enqueue(self.update_attribute_value_log_index, ttl=-1)
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_entity_entity_log_index, ttl=-1)
+        if adding or 'published' in changed_fields or 'deleted' in changed_fields or 'entity_a' in changed_fields or 'entity_b' in changed_fields or 'connection_type' in changed_fields:
+            entity_ids = {self.entity_a_id, self.entity_b_id}
+            if not adding and 'entity_a' in changed_fields:
+                entity_ids.add(self.diff['entity_a'][0])
+            if not adding and 'entity_b' in changed_fields:
+                entity_ids.add(self.diff['entity_b'][0])
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, entity_ids=entity_ids, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
         if not self._save_only_in_db:
             es = ElasticsearchDB.get_db()
             neo4j = Neo4jDB.get_db()
             if adding:
-                es.q_add_connection(entity_entity=self, calculate_count=True, overwrite=False)
+                es.q_add_connection(entity_entity=self, calculate_count=False, overwrite=False)
                 neo4j.q_add_connection(entity_entity=self, overwrite=False)
             elif has_changed:
-                es.q_update_connection(entity_entity=self, calculate_count=True)
+                es.q_update_connection(entity_entity=self, calculate_count=False)
                 neo4j.q_update_connection(entity_entity=self)
 
     def delete(self, *args, **kwargs):
@@ -1575,12 +1796,17 @@ class StageEntityEntity(ModelDiffMixin, models.Model):
         len(attribute_value_changes)
         entity_entity_changes = LogEntityEntityChange.objects.filter(entity_entity=self)
         len(entity_entity_changes)
+        entity_entity_id = self.id
         super().delete(*args, **kwargs)
         es = ElasticsearchDB.get_db()
         neo4j = Neo4jDB.get_db()
-        es.q_delete_connection(entity_entity=self, calculate_count=True, delete_all=True)
+        es.q_delete_connection(entity_entity=self, calculate_count=False, delete_all=True)
         neo4j.q_delete_connection(entity_entity=self)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_pep, ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
+        queue.enqueue(self.update_connection_counts, entity_entity_ids=[entity_entity_id], ttl=-1)
+        queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_attribute_value_log_index, attribute_value_changes=attribute_value_changes, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_entity_entity_log_index, entity_entity_changes=entity_entity_changes, ttl=-1)
@@ -1605,6 +1831,16 @@ class StageEntityEntity(ModelDiffMixin, models.Model):
         for entity_entity_change in entity_entity_changes:
             es.q_delete_entity_entity_change(entity_entity_change=entity_entity_change)
 
+    def update_pep(self, entity_ids=None):
+        if entity_ids is None:
+            entity_ids = [self.entity_a_id, self.entity_b_id]
+        StageEntity.update_is_pep_index(entity_ids=entity_ids, hops=1)
+
+    def update_connection_counts(self, entity_entity_ids=None):
+        if entity_entity_ids is None:
+            entity_entity_ids = [self.id]
+        StageEntityConnectionCount.update_counts_index(entity_entity_ids=entity_entity_ids)
+
 
 class StageAttributeValue(ModelDiffMixin, models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -1678,7 +1914,8 @@ class StageAttributeValue(ModelDiffMixin, models.Model):
                                                                   'legal_entity_name', 'legal_entity_entity_type',
                                                                   'real_estate_name', 'movable_name', 'savings_name']
                 if self.entity is not None:
-                    es.q_update_entity(entity=self.entity, update_connections=update_connections)
+                    es.q_update_entity_partial(entity=self.entity, slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE],
+                                               attribute=self.attribute, update_connections=update_connections)
                     if update_connections:
                         neo4j.q_update_entity(entity=self.entity, update_connections=False)
                 elif self.entity_entity is not None:
@@ -1692,7 +1929,8 @@ class StageAttributeValue(ModelDiffMixin, models.Model):
                                                           'legal_entity_entity_type', 'real_estate_name',
                                                           'movable_name', 'savings_name']
         if self.entity is not None:
-            es.q_update_entity(entity=self.entity, update_connections=update_connections)
+            es.q_update_entity_partial(entity=self.entity, slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE],
+                                       attribute=self.attribute, update_connections=update_connections)
             if update_connections:
                 neo4j.q_update_entity(entity=self.entity, update_connections=False)
         elif self.entity_entity is not None:
@@ -2362,7 +2600,10 @@ class StageAttributeValueCollection(ModelDiffMixin, models.Model):
                                                                                   'real_estate_name', 'movable_name',
                                                                                   'savings_name']
                 if self.attribute_value.entity is not None:
-                    es.q_update_entity(entity=self.attribute_value.entity, update_connections=update_connections)
+                    es.q_update_entity_partial(entity=self.attribute_value.entity,
+                                               slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE],
+                                               attribute=self.attribute_value.attribute,
+                                               update_connections=update_connections)
                     if update_connections:
                         neo4j.q_update_entity(entity=self.attribute_value.entity, update_connections=False)
                 elif self.attribute_value.entity_entity is not None:
@@ -2383,7 +2624,10 @@ class StageAttributeValueCollection(ModelDiffMixin, models.Model):
                                                                               'real_estate_name', 'movable_name',
                                                                               'savings_name']
             if self.attribute_value.entity is not None:
-                es.q_update_entity(entity=self.attribute_value.entity, update_connections=update_connections)
+                es.q_update_entity_partial(entity=self.attribute_value.entity,
+                                           slices=[const.ELASTICSEARCH_ENTITY_SLICE_ATTRIBUTE],
+                                           attribute=self.attribute_value.attribute,
+                                           update_connections=update_connections)
                 if update_connections:
                     neo4j.q_update_entity(entity=self.attribute_value.entity, update_connections=False)
             elif self.attribute_value.entity_entity is not None:
@@ -2429,14 +2673,25 @@ class StageEntityEntityCollection(ModelDiffMixin, models.Model):
             queue.enqueue(self.update_attribute_value_log_index, old_entity_entity=old_entity_entity, ttl=-1)
             queue = helpers.get_queue(queue='db', default_timeout='60m')
             queue.enqueue(self.update_entity_entity_log_index, old_entity_entity=old_entity_entity, ttl=-1)
+        if adding or 'published' in changed_fields or 'deleted' in changed_fields or 'entity_entity' in changed_fields or 'collection' in changed_fields:
+            entity_ids = {self.entity_entity.entity_a_id, self.entity_entity.entity_b_id}
+            if old_entity_entity is not None:
+                entity_ids.update([old_entity_entity.entity_a_id, old_entity_entity.entity_b_id])
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, entity_ids=entity_ids, ttl=-1)
+            entity_entity_ids = [self.entity_entity_id]
+            if old_entity_entity is not None:
+                entity_entity_ids.append(old_entity_entity.id)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, entity_entity_ids=entity_entity_ids, ttl=-1)
         if not self._save_only_in_db:
             es = ElasticsearchDB.get_db()
             neo4j = Neo4jDB.get_db()
             if adding:
-                es.q_add_connection(entity_entity=self.entity_entity, calculate_count=True, overwrite=False)
+                es.q_add_connection(entity_entity=self.entity_entity, calculate_count=False, overwrite=False)
                 neo4j.q_add_connection(entity_entity=self, overwrite=False)
             elif has_changed:
-                es.q_update_connection(entity_entity=self.entity_entity, calculate_count=True)
+                es.q_update_connection(entity_entity=self.entity_entity, calculate_count=False)
                 neo4j.q_update_connection(entity_entity=self.entity_entity)
 
     def delete(self, *args, **kwargs):
@@ -2454,8 +2709,12 @@ class StageEntityEntityCollection(ModelDiffMixin, models.Model):
         else:
             es = ElasticsearchDB.get_db()
             neo4j = Neo4jDB.get_db()
-            es.q_delete_connection(entity_entity=self.entity_entity, calculate_count=True, delete_all=True)
+            es.q_delete_connection(entity_entity=self.entity_entity, calculate_count=False, delete_all=True)
             neo4j.q_delete_connection(entity_entity=self)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_pep, ttl=-1)
+            queue = helpers.get_queue(queue='db', default_timeout='60m')
+            queue.enqueue(self.update_connection_counts, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
         queue.enqueue(self.delete_attribute_value_log_index, attribute_value_changes=attribute_value_changes, ttl=-1)
         queue = helpers.get_queue(queue='db', default_timeout='60m')
@@ -2497,6 +2756,435 @@ class StageEntityEntityCollection(ModelDiffMixin, models.Model):
         for entity_entity_change in entity_entity_changes:
             es.q_update_entity_entity_change(entity_entity_change=entity_entity_change)
 
+    def update_pep(self, entity_ids=None):
+        if entity_ids is None:
+            entity_ids = [self.entity_entity.entity_a_id, self.entity_entity.entity_b_id]
+        StageEntity.update_is_pep_index(entity_ids=entity_ids, hops=1)
+
+    def update_connection_counts(self, entity_entity_ids=None):
+        if entity_entity_ids is None:
+            entity_entity_ids = [self.entity_entity_id]
+        StageEntityConnectionCount.update_counts_index(entity_entity_ids=entity_entity_ids)
+
+
+class StageEntityEntityCounted(models.Model):
+    entity_entity = models.OneToOneField(StageEntityEntity, on_delete=models.DO_NOTHING, db_constraint=False,
+                                         primary_key=True, related_name='+')
+    entity_a = models.ForeignKey(StageEntity, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    entity_b = models.ForeignKey(StageEntity, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    connection_type_category = models.ForeignKey(StaticConnectionTypeCategory, on_delete=models.DO_NOTHING,
+                                                 db_constraint=False, related_name='+')
+    visible = models.BooleanField()
+
+    class Meta:
+        db_table = 'mocbackend_stage_entity_entity_counted'
+        index_together = [
+            ('entity_a', 'connection_type_category'),
+            ('entity_b', 'connection_type_category'),
+        ]
+
+
+class StageEntityConnectionCount(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    entity = models.ForeignKey(StageEntity, on_delete=models.CASCADE, related_name='connection_counts')
+    connection_type_category = models.ForeignKey(StaticConnectionTypeCategory, on_delete=models.CASCADE,
+                                                 related_name='entity_connection_counts')
+    count = models.BigIntegerField(default=0)
+    count_all = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    _current_sql = '''
+        SELECT ee.id, ee.entity_a_id, ee.entity_b_id, ct.category_id,
+            ee.deleted = FALSE AND ee.published = TRUE AND a.deleted = FALSE AND a.published = TRUE
+            AND b.deleted = FALSE AND b.published = TRUE AND EXISTS (
+                SELECT 1
+                FROM mocbackend_stage_entity_entity_collection eec
+                JOIN mocbackend_stage_collection c ON c.id = eec.collection_id
+                JOIN mocbackend_stage_source s ON s.id = c.source_id
+                WHERE eec.entity_entity_id = ee.id AND eec.deleted = FALSE AND eec.published = TRUE
+                    AND c.deleted = FALSE AND c.published = TRUE AND s.deleted = FALSE AND s.published = TRUE
+            )
+        FROM mocbackend_stage_entity_entity ee
+        JOIN mocbackend_static_connection_type ct ON ct.id = ee.connection_type_id
+        JOIN mocbackend_stage_entity a ON a.id = ee.entity_a_id
+        JOIN mocbackend_stage_entity b ON b.id = ee.entity_b_id
+        WHERE {connection_filter}
+    '''
+
+    _add_counts_sql = '''
+        INSERT INTO mocbackend_stage_entity_connection_count AS cc (entity_id, connection_type_category_id, count,
+            count_all, updated_at)
+        SELECT d.entity_id, d.connection_type_category_id, d.count, d.count_all, NOW()
+        FROM unnest(%(entity_ids)s::BIGINT[], %(connection_type_category_ids)s::INTEGER[], %(counts)s::BIGINT[],
+            %(counts_all)s::BIGINT[]) AS d(entity_id, connection_type_category_id, count, count_all)
+        JOIN mocbackend_stage_entity e ON e.id = d.entity_id
+        ON CONFLICT (entity_id, connection_type_category_id) DO UPDATE
+        SET count = cc.count + EXCLUDED.count, count_all = cc.count_all + EXCLUDED.count_all, updated_at = NOW()
+    '''
+
+    _reconcile_counted_sql = '''
+        WITH current AS (
+            {current_sql}
+        ), removed AS (
+            DELETE FROM mocbackend_stage_entity_entity_counted cnt
+            WHERE {counted_filter} NOT EXISTS (
+                SELECT 1 FROM mocbackend_stage_entity_entity ee WHERE ee.id = cnt.entity_entity_id)
+        )
+        INSERT INTO mocbackend_stage_entity_entity_counted (entity_entity_id, entity_a_id, entity_b_id,
+            connection_type_category_id, visible)
+        SELECT * FROM current
+        ON CONFLICT (entity_entity_id) DO UPDATE
+        SET entity_a_id = EXCLUDED.entity_a_id, entity_b_id = EXCLUDED.entity_b_id,
+            connection_type_category_id = EXCLUDED.connection_type_category_id, visible = EXCLUDED.visible
+    '''
+
+    _reconcile_counts_sql = '''
+        WITH counted_connection AS (
+            SELECT entity_a_id AS entity_id, connection_type_category_id, visible
+            FROM mocbackend_stage_entity_entity_counted
+            WHERE TRUE {entity_a_filter}
+            UNION ALL
+            SELECT entity_b_id AS entity_id, connection_type_category_id, visible
+            FROM mocbackend_stage_entity_entity_counted
+            WHERE TRUE {entity_b_filter}
+        )
+        INSERT INTO mocbackend_stage_entity_connection_count AS cc (entity_id, connection_type_category_id, count,
+            count_all, updated_at)
+        SELECT con.entity_id, con.connection_type_category_id, SUM(CASE WHEN con.visible THEN 1 ELSE 0 END),
+            COUNT(*), NOW()
+        FROM counted_connection con
+        JOIN mocbackend_stage_entity e ON e.id = con.entity_id
+        GROUP BY con.entity_id, con.connection_type_category_id
+        ON CONFLICT (entity_id, connection_type_category_id) DO UPDATE
+        SET count = EXCLUDED.count, count_all = EXCLUDED.count_all, updated_at = NOW()
+        WHERE cc.count <> EXCLUDED.count OR cc.count_all <> EXCLUDED.count_all
+        RETURNING cc.entity_id
+    '''
+
+    _reconcile_stale_counts_sql = '''
+        UPDATE mocbackend_stage_entity_connection_count cc
+        SET count = 0, count_all = 0, updated_at = NOW()
+        WHERE (cc.count <> 0 OR cc.count_all <> 0) {entity_filter} AND NOT EXISTS (
+            SELECT 1
+            FROM mocbackend_stage_entity_entity_counted cnt
+            WHERE (cnt.entity_a_id = cc.entity_id OR cnt.entity_b_id = cc.entity_id)
+                AND cnt.connection_type_category_id = cc.connection_type_category_id
+        )
+        RETURNING cc.entity_id
+    '''
+
+    class Meta:
+        db_table = 'mocbackend_stage_entity_connection_count'
+        unique_together = [
+            ('entity', 'connection_type_category')
+        ]
+
+    @staticmethod
+    def update_counts(entity_entity_ids, retries=3):
+        entity_entity_ids = list(set(entity_entity_ids))
+        if not entity_entity_ids:
+            return set()
+        for i in range(retries):
+            try:
+                return StageEntityConnectionCount._update_counts(entity_entity_ids=entity_entity_ids)
+            except IntegrityError:
+                if i == retries - 1:
+                    raise
+
+    @staticmethod
+    def _update_counts(entity_entity_ids):
+        with transaction.atomic():
+            counted = {}
+            for entity_entity_counted in StageEntityEntityCounted.objects.select_for_update().filter(
+                    entity_entity_id__in=entity_entity_ids):
+                counted[entity_entity_counted.entity_entity_id] = entity_entity_counted
+            with connection.cursor() as cursor:
+                cursor.execute(StageEntityConnectionCount._current_sql.format(
+                    connection_filter='ee.id = ANY(%(entity_entity_ids)s)'), {'entity_entity_ids': entity_entity_ids})
+                current = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+            deltas = {}
+
+            def add_delta(state, sign):
+                entity_a_id, entity_b_id, connection_type_category_id, visible = state
+                for entity_id in [entity_a_id, entity_b_id]:
+                    delta = deltas.setdefault((entity_id, connection_type_category_id), [0, 0])
+                    delta[0] += sign if visible else 0
+                    delta[1] += sign
+
+            entity_entity_counted_to_delete = []
+            entity_entity_counted_to_create = []
+            for entity_entity_id in entity_entity_ids:
+                old_state = None
+                entity_entity_counted = counted.get(entity_entity_id)
+                if entity_entity_counted is not None:
+                    old_state = (entity_entity_counted.entity_a_id, entity_entity_counted.entity_b_id,
+                                 entity_entity_counted.connection_type_category_id, entity_entity_counted.visible)
+                new_state = current.get(entity_entity_id)
+                if old_state == new_state:
+                    continue
+                if old_state is not None:
+                    add_delta(old_state, -1)
+                    entity_entity_counted_to_delete.append(entity_entity_id)
+                if new_state is not None:
+                    add_delta(new_state, 1)
+                    entity_entity_counted_to_create.append(StageEntityEntityCounted(
+                        entity_entity_id=entity_entity_id, entity_a_id=new_state[0], entity_b_id=new_state[1],
+                        connection_type_category_id=new_state[2], visible=new_state[3]))
+
+            StageEntityEntityCounted.objects.filter(entity_entity_id__in=entity_entity_counted_to_delete).delete()
+            StageEntityEntityCounted.objects.bulk_create(entity_entity_counted_to_create)
+
+            deltas = {key: delta for key, delta in deltas.items() if delta[0] != 0 or delta[1] != 0}
+            if deltas:
+                with connection.cursor() as cursor:
+                    cursor.execute(StageEntityConnectionCount._add_counts_sql, {
+                        'entity_ids': [key[0] for key in deltas.keys()],
+                        'connection_type_category_ids': [key[1] for key in deltas.keys()],
+                        'counts': [delta[0] for delta in deltas.values()],
+                        'counts_all': [delta[1] for delta in deltas.values()],
+                    })
+
+        return set([key[0] for key in deltas.keys()])
+
+    @staticmethod
+    def reconcile(entity_ids=None):
+        params = None
+        connection_filter = 'TRUE'
+        counted_filter = ''
+        entity_a_filter = ''
+        entity_b_filter = ''
+        entity_filter = ''
+        if entity_ids is not None:
+            entity_ids = list(entity_ids)
+            if not entity_ids:
+                return set()
+            params = {
+                'entity_ids': entity_ids
+            }
+            connection_filter = '''(ee.entity_a_id = ANY(%(entity_ids)s) OR ee.entity_b_id = ANY(%(entity_ids)s)
+                OR ee.id IN (SELECT entity_entity_id FROM mocbackend_stage_entity_entity_counted
+                WHERE entity_a_id = ANY(%(entity_ids)s) OR entity_b_id = ANY(%(entity_ids)s)))'''
+            counted_filter = '(cnt.entity_a_id = ANY(%(entity_ids)s) OR cnt.entity_b_id = ANY(%(entity_ids)s)) AND'
+            entity_a_filter = 'AND entity_a_id = ANY(%(entity_ids)s)'
+            entity_b_filter = 'AND entity_b_id = ANY(%(entity_ids)s)'
+            entity_filter = 'AND cc.entity_id = ANY(%(entity_ids)s)'
+        ret = set()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(StageEntityConnectionCount._reconcile_counted_sql.format(
+                    current_sql=StageEntityConnectionCount._current_sql.format(connection_filter=connection_filter),
+                    counted_filter=counted_filter), params)
+                cursor.execute(StageEntityConnectionCount._reconcile_counts_sql.format(
+                    entity_a_filter=entity_a_filter, entity_b_filter=entity_b_filter), params)
+                ret.update([row[0] for row in cursor.fetchall()])
+                cursor.execute(StageEntityConnectionCount._reconcile_stale_counts_sql.format(
+                    entity_filter=entity_filter), params)
+                ret.update([row[0] for row in cursor.fetchall()])
+        return ret
+
+    @staticmethod
+    def update_counts_index(entity_entity_ids):
+        es = ElasticsearchDB.get_db()
+        entity_entity_ids = list(entity_entity_ids)
+        entity_ids = set()
+        for i in range(0, len(entity_entity_ids), 1000):
+            entity_ids.update(StageEntityConnectionCount.update_counts(entity_entity_ids=entity_entity_ids[i:i + 1000]))
+        entity_ids = list(entity_ids)
+        for i in range(0, len(entity_ids), 500):
+            es.q_update_entities_partial(entity_ids=entity_ids[i:i + 500],
+                                         slices=[const.ELASTICSEARCH_ENTITY_SLICE_COUNTS])
+
+
+class StageEntityGraphMetrics(models.Model):
+    entity = models.OneToOneField(StageEntity, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='graph_metrics')
+    degree = models.BigIntegerField(default=0)
+    weighted_degree = models.FloatField(default=0)
+    component_id = models.BigIntegerField(null=True, blank=True)
+    component_size = models.BigIntegerField(default=1)
+    centrality = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    _store_sql = '''
+        INSERT INTO mocbackend_stage_entity_graph_metrics AS m (entity_id, degree, weighted_degree, component_id,
+            component_size, centrality, updated_at)
+        SELECT d.entity_id, d.degree, d.weighted_degree, d.component_id, d.component_size, d.centrality, NOW()
+        FROM unnest(%(entity_ids)s::BIGINT[], %(degrees)s::BIGINT[], %(weighted_degrees)s::DOUBLE PRECISION[],
+            %(component_ids)s::BIGINT[], %(component_sizes)s::BIGINT[], %(centralities)s::DOUBLE PRECISION[])
+            AS d(entity_id, degree, weighted_degree, component_id, component_size, centrality)
+        JOIN mocbackend_stage_entity e ON e.id = d.entity_id
+        ON CONFLICT (entity_id) DO UPDATE
+        SET degree = EXCLUDED.degree, weighted_degree = EXCLUDED.weighted_degree,
+            component_id = EXCLUDED.component_id, component_size = EXCLUDED.component_size,
+            centrality = EXCLUDED.centrality, updated_at = NOW()
+        WHERE (m.degree, m.weighted_degree, m.component_id, m.component_size, m.centrality) IS DISTINCT FROM
+            (EXCLUDED.degree, EXCLUDED.weighted_degree, EXCLUDED.component_id, EXCLUDED.component_size,
+            EXCLUDED.centrality)
+        RETURNING m.entity_id
+    '''
+
+    _delete_stale_sql = '''
+        DELETE FROM mocbackend_stage_entity_graph_metrics m
+        USING mocbackend_stage_entity e
+        WHERE e.id = m.entity_id AND (e.deleted = TRUE OR e.published = FALSE)
+        RETURNING m.entity_id
+    '''
+
+    class Meta:
+        db_table = 'mocbackend_stage_entity_graph_metrics'
+
+    @staticmethod
+    def compute(iterations=10, damping=0.85):
+        entity_ids = array('q', StageEntity.objects.filter(published=True, deleted=False).order_by('id').values_list(
+            'id', flat=True).iterator())
+        indexes = {entity_id: i for i, entity_id in enumerate(entity_ids)}
+        n = len(entity_ids)
+        visible = set(StageEntityEntityCollection.objects.filter(
+            deleted=False, published=True, collection__deleted=False, collection__published=True,
+            collection__source__deleted=False, collection__source__published=True).values_list(
+            'entity_entity_id', flat=True).iterator())
+
+        degrees = array('q', [0]) * n
+        weighted_degrees = array('d', [0]) * n
+        parents = array('q', range(n))
+        edges_a = array('q')
+        edges_b = array('q')
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for entity_entity_id, entity_a_id, entity_b_id, transaction_amount in StageEntityEntity.objects.filter(
+                published=True, deleted=False).values_list('id', 'entity_a_id', 'entity_b_id',
+                                                           'transaction_amount').iterator():
+            a = indexes.get(entity_a_id)
+            b = indexes.get(entity_b_id)
+            if a is None or b is None or entity_entity_id not in visible:
+                continue
+            degrees[a] += 1
+            degrees[b] += 1
+            if transaction_amount is not None:
+                weighted_degrees[a] += abs(float(transaction_amount))
+                weighted_degrees[b] += abs(float(transaction_amount))
+            root_a = find(a)
+            root_b = find(b)
+            if root_a != root_b:
+                parents[max(root_a, root_b)] = min(root_a, root_b)
+            edges_a.append(a)
+            edges_b.append(b)
+        del visible
+        del indexes
+
+        component_sizes = {}
+        for i in range(n):
+            root = find(i)
+            component_sizes[root] = component_sizes.get(root, 0) + 1
+
+        ranks = array('d', [1.0 / n]) * n if n else array('d')
+        for iteration in range(iterations):
+            dangling = sum(ranks[i] for i in range(n) if degrees[i] == 0)
+            base = (1 - damping) / n + damping * dangling / n
+            shares = array('d', (ranks[i] / degrees[i] if degrees[i] else 0 for i in range(n)))
+            ranks = array('d', [base]) * n
+            for e in range(len(edges_a)):
+                a = edges_a[e]
+                b = edges_b[e]
+                ranks[a] += damping * shares[b]
+                ranks[b] += damping * shares[a]
+
+        for i in range(n):
+            root = find(i)
+            yield entity_ids[i], degrees[i], round(weighted_degrees[i], 4), entity_ids[root], component_sizes[
+                root], round(ranks[i] * n, 6)
+
+    @staticmethod
+    def store(metrics, batch_size=10000):
+        ret = set()
+        batch = []
+        for row in chain(metrics, [None]):
+            if row is not None:
+                batch.append(row)
+            if batch and (row is None or len(batch) >= batch_size):
+                with connection.cursor() as cursor:
+                    cursor.execute(StageEntityGraphMetrics._store_sql, {
+                        'entity_ids': [item[0] for item in batch],
+                        'degrees': [item[1] for item in batch],
+                        'weighted_degrees': [item[2] for item in batch],
+                        'component_ids': [item[3] for item in batch],
+                        'component_sizes': [item[4] for item in batch],
+                        'centralities': [item[5] for item in batch],
+                    })
+                    ret.update([item[0] for item in cursor.fetchall()])
+                batch = []
+        with connection.cursor() as cursor:
+            cursor.execute(StageEntityGraphMetrics._delete_stale_sql)
+            ret.update([item[0] for item in cursor.fetchall()])
+        return ret
+
+
+class ReindexCheckpoint(models.Model):
+    id = models.AutoField(primary_key=True)
+    target = models.CharField(max_length=32)
+    family = models.CharField(max_length=64)
+    range_from_id = models.BigIntegerField(null=True, blank=True)
+    range_to_id = models.BigIntegerField(null=True, blank=True)
+    limit = models.BigIntegerField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True)
+    rows = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    options = models.TextField(null=True, blank=True)
+    version = models.CharField(max_length=32, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        db_table = 'mocbackend_reindex_checkpoint'
+        index_together = (('target', 'family'),)
+
+    @staticmethod
+    def start(target, family, ranges, options=None, version=None):
+        with transaction.atomic():
+            ReindexCheckpoint.objects.filter(target=target, family=family).delete()
+            ReindexCheckpoint.objects.bulk_create(
+                [ReindexCheckpoint(target=target, family=family, range_from_id=range_from_id,
+                                   range_to_id=range_to_id, limit=limit, options=options, version=version) for
+                 range_from_id, range_to_id, limit in ranges])
+        return list(ReindexCheckpoint.objects.filter(target=target, family=family, version=version).order_by('id'))
+
+    @staticmethod
+    def get_to_resume(target, family, version=None):
+        checkpoints = list(
+            ReindexCheckpoint.objects.filter(target=target, family=family, version=version).order_by('id'))
+        if not checkpoints:
+            return None
+        return [checkpoint for checkpoint in checkpoints if not checkpoint.finished]
+
+    @staticmethod
+    def is_finished(target, family, version=None):
+        checkpoints = ReindexCheckpoint.objects.filter(target=target, family=family, version=version)
+        return checkpoints.filter(finished=True).exists() and not checkpoints.filter(finished=False).exists()
+
+    def get_remaining_limit(self):
+        return None if self.limit is None else max(self.limit - self.rows, 0)
+
+    def save_progress(self, last_id=None, rows=0, finished=False):
+        values = {
+            'updated_at': timezone.now(),
+        }
+        if last_id is not None:
+            self.last_id = last_id
+            values['last_id'] = last_id
+        if rows:
+            self.rows += rows
+            values['rows'] = F('rows') + rows
+        if finished:
+            self.finished = True
+            values['finished'] = True
+        ReindexCheckpoint.objects.filter(id=self.id).update(**values)
+
 
 class KeyValue(models.Model):
     key = models.CharField(max_length=512, primary_key=True)
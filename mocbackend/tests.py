@@ -1,3 +1,410 @@
-from django.test import TestCase
+import calendar
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from mocbackend import const, helpers, models, views
+from mocbackend.databases import AttributeValuesPrefetch, ElasticsearchDB
+
+
+def get_field(doc, field):
+    ret = doc
+    for key in field.split('.'):
+        if not isinstance(ret, dict):
+            return None
+        ret = ret.get(key)
+    return ret
+
+
+def get_date(doc, field):
+    value = get_field(doc, field)
+    return None if value is None else datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def matches(doc, query):
+    (kind, value), = query.items()
+    if kind == 'term':
+        (field, expected), = value.items()
+        return get_field(doc, field) == expected
+    if kind == 'exists':
+        return get_field(doc, value['field']) is not None
+    if kind == 'range':
+        (field, bounds), = value.items()
+        date = get_date(doc, field)
+        if date is None:
+            return False
+        return all({
+                       'lt': date < bound,
+                       'lte': date <= bound,
+                       'gt': date > bound,
+                       'gte': date >= bound,
+                   }[operator] for operator, bound in bounds.items())
+    if kind == 'bool':
+        required = as_list(value.get('must', [])) + as_list(value.get('filter', []))
+        if not all(matches(doc, item) for item in required):
+            return False
+        if any(matches(doc, item) for item in as_list(value.get('must_not', []))):
+            return False
+        should = as_list(value.get('should', []))
+        if should and not required and not any(matches(doc, item) for item in should):
+            return False
+        return True
+    raise NotImplementedError(kind)
+
+
+def aggregate(docs, aggs):
+    ret = {}
+    for name, agg in aggs.items():
+        if 'min' in agg or 'max' in agg:
+            function = 'min' if 'min' in agg else 'max'
+            values = [calendar.timegm(get_date(doc, agg[function]['field']).timetuple()) * 1000.0 for doc in docs if
+                      get_date(doc, agg[function]['field']) is not None]
+            ret[name] = {'value': (min if function == 'min' else max)(values) if values else None}
+        elif 'terms' in agg:
+            counts = {}
+            for doc in docs:
+                key = get_field(doc, agg['terms']['field'])
+                if key is not None:
+                    counts[key] = counts.get(key, 0) + 1
+            buckets = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:agg['terms']['size']]
+            ret[name] = {'buckets': [{'key': key, 'doc_count': count} for key, count in buckets]}
+        elif 'filters' in agg:
+            ret[name] = {'buckets': {}}
+            for key, query in agg['filters']['filters'].items():
+                matched = [doc for doc in docs if matches(doc, query)]
+                bucket = {'doc_count': len(matched)}
+                bucket.update(aggregate(matched, agg.get('aggs', {})))
+                ret[name]['buckets'][key] = bucket
+        else:
+            raise NotImplementedError(name)
+    return ret
+
+
+class FakeElasticsearch:
+    def __init__(self, docs):
+        self.docs = docs
+        self.searches = 0
+
+    def search(self, index, doc_type, body):
+        self.searches += 1
+        docs = [doc for doc in self.docs if 'query' not in body or matches(doc, body['query'])]
+        return {
+            'hits': {
+                'total': len(docs),
+                'hits': [],
+            },
+            'aggregations': aggregate(docs, body.get('aggs', {})),
+        }
+
+
+def get_connections_count_per_year_by_searches(es, pk):
+    body = {
+        'size': 0,
+        'query': {
+            'bool': {
+                'should': [
+                    {'term': {'entity_a.public_id': pk}},
+                    {'term': {'entity_b.public_id': pk}}
+                ]
+            }
+        },
+        'aggs': {
+            'min_valid_from': {'min': {'field': 'valid_from'}},
+            'min_valid_to': {'min': {'field': 'valid_to'}},
+            'max_valid_from': {'max': {'field': 'valid_from'}},
+            'max_valid_to': {'max': {'field': 'valid_to'}},
+        },
+    }
+    results_raw = es.search(index=None, doc_type=None, body=body)
+    minimums = set(value for value in [results_raw['aggregations']['min_valid_from']['value'],
+                                       results_raw['aggregations']['min_valid_to']['value']] if value is not None)
+    maximums = set(value for value in [results_raw['aggregations']['max_valid_from']['value'],
+                                       results_raw['aggregations']['max_valid_to']['value']] if value is not None)
+    if not minimums:
+        return {}
+    max_year = timezone.now().year
+    if maximums:
+        max_year = max(max_year, datetime.datetime.fromtimestamp(max(maximums) / 1000.0).year)
+    min_year = datetime.datetime.fromtimestamp(min(minimums) / 1000.0).year
+
+    results = {}
+    for year in range(min_year, max_year + 1):
+        from_datetime = datetime.datetime(year, 1, 1, 0, 0, 0)
+        to_datetime = datetime.datetime(year + 1, 1, 1, 0, 0, 0)
+        body = {
+            'size': 0,
+            'query': {
+                'bool': {
+                    'filter': [
+                        {
+                            'bool': {
+                                'should': [
+                                    {'term': {'entity_a.public_id': pk}},
+                                    {'term': {'entity_b.public_id': pk}}
+                                ]
+                            }
+                        },
+                        {
+                            'bool': {
+                                'should': [
+                                    {'bool': {'filter': [{'range': {'valid_from': {'lt': to_datetime}}},
+                                                         {'range': {'valid_to': {'gte': from_datetime}}}]}},
+                                    {'bool': {'filter': [{'range': {'valid_from': {'lt': to_datetime}}}],
+                                              'must_not': {'exists': {'field': 'valid_to'}}}},
+                                    {'bool': {'filter': {'range': {'valid_to': {'gte': from_datetime,
+                                                                                'lt': to_datetime}}},
+                                              'must_not': {'exists': {'field': 'valid_from'}}}}
+                                ]
+                            }
+                        }
+                    ]
+                }
+            },
+            'aggs': {
+                'connection_type_category': {
+                    'terms': {
+                        'field': 'connection_type_category.string_id',
+                        'size': const.ELASTICSEARCH_MAX_RESULT_WINDOWS
+                    }
+                }
+            }
+        }
+        results_raw = es.search(index=None, doc_type=None, body=body)
+        results[year] = {
+            'total': results_raw['hits']['total'],
+            'per_connection_type_category': results_raw['aggregations']['connection_type_category']['buckets']
+        }
+    return {
+        'min_year': min_year,
+        'max_year': max_year,
+        'results': results
+    }
+
+
+class ConnectionsCountPerYearByEndViewTest(SimpleTestCase):
+    def get_doc(self, entity_a, entity_b, category, valid_from=None, valid_to=None):
+        ret = {
+            'entity_a': {'public_id': entity_a},
+            'entity_b': {'public_id': entity_b},
+            'connection_type_category': {'string_id': category},
+        }
+        if valid_from is not None:
+            ret['valid_from'] = valid_from
+        if valid_to is not None:
+            ret['valid_to'] = valid_to
+        return ret
+
+    def get_response(self, es, pk):
+        db = mock.Mock()
+        db.get_elasticsearch.return_value = es
+        with mock.patch.object(ElasticsearchDB, 'get_db', return_value=db), mock.patch.object(
+                ElasticsearchDB, 'is_elasticsearch_settings_exists', return_value=True):
+            request = APIRequestFactory().get('/search/connections/count-per-year-by-end/' + pk + '/')
+            return views.ConnectionsCountPerYearByEndView.as_view()(request, pk=pk)
+
+    def test_same_as_search_per_year(self):
+        next_year = str(timezone.now().year + 2)
+        docs = [
+            self.get_doc('a', 'b', 'business', valid_from='1995-03-01', valid_to='1999-06-30'),
+            self.get_doc('c', 'a', 'business', valid_from='2001-01-01'),
+            self.get_doc('a', 'd', 'family', valid_to='1998-12-31'),
+            self.get_doc('a', 'e', 'family'),
+            self.get_doc('f', 'a', 'business', valid_from='2005-07-01', valid_to='2005-07-01'),
+            self.get_doc('a', 'g', 'politics', valid_from='2010-01-01', valid_to='2008-01-01'),
+            self.get_doc('a', 'h', 'politics', valid_from='2012-01-01', valid_to=next_year + '-01-01'),
+            self.get_doc('i', 'a', 'business', valid_from='1999-12-31', valid_to='2000-01-01'),
+            self.get_doc('b', 'c', 'business', valid_from='1980-01-01', valid_to='1981-01-01'),
+        ]
+
+        es = FakeElasticsearch(docs)
+        expected = get_connections_count_per_year_by_searches(es, 'a')
+        searches_per_year = es.searches
+
+        es = FakeElasticsearch(docs)
+        response = self.get_response(es, 'a')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected)
+        self.assertEqual(es.searches, 2)
+        self.assertGreater(searches_per_year, es.searches)
+
+    def test_without_dates(self):
+        es = FakeElasticsearch([self.get_doc('a', 'b', 'business')])
+        response = self.get_response(es, 'a')
+
+        self.assertEqual(response.data, {})
+        self.assertEqual(es.searches, 1)
+
+
+class PerEntityAttributeValues:
+    def get_attribute_values(self, entity, entity_entity, attribute):
+        q = Q(entity=entity) if entity is not None else Q(entity_entity=entity_entity)
+        return attribute.attribute_values.filter(q & (
+                Q(value_codebook_item=None) | Q(value_codebook_item__deleted=False,
+                                                value_codebook_item__published=True))).order_by('id')
+
+    def get_attribute_value_collections(self, attribute_value):
+        return list(attribute_value.attribute_value_collections.filter(
+            deleted=False, published=True, collection__deleted=False, collection__published=True,
+            collection__source__deleted=False, collection__source__published=True).order_by('id'))
+
+    def get_inner_attributes(self, attribute):
+        return attribute.attributes.filter(finally_deleted=False, finally_published=True).order_by('id')
+
+    def get_root_attributes(self, entity, entity_entity):
+        ret = []
+        for attribute in models.StageAttribute.objects.filter(
+                Q(attribute_values__entity=entity, finally_deleted=False, finally_published=True) & (
+                        Q(attribute_values__value_codebook_item=None) | Q(
+                    attribute_values__value_codebook_item__deleted=False,
+                    attribute_values__value_codebook_item__published=True,
+                    attribute_values__value_codebook_item__codebook__deleted=False,
+                    attribute_values__value_codebook_item__codebook__published=True))).distinct().order_by('id'):
+            root_attribute = helpers.get_root_attribute(attribute)
+            if root_attribute not in ret:
+                ret.append(root_attribute)
+        return ret
+
+    def get_search_attribute_values(self, entity):
+        return entity.attribute_values.filter(Q(attribute_value_collections__deleted=False,
+                                                attribute_value_collections__published=True,
+                                                attribute_value_collections__collection__deleted=False,
+                                                attribute_value_collections__collection__published=True,
+                                                attribute_value_collections__collection__source__deleted=False,
+                                                attribute_value_collections__collection__source__published=True,
+                                                attribute__finally_deleted=False,
+                                                attribute__finally_published=True,
+                                                attribute__string_id__in=const.SEARCH_ATTRIBUTES) & (
+                                                      Q(value_codebook_item=None) | Q(
+                                                  value_codebook_item__deleted=False,
+                                                  value_codebook_item__published=True))).distinct().order_by('id')
+
+
+def create(model, **kwargs):
+    return model.objects.bulk_create([model(**kwargs)])[0]
+
+
+class EntitiesToIndexTest(TestCase):
+    fixtures = ['init_data.json']
+
+    @classmethod
+    def setUpTestData(cls):
+        source_type = create(models.StaticSourceType, string_id='test', name='Test')
+        collection_type = create(models.StaticCollectionType, string_id='test', name='Test')
+        source = create(models.StageSource, string_id='source', name='Source', source_type=source_type)
+        hidden_source = create(models.StageSource, string_id='hidden_source', name='Hidden source',
+                               source_type=source_type, published=False)
+        collection = create(models.StageCollection, string_id='collection', name='Collection', source=source,
+                            collection_type=collection_type)
+        unpublished_collection = create(models.StageCollection, string_id='unpublished_collection',
+                                        name='Unpublished collection', source=source,
+                                        collection_type=collection_type, published=False)
+        hidden_source_collection = create(models.StageCollection, string_id='hidden_source_collection',
+                                          name='Hidden source collection', source=hidden_source,
+                                          collection_type=collection_type)
+
+        person_type = models.StaticEntityType.objects.get(string_id='person')
+        legal_entity_type = models.StaticEntityType.objects.get(string_id='legal_entity')
+        attributes = {attribute.string_id: attribute for attribute in models.StageAttribute.objects.all()}
+        string_type = models.StageAttributeType.objects.get(string_id='default_string')
+        attributes['person_address'] = create(models.StageAttribute, string_id='person_address', name='Adresa',
+                                              entity_type=person_type,
+                                              attribute_type=models.StageAttributeType.objects.get(
+                                                  string_id='default_complex'))
+        for string_id, name, published in [('person_address_street', 'Ulica', True),
+                                           ('person_address_city', 'Grad', True),
+                                           ('person_address_note', 'Napomena', False)]:
+            attributes[string_id] = create(models.StageAttribute, string_id=string_id, name=name,
+                                           attribute=attributes['person_address'], attribute_type=string_type,
+                                           published=published, finally_published=published)
+        attributes['person_birth_date'] = create(models.StageAttribute, string_id='person_birth_date',
+                                                 name='Datum rođenja', entity_type=person_type,
+                                                 attribute_type=models.StageAttributeType.objects.get(
+                                                     string_id='default_date'))
+        attributes['person_nickname'] = create(models.StageAttribute, string_id='person_nickname', name='Nadimak',
+                                               entity_type=person_type, attribute_type=string_type,
+                                               published=False, finally_published=False)
+
+        codebook = models.StageCodebook.objects.get(string_id='legal_entity_type')
+        codebook_value = create(models.StageCodebookValue, codebook=codebook, value='d.o.o.')
+        unpublished_codebook_value = create(models.StageCodebookValue, codebook=codebook, value='j.d.o.o.',
+                                            published=False)
+
+        entities = {}
+        for public_id, entity_type, is_pep in [('person', person_type, False), ('person2', person_type, True),
+                                               ('company', legal_entity_type, None),
+                                               ('company2', legal_entity_type, None)]:
+            entities[public_id] = create(models.StageEntity, public_id=public_id, entity_type=entity_type,
+                                         is_pep=is_pep, internal_slug=public_id, internal_slug_count=0)
+        cls.entity_ids = [entity.id for entity in entities.values()]
+
+        for public_id, string_id, value, collections in [
+            ('person', 'person_first_name', {'value_string': 'Ivan'}, [collection]),
+            ('person', 'person_last_name', {'value_string': 'Horvat'}, [unpublished_collection]),
+            ('person', 'person_last_name', {'value_string': 'Kovač'}, [collection, hidden_source_collection]),
+            ('person', 'person_address_street', {'value_string': 'Ilica 1'}, [collection]),
+            ('person', 'person_address_city', {'value_string': 'Zagreb'}, [collection, unpublished_collection]),
+            ('person', 'person_address_note', {'value_string': 'Skriveno'}, [collection]),
+            ('person', 'person_nickname', {'value_string': 'Ivek'}, [collection]),
+            ('person', 'person_birth_date', {'value_date': datetime.date(1970, 1, 1)}, [collection]),
+            ('person2', 'person_first_name', {'value_string': 'Ana'}, [hidden_source_collection]),
+            ('person2', 'person_address_city', {'value_string': 'Split'}, [collection]),
+            ('company', 'legal_entity_name', {'value_string': 'Tvrtka'}, [collection]),
+            ('company', 'legal_entity_entity_type', {'value_codebook_item': codebook_value}, [collection]),
+            ('company2', 'legal_entity_name', {'value_string': 'Druga tvrtka'}, [unpublished_collection]),
+            ('company2', 'legal_entity_entity_type', {'value_codebook_item': unpublished_codebook_value},
+             [collection]),
+        ]:
+            attribute_value = create(models.StageAttributeValue, entity=entities[public_id],
+                                     attribute=attributes[string_id], **value)
+            for i, value_collection in enumerate(collections):
+                create(models.StageAttributeValueCollection, attribute_value=attribute_value,
+                       collection=value_collection, valid_from=datetime.date(2000 + i, 1, 1))
+
+    def get_entities(self):
+        return list(models.StageEntity.objects.filter(pk__in=self.entity_ids).select_related('entity_type').order_by(
+            'id'))
+
+    def test_same_as_per_entity(self):
+        expected = {}
+        for entity in self.get_entities():
+            expected[entity.id] = ElasticsearchDB._get_elasticsearch_entity_to_index(
+                entity=entity, attribute_values_prefetch=PerEntityAttributeValues())
+            expected[entity.id].update(ElasticsearchDB._get_elasticsearch_entities_graph_metrics_to_index([entity])[
+                                           entity.id])
+
+        entities = self.get_entities()
+        docs = ElasticsearchDB._get_elasticsearch_entities_to_index(entities)
+
+        self.assertEqual(docs, expected)
+        by_public_id = {entity.public_id: docs[entity.id] for entity in entities}
+        self.assertEqual([value['value'] for value in by_public_id['person']['person_last_name']], ['Kovač'])
+        self.assertEqual(set(by_public_id['person']['person_address'][0]),
+                         {'person_address_street', 'person_address_city'})
+        self.assertNotIn('person_nickname', by_public_id['person'])
+        self.assertEqual(by_public_id['person2']['person_first_name'], None)
+        self.assertEqual(by_public_id['company']['legal_entity_entity_type'][0]['value'], 'd.o.o.')
+        self.assertNotIn('legal_entity_entity_type', by_public_id['company2'])
+
+    def test_attributes_loaded_once_per_job(self):
+        with mock.patch.object(AttributeValuesPrefetch, '_attributes_cache', {}), mock.patch(
+                'mocbackend.databases.get_current_job', return_value=mock.Mock(id='job')):
+            AttributeValuesPrefetch(entity_ids=self.entity_ids[:1])
+            with self.assertNumQueries(2):
+                AttributeValuesPrefetch(entity_ids=self.entity_ids[:1])
+
+    def test_attributes_loaded_once_per_run(self):
+        attributes = AttributeValuesPrefetch.get_attributes()
+        with self.assertNumQueries(2):
+            AttributeValuesPrefetch(entity_ids=self.entity_ids[:1], attributes=attributes)
+        entities = self.get_entities()
+        self.assertEqual(ElasticsearchDB._get_elasticsearch_entities_to_index(entities, attributes=attributes),
+                         ElasticsearchDB._get_elasticsearch_entities_to_index(entities))
@@ -65,6 +65,8 @@ urlpatterns = [
         views.ConnectionsByEndsView.as_view()),
     url(r'^graph/connections/by-ends/(?P<pk1>[^/.]+)/(?P<pk2>[^/.]+)/(?P<offset>\d+)/(?P<limit>\d+)/$',
         views.ConnectionsByEndsGraphView.as_view()),
+    url(r'^graph/paths/(?P<pk1>[^/.]+)/(?P<pk2>[^/.]+)/$', views.PathsGraphView.as_view()),
+    url(r'^graph/ego/(?P<pk>[^/.]+)/$', views.EgoNetworkGraphView.as_view()),
     url(r'^search/connections/count-per-year-by-end/(?P<pk>[^/.]+)/$',
         views.ConnectionsCountPerYearByEndView.as_view()),
     url(r'^search/connections/by-end/(?P<pk>[^/.]+)/$', views.ConnectionsByEnd.as_view()),
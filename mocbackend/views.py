@@ -19,7 +19,7 @@ from rest_framework.response import Response
 from rest_framework.schemas import AutoSchema
 from rest_framework.views import APIView
 
-from mocbackend import models, serializers, const, helpers, permissions
+from mocbackend import models, serializers, const, helpers, permissions, cypher, graph
 from mocbackend.databases import ElasticsearchDB, Neo4jDB
 from mocbackend.schemas import KeyValueSchema
 
@@ -487,6 +487,24 @@ class EntitiesByAttributesValuesView(
                         title="Full"
                     ),
                 ),
+                coreapi.Field(
+                    name="order_by",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Enum(
+                        ['graph_degree', 'graph_weighted_degree', 'graph_component_size', 'graph_centrality'],
+                        title="Order by"
+                    ),
+                ),
+                coreapi.Field(
+                    name="order_direction",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Enum(
+                        ['asc', 'desc'],
+                        title="Order direction"
+                    ),
+                ),
             ],
         )
 
@@ -499,7 +517,7 @@ class EntitiesByAttributesValuesView(
 
         query = []
         for key, value in request.POST.items():
-            if key not in ['entity_type']:
+            if key not in ['entity_type', 'full', 'order_by', 'order_direction']:
                 try:
                     attribute = models.StageAttribute.objects.get(string_id=key, finally_deleted=False,
                                                                   finally_published=True,
@@ -573,12 +591,30 @@ class EntitiesByAttributesValuesView(
             }
         }
 
+        order_by = request.POST.get('order_by')
+        if order_by is not None:
+            if order_by not in ['graph_degree', 'graph_weighted_degree', 'graph_component_size', 'graph_centrality']:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            order_direction = 'asc' if request.POST.get('order_direction') == 'asc' else 'desc'
+            body.update({
+                'sort': [
+                    {
+                        order_by: {
+                            'order': order_direction,
+                            'unmapped_type': 'long'
+                        }
+                    }
+                ]
+            })
+
         full = request.POST.get('full') == 'true'
         if not full:
             _source = ['person_first_name.value', 'person_last_name.value', 'legal_entity_name.value',
                        'real_estate_name.value', 'movable_name.value', 'savings_name.value', 'is_pep', 'entity_type']
             for connection_type_category in models.StaticConnectionTypeCategory.objects.all():
                 _source.append('count_' + connection_type_category.string_id)
+            for field_name, metric, data_type in const.ELASTICSEARCH_ENTITY_GRAPH_METRICS_FIELDS:
+                _source.append(field_name)
             body.update({
                 '_source': _source
             })
@@ -1409,164 +1445,40 @@ class NeighboursByAttributesValuesView(APIView):
                         title="Count"
                     ),
                 ),
+                coreapi.Field(
+                    name="total",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Enum(
+                        ['exact', 'cached', 'bounded', 'none'],
+                        title="Total",
+                        description="exact (default), cached for a short time across pages, bounded (at least N) or none"
+                    ),
+                ),
             ],
         )
 
     def post(self, request, offset, limit, format=None):
-        entity_public_id = None
-        connection_type_categories = None
-        connection_types = None
-        transaction_date_from = None
-        transaction_date_to = None
-        transaction_amount_from = None
-        transaction_amount_to = None
-        entity_types = None
-        legal_entity_types = None
-        valid_from = None
-        valid_to = None
-
-        query_a = ''
-        query_b = ''
-        query_r_connection_type = ''
-        query_r = ''
-
-        for key, value in request.POST.items():
-            if key == 'entity':
-                entity_public_id = value
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_a_public_id = $entity_public_id'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_b_public_id = $entity_public_id'
-            elif key == 'connection_type_category':
-                connection_type_categories = request.POST.getlist('connection_type_category')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_category_string_id IN $connection_type_categories'
-            elif key == 'connection_type':
-                connection_types = request.POST.getlist('connection_type')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_string_id IN $connection_types'
-            elif key == 'transaction_date_from':
-                transaction_date_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date >= $transaction_date_from'
-            elif key == 'transaction_date_to':
-                transaction_date_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date <= $transaction_date_to'
-            elif key == 'transaction_amount_from':
-                transaction_amount_from = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount >= $transaction_amount_from'
-            elif key == 'transaction_amount_to':
-                transaction_amount_to = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount <= $transaction_amount_to'
-            elif key == 'entity_type':
-                entity_types = request.POST.getlist('entity_type')
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_b_entity_type_string_id IN $entity_types'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_a_entity_type_string_id IN $entity_types'
-            elif key == 'legal_entity_type':
-                legal_entity_types = request.POST.getlist('legal_entity_type')
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'ANY(legal_entity_type IN r.entity_b_legal_entity_type_id WHERE legal_entity_type IN $legal_entity_types)'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'ANY(legal_entity_type IN r.entity_a_legal_entity_type_id WHERE legal_entity_type IN $legal_entity_types)'
-            elif key == 'is_pep' and (value == 'true' or value == 'false'):
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_b_is_pep = ' + value
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_a_is_pep = ' + value
-            elif key == 'valid_from':
-                valid_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_from >= $valid_from'
-            elif key == 'valid_to':
-                valid_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_to <= $valid_to'
-
-        if query_r_connection_type:
-            query_r_exists = False
-            if query_r:
-                query_r_exists = True
-                query_r += ' AND '
-            query_r += '(' + query_r_connection_type + ')'
-            if query_r_exists:
-                query_r = '(' + query_r + ')'
-
-        query_a_b = ''
-        if query_a or query_b:
-            query_a_b = '((' + query_a + ') OR (' + query_b + '))'
-
-        query = 'MATCH (entity_a:node)-[r1:relationship]-(r:relationship)-[r2:relationship]-(entity_b:node)'
-        query += ' WHERE (ID(entity_a) < ID(entity_b))'
-        if query_a_b or query_r:
-            query += ' AND '
-            if query_a_b and query_r:
-                query += query_a_b + ' AND ' + query_r
-            elif query_a_b:
-                query += query_a_b
-            elif query_r:
-                query += query_r
-        query += ' WITH DISTINCT entity_a, entity_b'
+        filters = cypher.ConnectionFilters(request.POST)
         limit = limit if int(limit) <= 100 else '100'
-        query_total = query + ' WITH DISTINCT entity_a, entity_b'
-        query += ' SKIP $offset LIMIT $limit'
-        query += ' WITH COLLECT(DISTINCT entity_a) + COLLECT(DISTINCT entity_b) as union'
-        query += ' UNWIND union as nodes'
-        query += ' WITH COLLECT(DISTINCT nodes) as distinct_union'
-        query += ' MATCH (entity_a_final:node)-[r1_final:relationship]-(r_final:relationship)-[r2_final:relationship]-(entity_b_final:node)'
-        query += ' WHERE ID(entity_a_final) < ID(entity_b_final) AND (entity_a_final IN distinct_union AND entity_b_final IN distinct_union)'
-        query += ' RETURN DISTINCT entity_a_final, entity_b_final, COLLECT(DISTINCT r_final.connection_type_category_string_id)'
-        count = request.POST.get('count') == 'true'
-        if count:
-            query += ', COUNT(DISTINCT r_final)'
+        total = request.POST.get('total', 'exact')
+        if total not in ['exact', 'cached', 'bounded', 'none']:
+            total = 'exact'
 
-        query_total += ' WITH COLLECT(DISTINCT entity_a) + COLLECT(DISTINCT entity_b) as distinct_union'
-        query_total += ' UNWIND distinct_union as nodes'
-        query_total += ' RETURN COUNT(DISTINCT nodes) as total'
-
-        results = []
-        total = 0
+        ret = {'total': 0, 'total_relation': 'eq', 'results': []}
         if Neo4jDB.is_neo4j_settings_exists():
             neo4j = Neo4jDB.get_db().get_neo4j()
+            compact_graph = graph.get_graph() if graph.is_neighbours_supported(filters) else None
             with neo4j.session() as session:
-                results = session.run(query, entity_public_id=entity_public_id, connection_types=connection_types,
-                                      connection_type_categories=connection_type_categories,
-                                      transaction_date_from=transaction_date_from,
-                                      transaction_date_to=transaction_date_to,
-                                      transaction_amount_from=transaction_amount_from,
-                                      transaction_amount_to=transaction_amount_to, entity_types=entity_types,
-                                      legal_entity_types=legal_entity_types, valid_from=valid_from, valid_to=valid_to,
-                                      offset=int(offset), limit=int(limit))
-                total = session.run(query_total, entity_public_id=entity_public_id, connection_types=connection_types,
-                                    connection_type_categories=connection_type_categories,
-                                    transaction_date_from=transaction_date_from,
-                                    transaction_date_to=transaction_date_to,
-                                    transaction_amount_from=transaction_amount_from,
-                                    transaction_amount_to=transaction_amount_to, entity_types=entity_types,
-                                    legal_entity_types=legal_entity_types, valid_from=valid_from, valid_to=valid_to,
-                                    offset=int(offset), limit=int(limit)).single().value()
+                if compact_graph is not None:
+                    ret = cypher.run_graph_neighbours(session, compact_graph=compact_graph, filters=filters,
+                                                      offset=int(offset), limit=int(limit),
+                                                      count=request.POST.get('count') == 'true')
+                else:
+                    ret = cypher.run_neighbours(session, filters=filters, offset=int(offset), limit=int(limit),
+                                                count=request.POST.get('count') == 'true', total=total)
 
-        return Response({'total': total, 'results': results})
+        return Response(ret)
 
 
 class ConnectionsByAttributesValuesGraphView(APIView):
@@ -1689,138 +1601,10 @@ class ConnectionsByAttributesValuesGraphView(APIView):
         )
 
     def post(self, request, offset, limit, format=None):
-        entity_public_id = None
-        connection_type_categories = None
-        connection_types = None
-        transaction_date_from = None
-        transaction_date_to = None
-        transaction_amount_from = None
-        transaction_amount_to = None
-        entity_types = None
-        legal_entity_types = None
-        valid_from = None
-        valid_to = None
-
-        query_a = ''
-        query_b = ''
-        query_r_connection_type = ''
-        query_r = ''
-
-        order_by = None
-        order_direction = 'ASC'
-
-        for key, value in request.POST.items():
-            if key == 'entity':
-                entity_public_id = value
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_a_public_id = $entity_public_id'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_b_public_id = $entity_public_id'
-            elif key == 'connection_type_category':
-                connection_type_categories = request.POST.getlist('connection_type_category')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_category_string_id IN $connection_type_categories'
-            elif key == 'connection_type':
-                connection_types = request.POST.getlist('connection_type')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_string_id IN $connection_types'
-            elif key == 'transaction_date_from':
-                transaction_date_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date >= $transaction_date_from'
-            elif key == 'transaction_date_to':
-                transaction_date_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date <= $transaction_date_to'
-            elif key == 'transaction_amount_from':
-                transaction_amount_from = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount >= $transaction_amount_from'
-            elif key == 'transaction_amount_to':
-                transaction_amount_to = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount <= $transaction_amount_to'
-            elif key == 'entity_type':
-                entity_types = request.POST.getlist('entity_type')
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_b_entity_type_string_id IN $entity_types'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_a_entity_type_string_id IN $entity_types'
-            elif key == 'legal_entity_type':
-                legal_entity_types = request.POST.getlist('legal_entity_type')
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'ANY(legal_entity_type IN r.entity_b_legal_entity_type_id WHERE legal_entity_type IN $legal_entity_types)'
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'ANY(legal_entity_type IN r.entity_a_legal_entity_type_id WHERE legal_entity_type IN $legal_entity_types)'
-            elif key == 'is_pep' and (value == 'true' or value == 'false'):
-                if query_a:
-                    query_a += ' AND '
-                query_a += 'r.entity_b_is_pep = ' + value
-                if query_b:
-                    query_b += ' AND '
-                query_b += 'r.entity_a_is_pep = ' + value
-            elif key == 'valid_from':
-                valid_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_from >= $valid_from'
-            elif key == 'valid_to':
-                valid_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_to <= $valid_to'
-            elif key == 'order_by':
-                if value == 'valid_from' or value == 'valid_to' or value == 'transaction_amount':
-                    order_by = value
-            elif key == 'order_direction':
-                if value == 'asc' or value == 'desc':
-                    order_direction = value.upper()
-
-        if query_r_connection_type:
-            query_r_exists = False
-            if query_r:
-                query_r_exists = True
-                query_r += ' AND '
-            query_r += '(' + query_r_connection_type + ')'
-            if query_r_exists:
-                query_r = '(' + query_r + ')'
-
-        query_a_b = ''
-        if query_a or query_b:
-            query_a_b = '((' + query_a + ') OR (' + query_b + '))'
-
-        query = 'MATCH (entity_a:node)-[r1:relationship]->(r:relationship)-[r2:relationship]->(entity_b:node)'
-        if query_a_b or query_r:
-            query += ' WHERE '
-            if query_a_b and query_r:
-                query += query_a_b + ' AND ' + query_r
-            elif query_a_b:
-                query += query_a_b
-            elif query_r:
-                query += query_r
-
-        query_total_min_max = query + ' RETURN COUNT(DISTINCT r) AS TOTAL, MIN(r.valid_from), MIN(r.valid_to), MAX(r.valid_from), MAX(r.valid_to)'
-        query += ' RETURN DISTINCT entity_a, entity_b, r'
-
-        if order_by is not None:
-            query += ' ORDER BY r.' + order_by + ' ' + order_direction
-
+        filters = cypher.ConnectionFilters(request.POST)
+        query, query_total_min_max = cypher.get_connections_statements(filters=filters)
         limit = limit if int(limit) <= 100 else '100'
 
-        query += ' SKIP $offset LIMIT $limit'
-
         results = []
         total = 0
         min_valid = None
@@ -1828,23 +1612,8 @@ class ConnectionsByAttributesValuesGraphView(APIView):
         if Neo4jDB.is_neo4j_settings_exists():
             neo4j = Neo4jDB.get_db().get_neo4j()
             with neo4j.session() as session:
-                results = session.run(query, entity_public_id=entity_public_id, connection_types=connection_types,
-                                      connection_type_categories=connection_type_categories,
-                                      transaction_date_from=transaction_date_from,
-                                      transaction_date_to=transaction_date_to,
-                                      transaction_amount_from=transaction_amount_from,
-                                      transaction_amount_to=transaction_amount_to, entity_types=entity_types,
-                                      legal_entity_types=legal_entity_types, valid_from=valid_from, valid_to=valid_to,
-                                      offset=int(offset), limit=int(limit))
-                total_min_max = session.run(query_total_min_max, entity_public_id=entity_public_id,
-                                            connection_types=connection_types,
-                                            connection_type_categories=connection_type_categories,
-                                            transaction_date_from=transaction_date_from,
-                                            transaction_date_to=transaction_date_to,
-                                            transaction_amount_from=transaction_amount_from,
-                                            transaction_amount_to=transaction_amount_to, entity_types=entity_types,
-                                            legal_entity_types=legal_entity_types, valid_from=valid_from,
-                                            valid_to=valid_to).single()
+                results = cypher.run(session, query, offset=int(offset), limit=int(limit), **filters.get_parameters())
+                total_min_max = cypher.run(session, query_total_min_max, **filters.get_parameters()).single()
                 total = total_min_max.value(0, 0)
                 min_valid_from = total_min_max.value(1)
                 min_valid_to = total_min_max.value(2)
@@ -2234,116 +2003,363 @@ class ConnectionsByEndsGraphView(APIView):
         )
 
     def post(self, request, pk1, pk2, offset, limit, format=None):
-        connection_type_categories = None
-        connection_types = None
-        transaction_date_from = None
-        transaction_date_to = None
-        transaction_amount_from = None
-        transaction_amount_to = None
-        valid_from = None
-        valid_to = None
-
-        query_r_connection_type = ''
-        query_r = ''
+        filters = cypher.ConnectionFilters(request.POST)
+        query, query_total = cypher.get_connections_by_ends_statements(filters=filters)
+        limit = limit if int(limit) <= 100 else '100'
 
-        order_by = None
-        order_direction = 'ASC'
+        results = []
+        total = 0
+        if Neo4jDB.is_neo4j_settings_exists():
+            neo4j = Neo4jDB.get_db().get_neo4j()
+            with neo4j.session() as session:
+                results = cypher.run(session, query, pk1=pk1, pk2=pk2, offset=int(offset), limit=int(limit),
+                                     **filters.get_parameters())
+                total = cypher.run(session, query_total, pk1=pk1, pk2=pk2, **filters.get_parameters()).single()
 
-        for key, value in request.POST.items():
-            if key == 'connection_type_category':
-                connection_type_categories = request.POST.getlist('connection_type_category')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_category_string_id IN $connection_type_categories'
-            elif key == 'connection_type':
-                connection_types = request.POST.getlist('connection_type')
-                if query_r_connection_type:
-                    query_r_connection_type += ' OR '
-                query_r_connection_type += 'r.connection_type_string_id IN $connection_types'
-            elif key == 'transaction_date_from':
-                transaction_date_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date >= $transaction_date_from'
-            elif key == 'transaction_date_to':
-                transaction_date_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_date <= $transaction_date_to'
-            elif key == 'transaction_amount_from':
-                transaction_amount_from = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount >= $transaction_amount_from'
-            elif key == 'transaction_amount_to':
-                transaction_amount_to = float(value)
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.transaction_amount <= $transaction_amount_to'
-            elif key == 'valid_from':
-                valid_from = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_from >= $valid_from'
-            elif key == 'valid_to':
-                valid_to = value
-                if query_r:
-                    query_r += ' AND '
-                query_r += 'r.valid_to <= $valid_to'
-            elif key == 'order_by':
-                if value == 'valid_from' or value == 'valid_to' or value == 'transaction_amount':
-                    order_by = value
-            elif key == 'order_direction':
-                if value == 'asc' or value == 'desc':
-                    order_direction = value.upper()
-
-        if query_r_connection_type:
-            query_r_exists = False
-            if query_r:
-                query_r_exists = True
-                query_r += ' AND '
-            query_r += '(' + query_r_connection_type + ')'
-            if query_r_exists:
-                query_r = '(' + query_r + ')'
-
-        query = 'MATCH (entity_a:node)-[r1:relationship]->(r:relationship)-[r2:relationship]->(entity_b:node)'
-        query += ' WHERE ((entity_a.public_id = $pk1 AND entity_b.public_id = $pk2) OR (entity_a.public_id = $pk2 AND entity_b.public_id = $pk1))'
-        if query_r:
-            query += ' AND ' + query_r
-        query_total = query + ' RETURN COUNT(DISTINCT r) AS TOTAL'
-        query += ' RETURN DISTINCT entity_a, entity_b, r'
+        return Response({'total': total, 'results': results})
 
-        if order_by is not None:
-            query += ' ORDER BY r.' + order_by + ' ' + order_direction
 
-        limit = limit if int(limit) <= 100 else '100'
+class PathsGraphView(APIView):
+    if coreapi is not None and coreschema is not None:
+        schema = AutoSchema(
+            manual_fields=[
+                coreapi.Field(
+                    name="connection_type_category",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Connection type category"
+                    ),
+                ),
+                coreapi.Field(
+                    name="connection_type",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Connection type"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_date_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction date (from)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_date_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction date (to)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_amount_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction amount (from)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_amount_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction amount (to)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="valid_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Valid from"
+                    ),
+                ),
+                coreapi.Field(
+                    name="valid_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Valid to"
+                    ),
+                ),
+                coreapi.Field(
+                    name="max_depth",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Max depth"
+                    ),
+                ),
+                coreapi.Field(
+                    name="paths",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Number of shortest paths"
+                    ),
+                ),
+            ],
+        )
 
-        query += ' SKIP $offset LIMIT $limit'
+    def post(self, request, pk1, pk2, format=None):
+        if pk1 == pk2:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        try:
+            max_depth = int(request.POST.get('max_depth', const.GRAPH_PATHS_MAX_DEPTH_K_PATHS))
+            paths = int(request.POST.get('paths', 1))
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        paths = max(1, min(paths, const.GRAPH_PATHS_MAX_PATHS))
+        max_depth = max(1, min(max_depth, const.GRAPH_PATHS_MAX_DEPTH if paths == 1 else
+                               const.GRAPH_PATHS_MAX_DEPTH_K_PATHS))
+        filters = cypher.ConnectionFilters(request.POST)
 
-        results = []
-        total = 0
+        ret = {'timed_out': False, 'paths': [], 'nodes': [], 'edges': []}
         if Neo4jDB.is_neo4j_settings_exists():
             neo4j = Neo4jDB.get_db().get_neo4j()
             with neo4j.session() as session:
-                results = session.run(query, pk1=pk1, pk2=pk2, connection_types=connection_types,
-                                      connection_type_categories=connection_type_categories,
-                                      transaction_date_from=transaction_date_from,
-                                      transaction_date_to=transaction_date_to,
-                                      transaction_amount_from=transaction_amount_from,
-                                      transaction_amount_to=transaction_amount_to, valid_from=valid_from,
-                                      valid_to=valid_to, offset=int(offset), limit=int(limit))
-                total = session.run(query_total, pk1=pk1, pk2=pk2, connection_types=connection_types,
-                                    connection_type_categories=connection_type_categories,
-                                    transaction_date_from=transaction_date_from,
-                                    transaction_date_to=transaction_date_to,
-                                    transaction_amount_from=transaction_amount_from,
-                                    transaction_amount_to=transaction_amount_to, valid_from=valid_from,
-                                    valid_to=valid_to).single()
+                ret = cypher.run_paths(session, filters=filters, pk1=pk1, pk2=pk2, max_depth=max_depth, paths=paths)
 
-        return Response({'total': total, 'results': results})
+        if ret['timed_out']:
+            return Response(ret, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        return Response(ret)
+
+
+class EgoNetworkGraphView(APIView):
+    if coreapi is not None and coreschema is not None:
+        schema = AutoSchema(
+            manual_fields=[
+                coreapi.Field(
+                    name="connection_type_category",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Connection type category"
+                    ),
+                ),
+                coreapi.Field(
+                    name="connection_type",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Connection type"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_date_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction date (from)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_date_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction date (to)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_amount_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction amount (from)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="transaction_amount_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Transaction amount (to)"
+                    ),
+                ),
+                coreapi.Field(
+                    name="valid_from",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Valid from"
+                    ),
+                ),
+                coreapi.Field(
+                    name="valid_to",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="Valid to"
+                    ),
+                ),
+                coreapi.Field(
+                    name="depth",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Depth"
+                    ),
+                ),
+                coreapi.Field(
+                    name="fan_out",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Max connected entities per entity"
+                    ),
+                ),
+                coreapi.Field(
+                    name="max_nodes",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Max entities"
+                    ),
+                ),
+                coreapi.Field(
+                    name="max_edges",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Integer(
+                        title="Max connections"
+                    ),
+                ),
+                coreapi.Field(
+                    name="priority",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Priority",
+                        description="Ordered list of category, pep, recency"
+                    ),
+                ),
+                coreapi.Field(
+                    name="category_order",
+                    required=False,
+                    location='form',
+                    schema=coreschema.Array(
+                        title="Connection type categories by priority"
+                    ),
+                ),
+            ],
+        )
+
+    def post(self, request, pk, format=None):
+        try:
+            depth = int(request.POST.get('depth', 2))
+            fan_out = int(request.POST.get('fan_out', const.GRAPH_EGO_FAN_OUT))
+            max_nodes = int(request.POST.get('max_nodes', const.GRAPH_EGO_MAX_NODES))
+            max_edges = int(request.POST.get('max_edges', const.GRAPH_EGO_MAX_EDGES))
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        depth = max(1, min(depth, const.GRAPH_EGO_MAX_DEPTH))
+        fan_out = max(1, min(fan_out, const.GRAPH_EGO_MAX_FAN_OUT))
+        max_nodes = max(1, min(max_nodes, const.GRAPH_EGO_MAX_NODES_LIMIT))
+        max_edges = max(1, min(max_edges, const.GRAPH_EGO_MAX_EDGES_LIMIT))
+        priority = []
+        for value in request.POST.getlist('priority'):
+            if value not in const.GRAPH_EGO_PRIORITIES:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            if value not in priority:
+                priority.append(value)
+        category_order = request.POST.getlist('category_order')
+        filters = cypher.ConnectionFilters(request.POST)
+
+        ret = None
+        if Neo4jDB.is_neo4j_settings_exists():
+            neo4j = Neo4jDB.get_db().get_neo4j()
+            compact_graph = graph.get_graph() if graph.is_connection_filters_supported(filters) else None
+            with neo4j.session() as session:
+                if compact_graph is not None:
+                    ret = cypher.run_graph_ego_network(session, compact_graph=compact_graph, filters=filters, pk=pk,
+                                                       depth=depth, fan_out=fan_out, max_nodes=max_nodes,
+                                                       max_edges=max_edges, priority=priority,
+                                                       category_order=category_order)
+                else:
+                    ret = cypher.run_ego_network(session, filters=filters, pk=pk, depth=depth, fan_out=fan_out,
+                                                 max_nodes=max_nodes, max_edges=max_edges, priority=priority,
+                                                 category_order=category_order)
+
+        if ret is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if ret['timed_out']:
+            return Response(ret, status=status.HTTP_504_GATEWAY_TIMEOUT)
+        return Response(ret)
 
 
 class ConnectionsCountPerYearByEndView(APIView):
+    @staticmethod
+    def get_year_query(year):
+        from_datetime = datetime.datetime(year, 1, 1, 0, 0, 0)
+        to_datetime = datetime.datetime(year + 1, 1, 1, 0, 0, 0)
+        return {
+            'bool': {
+                'should': [
+                    {
+                        'bool': {
+                            'filter': [
+                                {
+                                    'range': {
+                                        'valid_from': {
+                                            'lt': to_datetime
+                                        }
+                                    }
+                                },
+                                {
+                                    'range': {
+                                        'valid_to': {
+                                            'gte': from_datetime
+                                        }
+                                    }
+                                }
+                            ]
+                        }
+                    },
+                    {
+                        'bool': {
+                            'filter': [
+                                {
+                                    'range': {
+                                        'valid_from': {
+                                            'lt': to_datetime
+                                        }
+                                    }
+                                }
+                            ],
+                            'must_not': {
+                                'exists': {
+                                    'field': 'valid_to'
+                                }
+                            }
+                        }
+                    },
+                    {
+                        'bool': {
+                            'filter': {
+                                'range': {
+                                    'valid_to': {
+                                        'gte': from_datetime,
+                                        'lt': to_datetime
+                                    }
+                                }
+                            },
+                            'must_not': {
+                                'exists': {
+                                    'field': 'valid_from'
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+
     def get(self, request, pk, format=None):
         body = {
             'size': 0,
@@ -2428,113 +2444,55 @@ class ConnectionsCountPerYearByEndView(APIView):
                 else:
                     min_year = max_year
 
-                results = {}
-                for year in range(min_year, max_year + 1):
-                    from_datetime = datetime.datetime(year, 1, 1, 0, 0, 0)
-                    to_datetime = datetime.datetime(year + 1, 1, 1, 0, 0, 0)
-                    body = {
-                        'size': 0,
-                        'query': {
-                            'bool': {
-                                'filter': [
-                                    {
-                                        'bool': {
-                                            'should': [
-                                                {
-                                                    'term': {
-                                                        'entity_a.public_id': pk
-                                                    }
-                                                },
-                                                {
-                                                    'term': {
-                                                        'entity_b.public_id': pk
-                                                    }
-                                                }
-                                            ]
-                                        }
-                                    },
-                                    {
-                                        'bool': {
-                                            'should': [
-                                                {
-                                                    'bool': {
-                                                        'filter': [
-                                                            {
-                                                                'range': {
-                                                                    'valid_from': {
-                                                                        'lt': to_datetime
-                                                                    }
-                                                                }
-                                                            },
-                                                            {
-                                                                'range': {
-                                                                    'valid_to': {
-                                                                        'gte': from_datetime
-                                                                    }
-                                                                }
-                                                            }
-                                                        ]
-                                                    }
-                                                },
-                                                {
-                                                    'bool': {
-                                                        'filter': [
-                                                            {
-                                                                'range': {
-                                                                    'valid_from': {
-                                                                        'lt': to_datetime
-                                                                    }
-                                                                }
-                                                            }
-                                                        ],
-                                                        'must_not': {
-                                                            'exists': {
-                                                                'field': 'valid_to'
-                                                            }
-                                                        }
-                                                    }
-                                                },
-                                                {
-                                                    'bool': {
-                                                        'filter': {
-                                                            'range': {
-                                                                'valid_to': {
-                                                                    'gte': from_datetime,
-                                                                    'lt': to_datetime
-                                                                }
-                                                            }
-                                                        },
-                                                        'must_not': {
-                                                            'exists': {
-                                                                'field': 'valid_from'
-                                                            }
-                                                        }
-                                                    }
-                                                }
-                                            ]
-                                        }
+                body = {
+                    'size': 0,
+                    'query': {
+                        'bool': {
+                            'should': [
+                                {
+                                    'term': {
+                                        'entity_a.public_id': pk
+                                    }
+                                },
+                                {
+                                    'term': {
+                                        'entity_b.public_id': pk
+                                    }
+                                }
+                            ]
+                        }
+                    },
+                    'aggs': {
+                        'years': {
+                            'filters': {
+                                'filters': {
+                                    str(year): ConnectionsCountPerYearByEndView.get_year_query(year) for year in
+                                    range(min_year, max_year + 1)
+                                }
+                            },
+                            'aggs': {
+                                'connection_type_category': {
+                                    'terms': {
+                                        'field': 'connection_type_category.string_id',
+                                        'size': const.ELASTICSEARCH_MAX_RESULT_WINDOWS
                                     }
-                                ]
-                            }
-                        },
-                        'aggs': {
-                            'connection_type_category': {
-                                'terms': {
-                                    'field': 'connection_type_category.string_id',
-                                    'size': const.ELASTICSEARCH_MAX_RESULT_WINDOWS
                                 }
                             }
                         }
                     }
-                    results_raw = es.search(
-                        index=ElasticsearchDB.get_elasticsearch_index_name(
-                            const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
-                        doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body=body)
+                }
+                results_raw = es.search(
+                    index=ElasticsearchDB.get_elasticsearch_index_name(
+                        const.ELASTICSEARCH_CONNECTIONS_INDEX_NAME),
+                    doc_type=ElasticsearchDB.get_elasticsearch_doc_type(), body=body)
+
+                results = {}
+                for year in range(min_year, max_year + 1):
+                    bucket = results_raw['aggregations']['years']['buckets'][str(year)]
                     results.update({
                         year: {
-                            'total': results_raw['hits']['total'],
-                            'per_connection_type_category': results_raw['aggregations']['connection_type_category'][
-                                'buckets']
+                            'total': bucket['doc_count'],
+                            'per_connection_type_category': bucket['connection_type_category']['buckets']
                         }
                     })
                 ret.update({